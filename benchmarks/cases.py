@@ -0,0 +1,250 @@
+"""基准测试用例
+
+每个用例返回 {名称: 单次操作耗时(秒)}，名称中包含数据规模，便于与基线逐项比较。
+所有用例使用临时数据库，不会读写 ~/.wg_manager。
+"""
+
+import base64
+import ipaddress
+import os
+import shutil
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from wg_manager import crypto
+from wg_manager.database import Database
+from wg_manager.manager import WireGuardManager
+from wg_manager.models import Peer, ServerConfig
+
+
+def fake_key() -> str:
+    """随机生成格式正确的 WireGuard 密钥 (32 字节 base64)"""
+    return base64.b64encode(os.urandom(32)).decode()
+
+
+def measure(func: Callable[[], object], repeat: int = 5) -> float:
+    """多次执行取中位数 (秒)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def make_peer(server_id: int, i: int) -> Peer:
+    return Peer(
+        id=None,
+        server_id=server_id,
+        name=f"peer-{i}",
+        public_key=fake_key(),
+        private_key=fake_key(),
+        preshared_key=fake_key(),
+        address=f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}/32",
+        allowed_ips="10.0.0.0/8",
+        listen_port=10000 + i % 50000,
+        created_at=datetime(2024, 1, 1).isoformat()
+    )
+
+
+def populate(workdir: Path, peers: int) -> tuple[Database, ServerConfig]:
+    """创建带有 peers 个客户端的临时数据库
+
+    通过 Database.add_peers 批量插入（单个事务），与正式写入路径一致，
+    地址的数值编码列同样被填充。
+    """
+    db = Database(workdir / f"bench-{peers}.db")
+    server = db.save_server(ServerConfig(
+        private_key=fake_key(), public_key=fake_key(), address="10.0.0.1/8",
+        endpoint="bench.example.com"
+    ))
+    db.add_peers([make_peer(server.id, i + 2) for i in range(peers)])
+    return db, server
+
+
+# ========== 用例 ==========
+
+def bench_keygen(workdir: Path, sizes: list[int]) -> dict[str, float]:
+    """generate_keypair 吞吐（需要 wg 命令）"""
+    if not shutil.which("wg"):
+        return {}
+    return {"keygen.generate_keypair": measure(crypto.generate_keypair, repeat=20)}
+
+
+def bench_database(workdir: Path, sizes: list[int]) -> dict[str, float]:
+    """Database.add_peer / get_peers / get_peer_by_name"""
+    results = {}
+    for n in sizes:
+        db, server = populate(workdir, n)
+        counter = iter(range(n + 10, n + 10_000_000))
+
+        def add_one():
+            db.add_peer(make_peer(server.id, next(counter)))
+
+        results[f"db.add_peer@{n}"] = measure(add_one, repeat=50)
+        results[f"db.get_peers@{n}"] = measure(lambda: db.get_peers(server.id))
+        results[f"db.get_peer_by_name@{n}"] = measure(
+            lambda: db.get_peer_by_name(f"peer-{n // 2}", server.id), repeat=50
+        )
+    return results
+
+
+def bench_render(workdir: Path, sizes: list[int]) -> dict[str, float]:
+    """get_server_config / get_client_config 渲染"""
+    results = {}
+    for n in sizes:
+        db, server = populate(workdir, n)
+        manager = WireGuardManager(server.id, db=db)
+        results[f"render.server_config@{n}"] = measure(manager.get_server_config)
+        results[f"render.client_config@{n}"] = measure(
+            lambda: manager.get_client_config(f"peer-{n // 2}"), repeat=50
+        )
+    return results
+
+
+def bench_alloc(workdir: Path, sizes: list[int]) -> dict[str, float]:
+    """地址分配与 list 过滤（addr_int / 名称索引上的 SQL 查询）
+
+    populate 的地址连续占满网段开头，查找空位需要越过所有已用地址，是分配的最坏情况。
+    """
+    results = {}
+    for n in sizes:
+        db, server = populate(workdir, n)
+        manager = WireGuardManager(server.id, db=db)
+        results[f"alloc.next_ip@{n}"] = measure(manager._get_next_ip, repeat=20)
+        network = ipaddress.ip_network("10.0.1.0/24")
+        results[f"filter.address@{n}"] = measure(
+            lambda: db.get_peer_summaries(server.id, network=network), repeat=20
+        )
+        results[f"filter.name_prefix@{n}"] = measure(
+            lambda: db.get_peer_summaries(server.id, name_glob="peer-1*"), repeat=20
+        )
+    return results
+
+
+def generate_server_config(peers: int) -> str:
+    """生成包含 peers 个 [Peer] 的服务端配置"""
+    parts = [f"[Interface]\nPrivateKey = {fake_key()}\nAddress = 10.0.0.1/8\nListenPort = 51820\n"]
+    for i in range(peers):
+        parts.append(
+            f"\n[Peer]\n# peer-{i}\nPublicKey = {fake_key()}\nPresharedKey = {fake_key()}\n"
+            f"AllowedIPs = 10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}/32\n"
+        )
+    return "".join(parts)
+
+
+def bench_parse(workdir: Path, sizes: list[int]) -> dict[str, float]:
+    """_parse_and_import_config 解析大型配置
+
+    公钥推导替换为固定值，只测量解析本身（不依赖 wg 命令）。
+    """
+    results = {}
+    original = crypto.generate_public_key
+    crypto.generate_public_key = lambda private_key: fake_key()
+    try:
+        for n in sizes:
+            db = Database(workdir / f"parse-{n}.db")
+            manager = WireGuardManager(db=db)
+            content = generate_server_config(n)
+            results[f"parse.import_config@{n}"] = measure(
+                lambda: manager._parse_and_import_config(content, "bench.example.com", "wg0"),
+                repeat=3
+            )
+    finally:
+        crypto.generate_public_key = original
+    return results
+
+
+class RecordingSSHClient:
+    """SSH 替身：不执行任何命令，只记录调用，用于测量本地同步开销"""
+
+    wg_dir = "/etc/wireguard"
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes_sent = 0
+
+    def _record(self, payload: str) -> tuple[bool, str]:
+        self.calls += 1
+        self.bytes_sent += len(payload)
+        return True, ""
+
+    def run_command(self, command: str) -> tuple[bool, str]:
+        return self._record(command)
+
+    def run_script(self, script: str, timeout: int = 60) -> tuple[bool, str]:
+        return self._record(script)
+
+    def write_remote_file(self, remote_path: str, content: str) -> tuple[bool, str]:
+        return self._record(content)
+
+    def read_remote_file(self, remote_path: str) -> tuple[bool, str]:
+        return self._record(remote_path)
+
+
+def attach_remote(manager: WireGuardManager, client) -> None:
+    """为 manager 挂接指定的远程客户端"""
+    from wg_manager.ssh import RemoteWireGuard
+
+    manager._ssh_client = client
+    manager._remote_wg = RemoteWireGuard(client, manager.server.interface)
+
+
+def bench_sync(workdir: Path, sizes: list[int]) -> dict[str, float]:
+    """_sync_to_remote 全量同步与批量 apply（本地 SSH 替身）"""
+    results = {}
+    for n in sizes:
+        db, server = populate(workdir, n)
+        manager = WireGuardManager(server.id, db=db)
+        attach_remote(manager, RecordingSSHClient())
+        results[f"sync.full@{n}"] = measure(manager._sync_to_remote)
+
+        peers = manager.peers[: min(n, 1000)]
+        results[f"sync.batch_apply@{n}"] = measure(
+            lambda: manager._sync_changes_to_remote(upserts=peers)
+        )
+    return results
+
+
+# loopback 用例中每次远程调用注入的延迟（秒），模拟网络往返
+LATENCY = 0.02
+
+
+def bench_loopback(workdir: Path, sizes: list[int]) -> dict[str, float]:
+    """经由本地模拟主机的端到端同步，对比批量 apply 与逐个 wg set 的往返开销"""
+    from .localhost import LocalHost
+
+    results = {}
+    for n in sizes:
+        db, server = populate(workdir, n)
+        manager = WireGuardManager(server.id, db=db)
+        host_dir = workdir / f"host-{n}"
+        shutil.rmtree(host_dir, ignore_errors=True)
+        host = LocalHost(host_dir, latency=LATENCY)
+        attach_remote(manager, host)
+        results[f"loopback.full@{n}"] = measure(manager._sync_to_remote, repeat=3)
+
+        peers = manager.peers[:100]
+        results[f"loopback.batch_apply@{n}"] = measure(
+            lambda: manager._sync_changes_to_remote(upserts=peers), repeat=3
+        )
+
+        def per_peer():
+            for peer in peers[:10]:
+                manager._remote_wg.add_peer_live(peer.public_key, peer.address)
+        results[f"loopback.per_peer_x10@{n}"] = measure(per_peer, repeat=3)
+    return results
+
+
+CASES: dict[str, Callable[[Path, list[int]], dict[str, float]]] = {
+    "keygen": bench_keygen,
+    "db": bench_database,
+    "render": bench_render,
+    "alloc": bench_alloc,
+    "parse": bench_parse,
+    "sync": bench_sync,
+    "loopback": bench_loopback,
+}
@@ -0,0 +1,316 @@
+"""本地模拟的 wg / wg-quick / systemctl / ip 命令
+
+供 LocalHost 在临时目录中模拟远程 WireGuard 主机，用于无服务器的可重复压测。
+只依赖标准库，可直接作为脚本执行:
+
+    python fakewg.py <wg|wg-quick|systemctl|ip> [参数...]
+
+状态保存在 $FAKE_WG_ROOT/state/<interface>.json，配置文件位于
+$FAKE_WG_ROOT/etc/wireguard。密钥推导不是真实的 Curve25519，仅保证格式正确。
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# wg-quick strip 会去掉的字段
+WG_QUICK_KEYS = {"address", "dns", "mtu", "table", "preup", "postup",
+                 "predown", "postdown", "saveconfig"}
+
+
+def _root() -> Path:
+    return Path(os.environ["FAKE_WG_ROOT"])
+
+
+def config_path(interface: str) -> Path:
+    return _root() / "etc" / "wireguard" / f"{interface}.conf"
+
+
+def _state_path(interface: str) -> Path:
+    return _root() / "state" / f"{interface}.json"
+
+
+def load_state(interface: str) -> dict:
+    path = _state_path(interface)
+    if path.exists():
+        return json.loads(path.read_text())
+    return {"up": False, "private_key": "", "listen_port": 0, "peers": {}}
+
+
+def save_state(interface: str, state: dict):
+    path = _state_path(interface)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state))
+    tmp.replace(path)
+
+
+def fake_public_key(private_key: str) -> str:
+    """由私钥确定性地推导一个格式正确的公钥（非真实算法）"""
+    return base64.b64encode(hashlib.sha256(private_key.encode()).digest()).decode()
+
+
+def parse_config(text: str) -> tuple[dict, list[dict]]:
+    """解析 WireGuard 配置，返回 ([Interface] 字段, [Peer] 字段列表)，键名小写"""
+    interface: dict = {}
+    peers: list[dict] = []
+    section = None
+    for raw in text.splitlines():
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("["):
+            section = line.lower()
+            if section == "[peer]":
+                peers.append({})
+            continue
+        key, _, value = line.partition("=")
+        key, value = key.strip().lower(), value.strip()
+        if section == "[interface]":
+            interface[key] = value
+        elif section == "[peer]":
+            peers[-1][key] = value
+    return interface, peers
+
+
+def strip_config(text: str) -> str:
+    """等价于 wg-quick strip：去掉 wg-quick 专用字段"""
+    lines = []
+    for raw in text.splitlines():
+        key = raw.split("=", 1)[0].strip().lower()
+        if "=" in raw and key in WG_QUICK_KEYS:
+            continue
+        lines.append(raw)
+    return "\n".join(lines) + "\n"
+
+
+def _apply_config(state: dict, text: str):
+    """按配置重建 peer 集合，保留已有 peer 的握手和流量统计"""
+    interface, peers = parse_config(text)
+    state["private_key"] = interface.get("privatekey", state["private_key"])
+    state["listen_port"] = int(interface.get("listenport", state["listen_port"] or 0))
+    old = state["peers"]
+    new = {}
+    for peer in peers:
+        key = peer.get("publickey")
+        if not key:
+            continue
+        entry = old.get(key, {"latest_handshake": 0, "rx": 0, "tx": 0, "endpoint": ""})
+        entry["preshared_key"] = peer.get("presharedkey", "")
+        entry["allowed_ips"] = peer.get("allowedips", "").replace(" ", "")
+        entry["endpoint"] = peer.get("endpoint", entry.get("endpoint", ""))
+        new[key] = entry
+    state["peers"] = new
+
+
+def _interfaces() -> list[str]:
+    state_dir = _root() / "state"
+    if not state_dir.exists():
+        return []
+    return sorted(p.stem for p in state_dir.glob("*.json") if load_state(p.stem)["up"])
+
+
+def _dump_lines(interface: str, prefix: bool) -> list[str]:
+    state = load_state(interface)
+    head = f"{interface}\t" if prefix else ""
+    lines = [f"{head}{state['private_key'] or '(none)'}\t"
+             f"{fake_public_key(state['private_key']) if state['private_key'] else '(none)'}\t"
+             f"{state['listen_port']}\toff"]
+    for key, peer in state["peers"].items():
+        lines.append("\t".join([
+            f"{head}{key}",
+            peer.get("preshared_key") or "(none)",
+            peer.get("endpoint") or "(none)",
+            peer.get("allowed_ips") or "(none)",
+            str(peer.get("latest_handshake", 0)),
+            str(peer.get("rx", 0)),
+            str(peer.get("tx", 0)),
+            "off",
+        ]))
+    return lines
+
+
+def _show_text(interface: str) -> list[str]:
+    state = load_state(interface)
+    lines = [f"interface: {interface}"]
+    if state["private_key"]:
+        lines.append(f"  public key: {fake_public_key(state['private_key'])}")
+        lines.append("  private key: (hidden)")
+    lines.append(f"  listening port: {state['listen_port']}")
+    now = int(time.time())
+    for key, peer in state["peers"].items():
+        lines.append("")
+        lines.append(f"peer: {key}")
+        if peer.get("preshared_key"):
+            lines.append("  preshared key: (hidden)")
+        if peer.get("endpoint"):
+            lines.append(f"  endpoint: {peer['endpoint']}")
+        lines.append(f"  allowed ips: {peer.get('allowed_ips') or '(none)'}")
+        if peer.get("latest_handshake"):
+            lines.append(f"  latest handshake: {now - peer['latest_handshake']} seconds ago")
+            lines.append(f"  transfer: {peer.get('rx', 0)} B received, {peer.get('tx', 0)} B sent")
+    return lines
+
+
+def _fail(message: str) -> int:
+    print(message, file=sys.stderr)
+    return 1
+
+
+# ========== 命令 ==========
+
+def cmd_wg(args: list[str]) -> int:
+    if not args or args[0] == "show":
+        target = args[1] if len(args) > 1 else "all"
+        mode = args[2] if len(args) > 2 else ""
+        interfaces = _interfaces() if target == "all" else [target]
+        if target != "all" and not load_state(target)["up"]:
+            return _fail(f"Unable to access interface {target}: No such device")
+        out = []
+        for interface in interfaces:
+            if mode == "dump":
+                out.extend(_dump_lines(interface, prefix=target == "all"))
+            elif mode == "peers":
+                out.extend(load_state(interface)["peers"])
+            else:
+                out.extend(_show_text(interface))
+                out.append("")
+        print("\n".join(out).rstrip("\n"))
+        return 0
+
+    if args[0] in ("genkey", "genpsk"):
+        print(base64.b64encode(os.urandom(32)).decode())
+        return 0
+
+    if args[0] == "pubkey":
+        print(fake_public_key(sys.stdin.read().strip()))
+        return 0
+
+    if args[0] == "set":
+        return _wg_set(args[1], args[2:])
+
+    if args[0] == "syncconf":
+        state = load_state(args[1])
+        if not state["up"]:
+            return _fail("Unable to modify interface: No such device")
+        _apply_config(state, Path(args[2]).read_text())
+        save_state(args[1], state)
+        return 0
+
+    return _fail(f"fakewg: 不支持的命令: wg {' '.join(args)}")
+
+
+def _wg_set(interface: str, args: list[str]) -> int:
+    state = load_state(interface)
+    if not state["up"]:
+        return _fail("Unable to modify interface: No such device")
+    peer = None
+    i = 0
+    while i < len(args):
+        token = args[i]
+        value = args[i + 1] if i + 1 < len(args) else ""
+        if token == "peer":
+            peer = state["peers"].setdefault(value, {
+                "preshared_key": "", "allowed_ips": "", "endpoint": "",
+                "latest_handshake": 0, "rx": 0, "tx": 0
+            })
+            current_key = value
+            i += 2
+        elif token == "remove" and peer is not None:
+            state["peers"].pop(current_key, None)
+            peer = None
+            i += 1
+        elif token == "private-key":
+            state["private_key"] = Path(value).read_text().strip()
+            i += 2
+        elif token == "listen-port":
+            state["listen_port"] = int(value)
+            i += 2
+        elif token == "preshared-key" and peer is not None:
+            peer["preshared_key"] = Path(value).read_text().strip()
+            i += 2
+        elif token == "allowed-ips" and peer is not None:
+            peer["allowed_ips"] = value.replace(" ", "")
+            i += 2
+        elif token == "endpoint" and peer is not None:
+            peer["endpoint"] = value
+            i += 2
+        elif token in ("persistent-keepalive", "fwmark"):
+            i += 2
+        else:
+            return _fail(f"Invalid argument: {token}")
+    save_state(interface, state)
+    return 0
+
+
+def cmd_wg_quick(args: list[str]) -> int:
+    if len(args) == 2 and args[0] == "strip":
+        path = config_path(args[1])
+        if not path.exists():
+            return _fail(f"wg-quick: `{path}' does not exist")
+        sys.stdout.write(strip_config(path.read_text()))
+        return 0
+    if len(args) == 2 and args[0] in ("up", "down"):
+        return _set_up(args[1], args[0] == "up")
+    return _fail(f"fakewg: 不支持的命令: wg-quick {' '.join(args)}")
+
+
+def _set_up(interface: str, up: bool) -> int:
+    state = load_state(interface)
+    if up:
+        path = config_path(interface)
+        if not path.exists():
+            return _fail(f"wg-quick: `{path}' does not exist")
+        _apply_config(state, path.read_text())
+    state["up"] = up
+    save_state(interface, state)
+    return 0
+
+
+def cmd_systemctl(args: list[str]) -> int:
+    if len(args) != 2 or not args[1].startswith("wg-quick@"):
+        return _fail(f"fakewg: 不支持的命令: systemctl {' '.join(args)}")
+    action, interface = args[0], args[1].split("@", 1)[1]
+    if action in ("start", "restart"):
+        return _set_up(interface, True)
+    if action == "stop":
+        return _set_up(interface, False)
+    if action == "enable":
+        return 0
+    if action == "is-active":
+        active = load_state(interface)["up"]
+        print("active" if active else "inactive")
+        return 0 if active else 3
+    return _fail(f"fakewg: 不支持的命令: systemctl {' '.join(args)}")
+
+
+def cmd_ip(args: list[str]) -> int:
+    if len(args) >= 3 and args[:2] == ["link", "show"]:
+        interface = args[2]
+        if load_state(interface)["up"]:
+            print(f"1: {interface}: <POINTOPOINT,NOARP,UP,LOWER_UP> mtu 1420 state UNKNOWN")
+            return 0
+        return _fail(f'Device "{interface}" does not exist.')
+    return _fail(f"fakewg: 不支持的命令: ip {' '.join(args)}")
+
+
+TOOLS = {
+    "wg": cmd_wg,
+    "wg-quick": cmd_wg_quick,
+    "systemctl": cmd_systemctl,
+    "ip": cmd_ip,
+}
+
+
+def main(argv: list[str]) -> int:
+    if not argv or argv[0] not in TOOLS:
+        return _fail(f"用法: fakewg.py <{'|'.join(TOOLS)}> [参数...]")
+    return TOOLS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
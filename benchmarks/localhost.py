@@ -0,0 +1,108 @@
+"""本地模拟远程主机
+
+LocalHost 与 SSHClient 接口一致，但在本机临时目录中执行命令：`wg`、`wg-quick`、
+`systemctl`、`ip` 由 fakewg.py 模拟，`/etc/wireguard` 映射到 <root>/etc/wireguard。
+可注入固定延迟模拟网络往返，用于无服务器的同步策略压测:
+
+    host = LocalHost(Path("/tmp/fake-host"), latency=0.02)
+    manager.db.save_ssh_config(server_id, "local:/tmp/fake-host?latency=0.02")
+
+仅用于开发和压测，不随 wg_manager 发布：只有设置 WG_MANAGER_FAKE_HOSTS=1 且在源码目录中
+运行时，SSH 主机 "local:<目录>" 才会使用本模块（见 wg_manager.ssh.connect）。
+"""
+
+import os
+import shlex
+import sys
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+
+from wg_manager.ssh import SSHClient, SSHConfig
+
+from . import fakewg
+
+
+class LocalHost(SSHClient):
+    """在本地模拟远程 WireGuard 主机的客户端"""
+
+    def __init__(self, root: Path, latency: float = 0.0):
+        super().__init__(SSHConfig(host=f"local:{root}"))
+        self.root = Path(root).resolve()
+        self.latency = latency
+        self.wg_dir = str(self.root / "etc" / "wireguard")
+        self._setup()
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "LocalHost":
+        """从 "local:<目录>[?latency=秒]" 创建"""
+        path, _, query = spec[len("local:"):].partition("?")
+        latency = float(parse_qs(query).get("latency", ["0"])[0])
+        return cls(Path(path), latency)
+
+    def _setup(self):
+        """创建目录结构和模拟命令"""
+        bin_dir = self.root / "bin"
+        bin_dir.mkdir(parents=True, exist_ok=True)
+        Path(self.wg_dir).mkdir(parents=True, exist_ok=True)
+        (self.root / "state").mkdir(exist_ok=True)
+        for tool in fakewg.TOOLS:
+            wrapper = bin_dir / tool
+            wrapper.write_text(
+                "#!/bin/sh\n"
+                f"exec {shlex.quote(sys.executable)} -S {shlex.quote(fakewg.__file__)} {tool} \"$@\"\n"
+            )
+            wrapper.chmod(0o755)
+
+    def _prelude(self) -> str:
+        """每次调用前执行：设置环境变量，并模拟网络延迟"""
+        prelude = (
+            f"FAKE_WG_ROOT={shlex.quote(str(self.root))}; export FAKE_WG_ROOT; "
+            f"PATH={shlex.quote(str(self.root / 'bin'))}:$PATH; export PATH; "
+        )
+        if self.latency:
+            prelude += f"sleep {self.latency}; "
+        return prelude
+
+    def _build_ssh_cmd(self, extra_args: list[str] = None) -> list[str]:
+        # 与 ssh 一致：多个参数以空格拼接后交给 shell 执行
+        command = " ".join(extra_args) if extra_args else "true"
+        return ["sh", "-c", self._prelude() + command]
+
+    def _build_scp_cmd(self, local_path: str, remote_path: str, upload: bool = True) -> list[str]:
+        src, dst = (local_path, remote_path) if upload else (remote_path, local_path)
+        return ["sh", "-c", self._prelude() + f"cp {shlex.quote(src)} {shlex.quote(dst)}"]
+
+    def close(self):
+        pass
+
+    # ========== 模拟状态 ==========
+
+    def get_state(self, interface: str) -> dict:
+        """读取模拟接口的运行状态"""
+        return self._with_root(fakewg.load_state, interface)
+
+    def simulate_handshake(self, interface: str, public_key: str, timestamp: int,
+                           rx: int = 0, tx: int = 0, endpoint: Optional[str] = None):
+        """模拟 peer 握手和流量，用于测试 prune 等依赖握手时间的功能"""
+        def update(interface: str):
+            state = fakewg.load_state(interface)
+            peer = state["peers"][public_key]
+            peer["latest_handshake"] = timestamp
+            peer["rx"] += rx
+            peer["tx"] += tx
+            if endpoint is not None:
+                peer["endpoint"] = endpoint
+            fakewg.save_state(interface, state)
+        self._with_root(update, interface)
+
+    def _with_root(self, func, *args):
+        previous = os.environ.get("FAKE_WG_ROOT")
+        os.environ["FAKE_WG_ROOT"] = str(self.root)
+        try:
+            return func(*args)
+        finally:
+            if previous is None:
+                del os.environ["FAKE_WG_ROOT"]
+            else:
+                os.environ["FAKE_WG_ROOT"] = previous
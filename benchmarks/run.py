@@ -0,0 +1,120 @@
+"""运行基准测试并与基线比较
+
+    python -m benchmarks.run                               # 运行全部用例
+    python -m benchmarks.run --only db,render --sizes 1000
+    python -m benchmarks.run --output results.json         # 保存结果
+    python -m benchmarks.run --save-baseline               # 保存为基线
+    python -m benchmarks.run --threshold 0.25              # 与基线比较，变慢超过 25% 时失败
+    python -m benchmarks.run --require-baseline            # 基线不存在时失败（CI 使用）
+    python -m benchmarks.run --only loopback --latency 0.05  # 模拟 50ms 网络往返
+
+基线与机器相关，请在同一台机器（或同一 CI 规格）上生成和比较。
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from wg_manager.config import FAKE_HOSTS_ENV
+
+from . import cases
+from .cases import CASES
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def run(names: list[str], sizes: list[int]) -> dict[str, float]:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="wg-manager-bench-") as tmp:
+        for name in names:
+            case_results = CASES[name](Path(tmp), sizes)
+            if not case_results:
+                print(f"  {name}: 跳过", file=sys.stderr)
+            for key, seconds in case_results.items():
+                print(f"  {key:<32} {seconds * 1000:>10.3f} ms", file=sys.stderr)
+            results.update(case_results)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float],
+            threshold: float) -> list[str]:
+    """返回超出阈值的回归项"""
+    regressions = []
+    for key, seconds in sorted(results.items()):
+        if key not in baseline or baseline[key] <= 0:
+            continue
+        ratio = seconds / baseline[key]
+        mark = "✗" if ratio > 1 + threshold else " "
+        print(f"{mark} {key:<32} {baseline[key] * 1000:>10.3f} → {seconds * 1000:>10.3f} ms"
+              f"  ({ratio - 1:+.0%})")
+        if ratio > 1 + threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="wg-manager 基准测试")
+    parser.add_argument("--only", help=f"只运行指定用例，逗号分隔 ({', '.join(CASES)})")
+    parser.add_argument("--sizes", default="1000,10000", help="数据规模，逗号分隔 (默认 1000,10000)")
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="基线文件")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="允许的变慢比例，超过则失败 (默认 0.25)")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="基线文件不存在时失败，而不是跳过比较")
+    parser.add_argument("--latency", type=float, default=cases.LATENCY,
+                        help=f"loopback 用例每次远程调用的模拟延迟，秒 (默认 {cases.LATENCY})")
+    args = parser.parse_args()
+    cases.LATENCY = args.latency
+    # 用例中的 local:<目录> 主机使用 benchmarks/localhost.py 模拟
+    os.environ[FAKE_HOSTS_ENV] = "1"
+
+    names = args.only.split(",") if args.only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"未知用例: {', '.join(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    results = run(names, sizes)
+    document = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "latency": args.latency,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(document, indent=2) + "\n")
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(document, indent=2) + "\n")
+        print(f"基线已保存: {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        if args.require_baseline:
+            print(f"未找到基线 {baseline_path} (使用 --save-baseline 生成)", file=sys.stderr)
+            return 2
+        print(f"未找到基线 {baseline_path}，跳过比较 (使用 --save-baseline 生成)")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} 项超出 {args.threshold:.0%} 阈值", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""CLI 启动耗时基准（回归检查）
+
+检查内容:
+  1. `import wg_manager.cli` 的累计导入耗时（python -X importtime）
+  2. 导入 CLI 时不加载 manager/ssh/crypto/database 等重模块
+  3. list/show/servers 命令的墙钟耗时（中位数）
+  4. 只读命令不修改数据库文件
+
+超出预算时以非零状态退出，可直接用于 CI:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --import-budget-ms 80 --command-budget-ms 500
+"""
+
+import argparse
+import hashlib
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# 导入 CLI 时不应加载的模块
+LAZY_MODULES = ["wg_manager.manager", "wg_manager.ssh", "wg_manager.crypto", "wg_manager.database"]
+
+COMMANDS = [["list"], ["show"], ["servers"]]
+
+
+def _env(home: Path) -> dict:
+    env = dict(os.environ)
+    env["HOME"] = str(home)
+    env["PYTHONPATH"] = str(REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def seed_database(home: Path, peers: int) -> Path:
+    """在临时 HOME 下创建带有 peers 个客户端的数据库"""
+    code = f"""
+import base64, os
+from wg_manager.config import DB_FILE
+from wg_manager.database import Database
+from wg_manager.models import Peer, ServerConfig
+
+key = lambda: base64.b64encode(os.urandom(32)).decode()
+db = Database(DB_FILE)
+server = db.save_server(ServerConfig(private_key=key(), public_key=key(), endpoint="bench.example.com"))
+for i in range({peers}):
+    db.add_peer(Peer(id=None, server_id=server.id, name=f"peer-{{i}}", public_key=key(),
+                     private_key=key(), preshared_key=key(),
+                     address=f"10.0.{{i // 250}}.{{i % 250 + 2}}/32",
+                     created_at="2024-01-01T00:00:00"))
+print(DB_FILE)
+"""
+    result = subprocess.run([sys.executable, "-c", code], env=_env(home),
+                            capture_output=True, text=True, check=True)
+    return Path(result.stdout.strip())
+
+
+def measure_import(home: Path) -> tuple[float, list[str]]:
+    """返回 wg_manager.cli 累计导入耗时 (ms) 和被提前加载的重模块"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import wg_manager.cli"],
+        env=_env(home), capture_output=True, text=True, check=True
+    )
+    cumulative_us = 0
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        loaded.add(name)
+        if name == "wg_manager.cli":
+            cumulative_us = int(fields[1])
+    return cumulative_us / 1000, [m for m in LAZY_MODULES if m in loaded]
+
+
+def measure_command(home: Path, args: list[str], repeat: int) -> float:
+    """返回命令执行耗时中位数 (ms)"""
+    cmd = [sys.executable, "-c", "from wg_manager.cli import main; main()", *args]
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=_env(home), capture_output=True, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="CLI 启动耗时基准")
+    parser.add_argument("--peers", type=int, default=500, help="测试数据库中的客户端数")
+    parser.add_argument("--repeat", type=int, default=5, help="每个命令执行次数")
+    parser.add_argument("--import-budget-ms", type=float, default=60.0,
+                        help="import wg_manager.cli 累计耗时预算")
+    parser.add_argument("--command-budget-ms", type=float, default=400.0,
+                        help="单个命令耗时预算（中位数）")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        db_file = seed_database(home, args.peers)
+
+        import_ms, eager = measure_import(home)
+        print(f"import wg_manager.cli: {import_ms:.1f} ms (预算 {args.import_budget_ms:.0f} ms)")
+        if import_ms > args.import_budget_ms:
+            failures.append(f"导入耗时 {import_ms:.1f} ms 超出预算")
+        if eager:
+            failures.append(f"导入 CLI 时提前加载了: {', '.join(eager)}")
+
+        before = _digest(db_file)
+        for command in COMMANDS:
+            elapsed = measure_command(home, command, args.repeat)
+            label = " ".join(command)
+            print(f"{label:<10} {elapsed:8.1f} ms (预算 {args.command_budget_ms:.0f} ms)")
+            if elapsed > args.command_budget_ms:
+                failures.append(f"'{label}' 耗时 {elapsed:.1f} ms 超出预算")
+        if _digest(db_file) != before:
+            failures.append("只读命令修改了数据库文件")
+
+    for failure in failures:
+        print(f"✗ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""测试夹具
+
+远程主机使用 benchmarks/localhost.py 的本地模拟主机 (local:<目录>)，经由正式的
+ssh.connect 路径连接；密钥生成使用同一套模拟的 wg 命令，无需安装 WireGuard。
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from benchmarks.localhost import LocalHost
+from wg_manager.config import FAKE_HOSTS_ENV
+from wg_manager.database import Database
+from wg_manager.manager import WireGuardManager
+
+
+@pytest.fixture
+def host(tmp_path: Path, monkeypatch) -> LocalHost:
+    """模拟的远程主机，其 bin 目录同时提供 wg genkey/pubkey/genpsk"""
+    host = LocalHost(tmp_path / "host")
+    monkeypatch.setenv(FAKE_HOSTS_ENV, "1")
+    monkeypatch.setenv("PATH", f"{host.root / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    return host
+
+
+@pytest.fixture
+def db(tmp_path: Path) -> Database:
+    return Database(tmp_path / "wg_manager.db")
+
+
+@pytest.fixture
+def manager(tmp_path: Path, db: Database, host: LocalHost) -> WireGuardManager:
+    """已初始化服务端 vpn.example.com:wg0 并配置模拟主机的 manager"""
+    manager = WireGuardManager(db=db, ssh_control_dir=tmp_path / "ssh")
+    manager.config_dir = tmp_path
+    manager.export_dir = tmp_path / "clients"
+    manager.init_server("vpn.example.com")
+    db.save_ssh_config(manager.server_id, f"local:{host.root}")
+    yield manager
+    manager.close()
+
@@ -0,0 +1,121 @@
+"""数据库结构迁移"""
+
+import ipaddress
+import sqlite3
+from pathlib import Path
+
+from wg_manager.database import SCHEMA_VERSION, Database
+
+# 最初版本的表结构（没有 user_version，也没有后续添加的列和表）
+BASELINE_SCHEMA = """
+CREATE TABLE server (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    private_key TEXT NOT NULL,
+    public_key TEXT NOT NULL,
+    address TEXT NOT NULL DEFAULT '10.0.0.1/24',
+    listen_port INTEGER NOT NULL DEFAULT 51820,
+    interface TEXT NOT NULL DEFAULT 'wg0',
+    endpoint TEXT NOT NULL,
+    post_up TEXT DEFAULT '',
+    post_down TEXT DEFAULT '',
+    ssh_host TEXT DEFAULT '',
+    ssh_port INTEGER DEFAULT 22,
+    ssh_user TEXT DEFAULT 'root'
+);
+CREATE TABLE peers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    server_id INTEGER NOT NULL DEFAULT 1,
+    name TEXT NOT NULL,
+    public_key TEXT NOT NULL,
+    private_key TEXT DEFAULT '',
+    preshared_key TEXT DEFAULT '',
+    address TEXT NOT NULL,
+    allowed_ips TEXT DEFAULT '',
+    dns TEXT DEFAULT '',
+    listen_port INTEGER DEFAULT 0,
+    mtu INTEGER DEFAULT 1280,
+    created_at TEXT NOT NULL,
+    enabled INTEGER DEFAULT 1,
+    UNIQUE(server_id, name),
+    FOREIGN KEY (server_id) REFERENCES server(id)
+);
+INSERT INTO server (private_key, public_key, address, endpoint, ssh_host)
+    VALUES ('c2VydmVyLXByaXZhdGU=', 'c2VydmVyLXB1YmxpYw==', '10.0.0.1/24', 'vpn.example.com', '');
+INSERT INTO peers (server_id, name, public_key, private_key, address, created_at)
+    VALUES (1, 'phone', 'cGhvbmUtcHVibGlj', 'cGhvbmUtcHJpdmF0ZQ==', '10.0.0.2/32', '2024-01-01T00:00:00');
+INSERT INTO peers (server_id, name, public_key, address, created_at, enabled)
+    VALUES (1, 'legacy', 'bGVnYWN5LXB1YmxpYw==', '10.0.0.3/32, fd00::3/128', '2024-01-02T00:00:00', 0);
+"""
+
+
+def _create_baseline(path: Path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+
+def _columns(path: Path, table: str) -> set[str]:
+    conn = sqlite3.connect(path)
+    try:
+        return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    finally:
+        conn.close()
+
+
+def test_migrate_baseline_to_current(tmp_path):
+    path = tmp_path / "wg_manager.db"
+    _create_baseline(path)
+
+    db = Database(path)
+
+    assert db._schema_version() == SCHEMA_VERSION
+    assert {"version", "exported_version", "exported_generation",
+            "addr_int", "addr_prefix", "addr6", "addr6_prefix"} <= _columns(path, "peers")
+    assert {"sync_deferred", "dirty_since", "dirty_at",
+            "config_generation", "routes"} <= _columns(path, "server")
+
+    server = db.get_first_server()
+    assert server.endpoint == "vpn.example.com"
+    assert server.config_generation == 1
+    assert not db.is_sync_deferred(server.id)
+
+    peers = {p.name: p for p in db.get_peers(server.id)}
+    assert set(peers) == {"phone", "legacy"}
+    assert not peers["legacy"].enabled
+    assert peers["legacy"].private_key == ""
+
+    # 数值编码列由地址文本回填，地址查询可用
+    assert db.find_overlapping_peers(server.id, ipaddress.ip_network("10.0.0.2/32")) == ["phone"]
+    assert db.find_overlapping_peers(server.id, ipaddress.ip_network("fd00::/64")) == ["legacy"]
+
+    # 后续版本添加的表可直接使用
+    assert db.get_journal(server.id) == []
+    assert db.get_topologies() == []
+    assert db.get_shard_policy("vpn.example.com") is None
+
+
+def test_readonly_open_migrates_old_schema(tmp_path):
+    path = tmp_path / "wg_manager.db"
+    _create_baseline(path)
+
+    db = Database(path, readonly=True)
+
+    assert not db.readonly
+    assert db._schema_version() == SCHEMA_VERSION
+    assert Database(path, readonly=True).readonly
+
+
+def test_migration_is_idempotent(tmp_path):
+    path = tmp_path / "wg_manager.db"
+    _create_baseline(path)
+    Database(path)
+
+    # 版本号回退时重新执行迁移，不会重复添加列或丢失数据
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert db._schema_version() == SCHEMA_VERSION
+    assert db.count_peers(1) == 2
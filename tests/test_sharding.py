@@ -0,0 +1,117 @@
+"""按 endpoint 分片：跨分片的添加、删除、启停"""
+
+from argparse import Namespace
+
+import pytest
+
+from wg_manager import cli, sharding
+from wg_manager.daemon import ManagerPool, handle_request
+from wg_manager.routes import server_networks
+
+ENDPOINT = "vpn.example.com"
+
+
+@pytest.fixture
+def sharded(manager):
+    """每个接口最多 2 个客户端"""
+    sharding.set_policy(manager, ENDPOINT, max_peers=2)
+    return manager
+
+
+@pytest.fixture
+def pool(sharded, tmp_path):
+    pool = ManagerPool(sharded.db, tmp_path / "daemon-ssh")
+    pool.root.export_dir = sharded.export_dir
+    yield pool
+    pool.close()
+
+
+def add(manager, name: str):
+    """按分片策略放置并添加客户端，返回 (分片, 客户端)"""
+    shard, _ = sharding.place_peer(manager, name)
+    return shard, manager.server_handle(shard.id).add_peer(name)
+
+
+def remote_keys(host, interface: str) -> set[str]:
+    return set(host.get_state(interface)["peers"])
+
+
+def test_place_peer_creates_shards(sharded):
+    placed = [add(sharded, f"web-{i}")[0] for i in range(5)]
+
+    assert [s.interface for s in placed] == ["wg0", "wg0", "wg1", "wg1", "wg2"]
+    shards = sharding.get_shards(sharded, ENDPOINT)
+    assert [count for _, count in shards] == [2, 2, 1]
+    # 新分片沿用第一个接口的 SSH 配置，地址段互不重叠
+    assert all(sharded.db.get_ssh_config(s.id) for s, _ in shards)
+    networks = [server_networks(s.address)[0] for s, _ in shards]
+    assert not any(a.overlaps(b) for i, a in enumerate(networks) for b in networks[i + 1:])
+
+    with pytest.raises(ValueError, match="已存在"):
+        sharding.place_peer(sharded, "web-3")
+
+
+def test_daemon_remove_toggle_export_across_shards(pool, host):
+    added = {}
+    for i in range(5):
+        response = handle_request(pool, {"op": "add", "server": ENDPOINT, "name": f"web-{i}"})
+        assert response["ok"], response
+        added[f"web-{i}"] = response["result"]
+    shard = pool.db.get_server_by_endpoint_and_interface(ENDPOINT, "wg2")
+    assert pool.db.get_peer_by_name("web-4", shard.id)
+    assert added["web-4"]["public_key"] in remote_keys(host, "wg2")
+
+    response = handle_request(pool, {"op": "toggle", "server": ENDPOINT, "name": "web-4"})
+    assert response == {"ok": True, "result": {"name": "web-4", "enabled": False}}
+    assert not pool.db.get_peer_by_name("web-4", shard.id).enabled
+    assert added["web-4"]["public_key"] not in remote_keys(host, "wg2")
+
+    response = handle_request(pool, {"op": "export", "server": ENDPOINT, "name": "web-2"})
+    assert response["ok"], response
+    assert added["web-2"]["address"].split("/")[0] in response["result"]["config"]
+
+    response = handle_request(pool, {"op": "remove", "server": ENDPOINT, "name": "web-2"})
+    assert response["ok"], response
+    wg1 = pool.db.get_server_by_endpoint_and_interface(ENDPOINT, "wg1")
+    assert pool.db.get_peer_by_name("web-2", wg1.id) is None
+    assert added["web-2"]["public_key"] not in remote_keys(host, "wg1")
+
+    response = handle_request(pool, {"op": "remove", "server": ENDPOINT, "name": "missing"})
+    assert not response["ok"]
+    assert "不存在" in response["error"]
+
+
+def test_cli_batch_toggle_and_remove_across_shards(sharded, host):
+    peers = {name: add(sharded, name) for name in ["web-0", "web-1", "web-2", "db-0", "web-3"]}
+    selectors = Namespace(name=None, names=None, from_file=None, match="web-")
+
+    names = cli._select_peer_names(sharded, selectors)
+    assert sorted(names) == ["web-0", "web-1", "web-2", "web-3"]
+
+    disabled = cli._run_per_shard(sharded, names, lambda group: sharded.toggle_peers(group, False))
+    assert sorted(p.name for p in disabled) == sorted(names)
+    for name in names:
+        shard, peer = peers[name]
+        assert not sharded.db.get_peer_by_name(name, shard.id).enabled
+        assert peer.public_key not in remote_keys(host, shard.interface)
+    db_shard, db_peer = peers["db-0"]
+    assert db_peer.public_key in remote_keys(host, db_shard.interface)
+
+    removed = cli._run_per_shard(sharded, ["web-1", "web-3", "missing"],
+                                 lambda group: sharded.remove_peers(group))
+    assert sorted(p.name for p in removed) == ["web-1", "web-3"]
+    assert sorted(cli._select_peer_names(sharded, selectors)) == ["web-0", "web-2"]
+
+
+def test_switch_to_peer_shard(sharded):
+    for i in range(3):
+        add(sharded, f"web-{i}")
+    base = sharded.server_id
+
+    cli._switch_to_peer_shard(sharded, "web-2")
+    assert sharded.server.interface == "wg1"
+
+    # 找不到时保持当前服务端，由后续操作报告不存在
+    sharded.switch_server(base)
+    cli._switch_to_peer_shard(sharded, "missing")
+    assert sharded.server_id == base
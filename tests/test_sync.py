@@ -0,0 +1,104 @@
+"""远程同步：操作日志重放、密钥轮换"""
+
+import pytest
+
+from benchmarks.localhost import LocalHost
+from wg_manager.manager import WireGuardManager
+
+
+def break_host(host: LocalHost):
+    """让模拟主机上的 ip 和 systemctl 失败，远程下发随之失败（host._setup() 恢复）"""
+    for tool in ("ip", "systemctl"):
+        (host.root / "bin" / tool).write_text("#!/bin/sh\necho 'connection refused' >&2\nexit 1\n")
+
+
+def remote_peers(host: LocalHost, manager: WireGuardManager) -> dict:
+    return host.get_state(manager.server.interface)["peers"]
+
+
+def test_journal_replay_after_failed_apply(manager, host):
+    manager.get_remote_wg()
+    break_host(host)
+
+    phone = manager.add_peer("phone")
+    laptop = manager.add_peer("laptop")
+    manager.toggle_peer("laptop")
+
+    success, msg = manager.last_sync_result
+    assert not success
+    assert "已保留待重试" in msg
+    # 同一公钥只保留最新操作
+    assert manager.pending_remote_ops() == 2
+    assert not host.get_state("wg0")["up"]
+
+    host._setup()
+    success, msg = manager.replay_journal()
+
+    assert success, msg
+    assert manager.pending_remote_ops() == 0
+    peers = remote_peers(host, manager)
+    assert set(peers) == {phone.public_key}
+    assert peers[phone.public_key]["preshared_key"] == phone.preshared_key
+    assert laptop.public_key not in peers
+
+    # 日志已清空，再次重放不会下发
+    assert manager.replay_journal() == (True, "没有待同步的操作")
+
+
+def test_journal_replay_on_running_interface(manager, host):
+    manager.add_peer("phone")
+    assert manager.last_sync_result[0]
+
+    break_host(host)
+    tablet = manager.add_peer("tablet")
+    assert not manager.last_sync_result[0]
+    assert manager.pending_remote_ops() == 1
+
+    host._setup()
+    assert manager.replay_journal()[0]
+    assert manager.replay_journal()[0]
+    assert tablet.public_key in remote_peers(host, manager)
+    assert manager.pending_remote_ops() == 0
+
+
+def test_rotate_psk_skips_imported_peers(manager, host):
+    phone = manager.add_peer("phone")
+    imported = manager.import_existing_peer("router", "cm91dGVyLXB1YmxpYy1rZXktMDAwMDAwMDAwMDA=",
+                                            "10.0.0.200/32", preshared_key="b2xkLXBzaw==")
+    manager.sync_to_remote()
+
+    rotated = manager.rotate_preshared_keys()
+
+    assert [p.name for p in rotated] == ["phone"]
+    manager.reload()
+    peers = {p.name: p for p in manager.peers}
+    assert peers["phone"].preshared_key != phone.preshared_key
+    assert peers["router"].preshared_key == "b2xkLXBzaw=="
+    remote = remote_peers(host, manager)
+    assert remote[phone.public_key]["preshared_key"] == peers["phone"].preshared_key
+    assert remote[imported["public_key"]]["preshared_key"] == "b2xkLXBzaw=="
+
+
+def test_rotate_psk_only_imported_peers(manager):
+    manager.import_existing_peer("router", "cm91dGVyLXB1YmxpYy1rZXktMDAwMDAwMDAwMDA=", "10.0.0.200/32")
+
+    assert manager.rotate_preshared_keys() == []
+
+
+def test_rotate_server_key_keeps_old_key_when_remote_fails(manager, host):
+    manager.add_peer("phone")
+    old = manager.server
+    manager.get_remote_wg()
+    break_host(host)
+
+    with pytest.raises(RuntimeError, match="服务端密钥未更改"):
+        manager.rotate_server_key()
+
+    manager.reload()
+    assert manager.server.private_key == old.private_key
+    assert host.get_state("wg0")["private_key"] == old.private_key
+
+    host._setup()
+    server = manager.rotate_server_key()
+    assert server.private_key != old.private_key
+    assert host.get_state("wg0")["private_key"] == server.private_key
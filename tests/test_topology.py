@@ -0,0 +1,63 @@
+"""站点互联：接口名和端口冲突检查"""
+
+import pytest
+
+from wg_manager import sharding, topology
+
+
+@pytest.fixture
+def second(manager):
+    """第二台主机 edge.example.com:wg0"""
+    base = manager.server_id
+    server = manager.init_server("edge.example.com", address="10.1.0.1/24", port=51821)
+    manager.switch_server(base)
+    return server
+
+
+def test_create_rejects_server_interface_and_port(manager):
+    with pytest.raises(ValueError, match="接口 wg0 已被服务端"):
+        topology.create_topology(manager, "dc", interface="wg0")
+    with pytest.raises(ValueError, match="端口 51820 已被服务端"):
+        topology.create_topology(manager, "dc", listen_port=51820)
+
+
+def test_create_rejects_other_topology_interface_and_port(manager):
+    topology.create_topology(manager, "dc")
+
+    with pytest.raises(ValueError, match="接口 wgm0 已被拓扑 'dc'"):
+        topology.create_topology(manager, "backup", listen_port=51901)
+    with pytest.raises(ValueError, match="端口 51900 已被拓扑 'dc'"):
+        topology.create_topology(manager, "backup", interface="wgm1")
+    assert topology.create_topology(manager, "backup", interface="wgm1", listen_port=51901)
+
+
+def test_join_rejects_interface_added_after_create(manager, second):
+    dc = topology.create_topology(manager, "dc", interface="wg1", network="10.255.0.0/24")
+    # 拓扑创建后 edge 上新增了同名接口
+    manager.init_server("edge.example.com", address="10.1.1.1/24", port=51822, interface="wg1")
+
+    topology.join_topology(manager, dc, manager.db.get_server_by_endpoint("vpn.example.com"))
+    with pytest.raises(ValueError, match="接口 wg1 已被服务端 edge.example.com:wg1"):
+        topology.join_topology(manager, dc, second)
+
+
+def test_join_rejects_port_added_after_create(manager, second):
+    dc = topology.create_topology(manager, "dc")
+    manager.init_server("edge.example.com", address="10.1.1.1/24", port=dc.listen_port,
+                        interface="wg1")
+
+    with pytest.raises(ValueError, match="端口 51900 已被服务端 edge.example.com:wg1"):
+        topology.join_topology(manager, dc, second)
+
+
+def test_create_shard_skips_topology_interface_and_port(manager, monkeypatch):
+    dc = topology.create_topology(manager, "dc", interface="wg1", listen_port=40000)
+    sharding.set_policy(manager, "vpn.example.com", max_peers=1)
+    ports = iter([40000, 51820, 40001])
+    monkeypatch.setattr(sharding, "generate_random_port", lambda: next(ports))
+
+    shard = sharding.create_shard(manager, "vpn.example.com")
+
+    assert shard.interface == "wg2"
+    assert shard.listen_port == 40001
+    assert shard.interface != dc.interface
@@ -2,7 +2,15 @@
 
 __version__ = "0.1.0"
 
-from .manager import WireGuardManager
-from .models import Peer, ServerConfig
+__all__ = ["WireGuardManager", "ServerHandle", "Peer", "ServerConfig"]
 
-__all__ = ["WireGuardManager", "Peer", "ServerConfig"]
+
+def __getattr__(name: str):
+    # 延迟导入，避免 CLI 启动时加载全部模块
+    if name in ("WireGuardManager", "ServerHandle"):
+        from . import manager
+        return getattr(manager, name)
+    if name in ("Peer", "ServerConfig"):
+        from . import models
+        return getattr(models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,24 @@
 """命令行接口"""
 
+from __future__ import annotations
+
 import argparse
+import os
+import re
 import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from .manager import WireGuardManager
+
+# 输出格式：text 为默认的可读文本，其余由 output 模块逐行输出
+FORMATS = ("text", "json", "ndjson", "csv")
 
-from .manager import WireGuardManager
+# 只读取数据的命令，以只读方式打开数据库，跳过建表和迁移
+READONLY_COMMANDS = {"servers", "use", "list", "export", "server", "show"}
 
 
 class CancelInput(Exception):
@@ -52,7 +67,7 @@ def interactive_menu(manager: WireGuardManager):
         servers = manager.get_servers()
         if servers:
             server_info = f"当前: {manager.server.endpoint}:{manager.server.interface}"
-            peer_info = f"{len(manager.peers)} 个客户端"
+            peer_info = f"{manager.count_peers()} 个客户端"
             if len(servers) > 1:
                 peer_info += f" | 共 {len(servers)} 个服务端"
         else:
@@ -202,7 +217,7 @@ def _menu_show_server(manager: WireGuardManager):
     print(f"端口: {manager.server.listen_port}")
     print(f"Endpoint: {manager.server.endpoint}")
     print(f"接口: {manager.server.interface}")
-    print(f"客户端数: {len(manager.peers)}")
+    print(f"客户端数: {manager.count_peers()}")
 
 
 def _menu_switch_server(manager: WireGuardManager):
@@ -215,9 +230,10 @@ def _menu_switch_server(manager: WireGuardManager):
         return
 
     print("\n--- 切换服务端 --- (Ctrl+C 返回菜单)")
+    counts = manager.db.count_peers_by_server()
     for i, s in enumerate(servers, 1):
         current = " (当前)" if s.id == manager.server_id else ""
-        peer_count = len(manager.db.get_peers(s.id))
+        peer_count = counts.get(s.id, 0)
         print(f"  {i}. {s.endpoint}:{s.interface} - {s.address} Port:{s.listen_port} ({peer_count} 客户端){current}")
 
     choice = get_input_required("选择服务端序号")
@@ -241,9 +257,10 @@ def _menu_delete_server(manager: WireGuardManager):
         return
 
     print("\n--- 删除服务端 --- (Ctrl+C 返回菜单)")
+    counts = manager.db.count_peers_by_server()
     for i, s in enumerate(servers, 1):
         current = " (当前)" if s.id == manager.server_id else ""
-        peer_count = len(manager.db.get_peers(s.id))
+        peer_count = counts.get(s.id, 0)
         print(f"  {i}. {s.endpoint}:{s.interface} - {s.address} Port:{s.listen_port} ({peer_count} 客户端){current}")
 
     choice = get_input_required("选择要删除的服务端序号")
@@ -274,6 +291,7 @@ def _menu_add_peer(manager: WireGuardManager):
 
     peer = manager.add_peer(name, dns, int(mtu))
     print(f"\n✓ 客户端 '{name}' 添加成功!")
+    _warn_sync_failure(manager)
     print(f"  分配 IP: {peer.address}")
     print(f"  监听端口: {peer.listen_port}")
 
@@ -283,25 +301,28 @@ def _menu_add_peer(manager: WireGuardManager):
 
 
 def _menu_remove_peer(manager: WireGuardManager):
-    if not manager.peers:
+    peers = manager.get_peer_summaries()
+    if not peers:
         print("没有客户端")
         return
     print("\n--- 删除客户端 --- (Ctrl+C 返回菜单)")
-    for i, p in enumerate(manager.peers, 1):
+    for i, p in enumerate(peers, 1):
         print(f"  {i}. {p.name} ({p.address})")
     name = get_input_required("输入客户端名称")
     if manager.remove_peer(name):
         print(f"✓ 客户端 '{name}' 已删除")
+        _warn_sync_failure(manager)
     else:
         print(f"错误: 客户端 '{name}' 不存在")
 
 
 def _menu_toggle_peer(manager: WireGuardManager):
-    if not manager.peers:
+    peers = manager.get_peer_summaries()
+    if not peers:
         print("没有客户端")
         return
     print("\n--- 启用/禁用客户端 --- (Ctrl+C 返回菜单)")
-    for p in manager.peers:
+    for p in peers:
         status = "✓ 启用" if p.enabled else "✗ 禁用"
         print(f"  {p.name}: {status}")
     name = get_input_required("输入客户端名称")
@@ -309,18 +330,20 @@ def _menu_toggle_peer(manager: WireGuardManager):
     if result is not None:
         status = "启用" if result else "禁用"
         print(f"✓ 客户端 '{name}' 已{status}")
+        _warn_sync_failure(manager)
     else:
         print(f"错误: 客户端 '{name}' 不存在")
 
 
 def _menu_list_peers(manager: WireGuardManager):
     print(f"\n--- 客户端列表 [{manager.server.endpoint}] ---")
-    if not manager.peers:
+    peers = manager.get_peer_summaries()
+    if not peers:
         print("  (空)")
     else:
-        for p in manager.peers:
+        for p in peers:
             status = "✓" if p.enabled else "✗"
-            imported = " [导入]" if not p.private_key else ""
+            imported = " [导入]" if not p.has_private_key else ""
             print(f"  {status} {p.name}{imported}")
             print(f"      IP: {p.address}")
             print(f"      监听端口: {p.listen_port}  MTU: {p.mtu}")
@@ -329,10 +352,11 @@ def _menu_list_peers(manager: WireGuardManager):
 
 
 def _menu_export_peer(manager: WireGuardManager):
-    if not manager.peers:
+    peers = manager.get_peer_summaries()
+    if not peers:
         print("没有客户端")
         return
-    exportable = [p for p in manager.peers if p.private_key]
+    exportable = [p for p in peers if p.has_private_key]
     if not exportable:
         print("没有可导出的客户端 (导入的客户端没有私钥)")
         return
@@ -361,10 +385,11 @@ def _menu_export_peer(manager: WireGuardManager):
 
 
 def _menu_show_qrcode(manager: WireGuardManager):
-    if not manager.peers:
+    peers = manager.get_peer_summaries()
+    if not peers:
         print("没有客户端")
         return
-    exportable = [p for p in manager.peers if p.private_key]
+    exportable = [p for p in peers if p.has_private_key]
     if not exportable:
         print("没有可导出的客户端 (导入的客户端没有私钥)")
         return
@@ -423,12 +448,339 @@ def _menu_sync_remote(manager: WireGuardManager):
 
 
 def _menu_remote_status(manager: WireGuardManager):
+    from .config import STATUS_CACHE_TTL
+
     if not manager.get_ssh_client():
         print("错误: 请先配置 SSH 连接")
         return
     print("\n--- 远程 WireGuard 状态 ---")
-    success, output = manager.get_remote_status()
-    print(output)
+    try:
+        _print_remote_status(manager, STATUS_CACHE_TTL)
+    except RuntimeError as e:
+        print(f"✗ {e}")
+
+
+def _format_bytes(size: float) -> str:
+    """格式化字节数 (如 1.5 MiB)"""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def _format_age(seconds: float) -> str:
+    """格式化距今时长 (如 3 分钟前)"""
+    for unit, name in ((86400, "天"), (3600, "小时"), (60, "分钟")):
+        if seconds >= unit:
+            return f"{int(seconds // unit)} {name}前"
+    return f"{max(int(seconds), 0)} 秒前"
+
+
+def _peer_names(manager: WireGuardManager) -> dict[str, str]:
+    """公钥 -> 客户端名称"""
+    return {p.public_key: p.name for p in manager.iter_peer_summaries()}
+
+
+def _print_remote_status(manager: WireGuardManager, ttl: float):
+    """以表格输出当前服务端的 peer 运行状态（按最近握手排序）"""
+    fetched_at, interfaces = manager.get_host_statuses(ttl)
+    interface = manager.server.interface
+    if interface not in interfaces:
+        raise RuntimeError(f"远程接口 {interface} 未运行")
+    statuses = sorted(interfaces[interface], key=lambda s: s.latest_handshake, reverse=True)
+    names = _peer_names(manager)
+    now = time.time()
+    print(f"[{manager.server.endpoint}:{interface}] {len(statuses)} 个 peer，"
+          f"采集于 {datetime.fromtimestamp(fetched_at):%H:%M:%S} ({_format_age(now - fetched_at)})")
+    for status in statuses:
+        handshake = (_format_age(now - status.latest_handshake)
+                     if status.latest_handshake else "从未握手")
+        print(f"  {names.get(status.public_key, status.public_key[:8] + '… (未登记)')}\t"
+              f"{status.endpoint or '-'}\t{handshake}\t"
+              f"↓{_format_bytes(status.transfer_rx)} ↑{_format_bytes(status.transfer_tx)}")
+
+
+def _watch_remote_status(manager: WireGuardManager, interval: float):
+    """每 interval 秒刷新一次，只输出变化：新握手、新增/移除的 peer、流量速率
+
+    刷新间隔同时作为缓存有效期，多个终端同时查看同一主机时共享一次 SSH 调用。
+    """
+    interface = manager.server.interface
+    names = _peer_names(manager)
+    tty = sys.stdout.isatty()
+    previous, previous_at = None, 0.0
+    status_line = False
+    # Ctrl+C 由 main 中的信号处理退出
+    while True:
+        try:
+            fetched_at, interfaces = manager.get_host_statuses(interval)
+            if previous is None and fetched_at != previous_at:
+                _print_remote_status(manager, interval)
+        except RuntimeError as e:
+            # 暂时性的 SSH 失败不结束 --watch，下一轮继续
+            if status_line:
+                sys.stdout.write("\r\033[K")
+                sys.stdout.flush()
+                status_line = False
+            print(f"{datetime.now():%H:%M:%S}  错误: {e}", file=sys.stderr)
+            time.sleep(interval)
+            continue
+        if fetched_at != previous_at:
+            current = {s.public_key: s for s in interfaces.get(interface, [])}
+            if previous is None:
+                lines = []
+            else:
+                lines = _status_deltas(previous, current, fetched_at - previous_at, names)
+            stamp = f"{datetime.fromtimestamp(fetched_at):%H:%M:%S}"
+            if status_line:
+                sys.stdout.write("\r\033[K")
+                status_line = False
+            for line in lines:
+                print(f"{stamp}  {line}")
+            if not lines and tty:
+                # 无变化时原地刷新状态行
+                sys.stdout.write(f"{stamp}  无变化 ({len(current)} 个 peer)")
+                status_line = True
+            sys.stdout.flush()
+            previous, previous_at = current, fetched_at
+        time.sleep(interval)
+
+
+def _find_server(manager: WireGuardManager, endpoint: str, interface: Optional[str] = None):
+    """按 endpoint (和接口) 查找服务端，不存在时抛出 ValueError"""
+    if interface:
+        server = manager.db.get_server_by_endpoint_and_interface(endpoint, interface)
+    else:
+        server = manager.db.get_server_by_endpoint(endpoint)
+    if not server:
+        raise ValueError(f"服务端 '{endpoint}' 不存在")
+    return server
+
+
+def _run_shard(manager: WireGuardManager, args: argparse.Namespace):
+    """执行 shard 子命令，作用于当前服务端的 endpoint"""
+    from . import sharding
+
+    endpoint = manager.server.endpoint
+    if not endpoint:
+        raise RuntimeError("请先初始化或选择服务端")
+
+    if args.shard_command == "set":
+        policy = sharding.set_policy(manager, endpoint, args.max_peers, args.pool)
+        print(f"{endpoint} 已启用分片: 每个接口最多 {policy.max_peers} 个客户端，"
+              f"新分片地址池 {policy.pool}")
+    elif args.shard_command == "off":
+        if manager.db.delete_shard_policy(endpoint):
+            print(f"{endpoint} 已取消分片策略")
+        else:
+            print(f"{endpoint} 未设置分片策略")
+        return
+    elif args.shard_command == "create":
+        server = sharding.create_shard(manager, endpoint)
+        print(f"已创建分片 {server.interface}: {server.address}  端口 {server.listen_port}")
+        print("请在防火墙中放行该 UDP 端口")
+
+    policy = manager.db.get_shard_policy(endpoint)
+    print(f"{endpoint} 分片策略: " + (f"每个接口最多 {policy.max_peers} 个客户端，地址池 {policy.pool}"
+                                    if policy else "未设置"))
+    for server, count in sharding.get_shards(manager, endpoint):
+        if policy:
+            capacity = sharding.shard_capacity(server, policy.max_peers)
+            load = f"{count}/{capacity}" + (" 已满" if count >= capacity else "")
+        else:
+            load = str(count)
+        print(f"  {server.interface}\t{server.address}\t端口:{server.listen_port}\t{load}")
+
+
+def _run_routes(manager: WireGuardManager, args: argparse.Namespace):
+    """执行 routes 命令：维护额外路由并输出汇总后的客户端 AllowedIPs"""
+    from .routes import find_overlaps, parse_networks, server_networks
+
+    if not manager.server.private_key:
+        raise RuntimeError("服务端未初始化")
+
+    current = parse_networks(manager.server.routes)
+    if args.action == "add":
+        added = parse_networks(args.networks)
+        if args.topology:
+            from .topology import get_topology, reachable_networks
+            added += reachable_networks(manager, get_topology(manager, args.topology),
+                                        manager.server_id)
+        if not added:
+            raise ValueError("请指定网段或 --topology")
+        current += [n for n in dict.fromkeys(added) if n not in current]
+    elif args.action == "remove":
+        removed = set(parse_networks(args.networks))
+        for network in removed.difference(current):
+            print(f"警告: 额外路由中没有 {network}", file=sys.stderr)
+        current = [n for n in current if n not in removed]
+
+    if args.action != "show":
+        generation = manager.server.config_generation
+        manager.set_routes([str(n) for n in current])
+        if manager.server.config_generation != generation:
+            print("额外路由已更新，执行 export-all --changed 重新导出客户端配置")
+
+    networks = server_networks(manager.server.address)
+    client_routes = manager.get_client_routes()
+    print(f"服务端网段: {', '.join(map(str, networks))}")
+    print(f"额外路由: {', '.join(map(str, current)) or '无'}")
+    print(f"客户端 AllowedIPs ({len(client_routes.split(', '))} 条): {client_routes}")
+    for outer, inner in find_overlaps(networks + current):
+        print(f"警告: 网段重叠 {inner} 包含在 {outer} 中" if outer != inner
+              else f"警告: 网段重复 {inner}", file=sys.stderr)
+
+
+_PUSH_STATUS = {"pushed": "✓ 已下发", "pending": "· 待下发", "unchanged": "= 无变化",
+                "failed": "✗ 失败", "skipped": "- 跳过"}
+
+
+def _run_topology(manager: WireGuardManager, args: argparse.Namespace):
+    """执行 topology 子命令"""
+    from . import topology as topo
+
+    if args.topology_command == "list":
+        topologies = manager.db.get_topologies()
+        if not topologies:
+            print("没有拓扑")
+        for t in topologies:
+            nodes = manager.db.get_topology_nodes(t.id)
+            print(f"{t.name}\t{t.kind}\t{t.interface}\t{t.network}\t端口:{t.listen_port}\t"
+                  f"{len(nodes)} 个节点")
+        return
+
+    if args.topology_command == "create":
+        t = topo.create_topology(manager, args.name, args.kind, args.network, args.port,
+                                 args.interface)
+        print(f"拓扑 '{t.name}' 已创建 ({t.kind}, {t.interface}, {t.network})")
+        return
+
+    t = topo.get_topology(manager, args.name)
+    if args.topology_command == "delete":
+        if not args.yes:
+            confirm = input(f"确定删除拓扑 '{t.name}'? 远程互联接口不会停止 (y/n) [n]: ").strip().lower()
+            if confirm != 'y':
+                print("已取消")
+                return
+        manager.db.delete_topology(t.id)
+        print(f"拓扑 '{t.name}' 已删除")
+
+    elif args.topology_command == "join":
+        server = _find_server(manager, args.endpoint, args.interface)
+        node = topo.join_topology(manager, t, server, args.routes, args.hub)
+        print(f"{server.endpoint} 已加入拓扑 '{t.name}'，隧道地址 {node.address}")
+        for message in topo.find_conflicts(manager, t):
+            print(f"警告: 网段重叠 {message}", file=sys.stderr)
+        print(f"执行 topology push {t.name} 下发配置")
+
+    elif args.topology_command == "leave":
+        server = _find_server(manager, args.endpoint, args.interface)
+        success, msg = topo.leave_topology(manager, t, server, stop_remote=not args.no_sync)
+        print(f"{server.endpoint} 已移出拓扑 '{t.name}'")
+        if not success:
+            print(f"警告: {msg}", file=sys.stderr)
+        elif not args.no_sync:
+            print(msg)
+        print(f"执行 topology push {t.name} 更新其余节点")
+
+    elif args.topology_command == "show":
+        if args.config:
+            server = _find_server(manager, args.config)
+            config = topo.render_node(manager, t, server.id)
+            if config is None:
+                raise ValueError(f"{server.endpoint} 不在拓扑 '{t.name}' 中")
+            print(config)
+            return
+        print(f"拓扑 {t.name} ({t.kind})  接口: {t.interface}  地址段: {t.network}  端口: {t.listen_port}")
+        for node, server, changed in topo.node_states(manager, t):
+            role = " [中心]" if node.hub else ""
+            state = "待下发" if changed else "已下发"
+            routes = f"\t路由: {node.routes}" if node.routes else ""
+            print(f"  {server.endpoint}{role}\t{node.address}\t{state}{routes}")
+        for message in topo.find_conflicts(manager, t):
+            print(f"警告: 网段重叠 {message}", file=sys.stderr)
+
+    elif args.topology_command == "export":
+        paths = topo.export_topology(manager, t, Path(args.out) if args.out else None)
+        print(f"已导出 {len(paths)} 个节点配置"
+              + (f" 到 {paths[0].parent.parent}" if paths else ""))
+
+    elif args.topology_command == "push":
+        for message in topo.find_conflicts(manager, t):
+            print(f"警告: 网段重叠 {message}", file=sys.stderr)
+        results = topo.push_topology(manager, t, force=args.force, dry_run=args.dry_run,
+                                     workers=args.workers, deadline=args.deadline)
+        counts: dict[str, int] = {}
+        for server, status, detail in results:
+            counts[status] = counts.get(status, 0) + 1
+            if status != "unchanged":
+                print(f"  {_PUSH_STATUS[status]}\t{server.endpoint}\t{detail}".rstrip())
+        print(", ".join(f"{_PUSH_STATUS[status][2:]} {n}" for status, n in counts.items())
+              or "拓扑中没有节点")
+        if counts.get("failed"):
+            sys.exit(1)
+
+
+def _print_health(results: list) -> None:
+    """以表格输出健康检查结果"""
+    def mark(value: bool) -> str:
+        return "✓" if value else "✗"
+
+    print(f"{'服务端':<32}连接 服务 接口 配置 客户端        耗时")
+    for h in results:
+        name = f"{h.endpoint}:{h.interface}"
+        if not h.reachable:
+            print(f"{name:<35}✗    -    -    -    -             {h.elapsed:.2f}s  {h.error}")
+            continue
+        peers = f"{h.peer_count}/{h.expected_peers}"
+        config = mark(h.config_match) if h.config_sha256 else "缺失"
+        print(f"{name:<35}✓    {mark(h.active)}    {mark(h.interface_up)}    "
+              f"{config:<5}{peers:<14}{h.elapsed:.2f}s")
+    healthy = sum(h.ok for h in results)
+    print(f"\n{healthy}/{len(results)} 个服务端正常")
+
+
+_DRIFT_KINDS = {"added": "+", "missing": "-", "mismatch": "~", "error": "!"}
+_DRIFT_SOURCES = {"file": "配置文件", "live": "运行状态", "ssh": "SSH"}
+
+
+def _print_drift(checked: int, entries: list) -> None:
+    """按服务端分组输出配置漂移 (+ 仅远程存在，- 远程缺失，~ 内容不同，! 错误)"""
+    servers: dict[tuple, list] = {}
+    for e in entries:
+        servers.setdefault((e.endpoint, e.interface), []).append(e)
+    for (endpoint, interface), items in servers.items():
+        print(f"{endpoint}:{interface}")
+        for e in items:
+            key = f"{e.public_key[:12]}…" if e.public_key else ""
+            print(f"  {_DRIFT_KINDS[e.kind]} {_DRIFT_SOURCES[e.source]}\t"
+                  f"{e.name or '-'}\t{key}\t{e.detail}".rstrip())
+    print(f"\n检查 {checked} 个服务端，{len(servers)} 个存在差异"
+          + (f" (共 {len(entries)} 项)" if entries else ""))
+
+
+def _status_deltas(previous: dict, current: dict, elapsed: float,
+                   names: dict[str, str]) -> list[str]:
+    """对比两次采集的状态 (公钥 -> PeerStatus)，返回变化描述"""
+    lines = []
+    for key, status in current.items():
+        name = names.get(key, key[:8] + "…")
+        old = previous.get(key)
+        if old is None:
+            lines.append(f"{name}\t新增 peer")
+            continue
+        events = []
+        if status.latest_handshake > old.latest_handshake:
+            events.append(f"新握手 {status.endpoint or ''}".rstrip())
+        rx, tx = status.transfer_rx - old.transfer_rx, status.transfer_tx - old.transfer_tx
+        if (rx or tx) and elapsed > 0:
+            events.append(f"↓{_format_bytes(rx / elapsed)}/s ↑{_format_bytes(tx / elapsed)}/s")
+        if events:
+            lines.append(f"{name}\t{'  '.join(events)}")
+    for key in previous.keys() - current.keys():
+        lines.append(f"{names.get(key, key[:8] + '…')}\t已移除")
+    return lines
 
 
 def _menu_export_server(manager: WireGuardManager):
@@ -440,6 +792,14 @@ def _menu_export_server(manager: WireGuardManager):
     print(f"  sudo systemctl start wg-quick@{manager.server.interface}")
 
 
+def _warn_sync_failure(manager: WireGuardManager):
+    """远程同步失败时提示（本地修改已保存在数据库和操作日志中）"""
+    result = manager.last_sync_result
+    if result and not result[0]:
+        print(f"警告: {result[1]}", file=sys.stderr)
+        print("本地修改已保存，远程恢复后执行 'wg-manager replay' 重新同步", file=sys.stderr)
+
+
 def _handle_existing_peers(manager: WireGuardManager, existing_peers: list[dict]):
     """处理导入时发现的已有客户端"""
     if existing_peers:
@@ -462,6 +822,118 @@ def _handle_existing_peers(manager: WireGuardManager, existing_peers: list[dict]
             print("\n注意: 导入的客户端没有私钥，无法生成客户端配置文件")
 
 
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value: str) -> int:
+    """解析时长 (如 30d、12h、90m)，返回秒数"""
+    match = re.fullmatch(r"(\d+)([smhdw])", value.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"无效时长 '{value}'，示例: 30d、12h、90m")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def _parse_seconds(value: str, allow_zero: bool) -> float:
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = float("nan")
+    if not (0 <= seconds if allow_zero else 0 < seconds) or seconds == float("inf"):
+        bound = "大于或等于 0" if allow_zero else "大于 0"
+        raise argparse.ArgumentTypeError(f"无效秒数 '{value}'，须{bound}")
+    return seconds
+
+
+def parse_interval(value: str) -> float:
+    """解析大于 0 的秒数 (如 --watch 的刷新间隔)"""
+    return _parse_seconds(value, allow_zero=False)
+
+
+def parse_ttl(value: str) -> float:
+    """解析缓存时长秒数，0 表示不使用缓存"""
+    return _parse_seconds(value, allow_zero=True)
+
+
+def _add_peer_selectors(parser: argparse.ArgumentParser):
+    """添加选择客户端的参数：单个名称、名称列表、名称文件或 glob"""
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-n", "--name", help="客户端名称")
+    group.add_argument("--names", help="多个客户端名称，逗号分隔")
+    group.add_argument("--from-file", metavar="FILE",
+                       help="从文件读取客户端名称，每行一个 (- 表示标准输入)")
+    group.add_argument("--match", metavar="GLOB", help="名称 glob 模式或前缀")
+
+
+def _select_peer_names(manager: WireGuardManager, args: argparse.Namespace) -> list[str]:
+    """解析 _add_peer_selectors 添加的参数，返回客户端名称列表"""
+    if args.name:
+        return [args.name]
+    if args.names:
+        return [n.strip() for n in args.names.split(",") if n.strip()]
+    if args.from_file:
+        stream = sys.stdin if args.from_file == "-" else open(args.from_file)
+        with stream:
+            lines = [line.split("#", 1)[0].strip() for line in stream]
+        return [line for line in lines if line]
+    # 设置了分片策略时在 endpoint 的所有分片中匹配
+    return [p.name for server in _each_shard(manager)
+            for p in manager.iter_peer_summaries(match=args.match)]
+
+
+def _each_shard(manager: WireGuardManager):
+    """依次切换到当前 endpoint 的每个分片（未设置分片策略时只有当前服务端）"""
+    from .sharding import endpoint_shards
+
+    for server in endpoint_shards(manager):
+        if server.id != manager.server_id:
+            manager.switch_server(server.id)
+        yield server
+
+
+def _switch_to_peer_shard(manager: WireGuardManager, name: str):
+    """设置了分片策略时切换到客户端所在的分片（-s 只能指定 endpoint）"""
+    from .sharding import locate_peer
+
+    server = locate_peer(manager, name)
+    if server and server.id != manager.server_id:
+        manager.switch_server(server.id)
+
+
+def _run_per_shard(manager: WireGuardManager, names: list[str], func) -> list:
+    """按客户端所在分片分组执行批量操作（每个分片一次远程同步），返回合并的结果"""
+    from .sharding import group_by_shard
+
+    results = []
+    for server, group in group_by_shard(manager, names):
+        if server.id != manager.server_id:
+            manager.switch_server(server.id)
+        results += func(group)
+        _warn_sync_failure(manager)
+    return results
+
+
+def _report_missing(requested: list[str], found: list) -> None:
+    """提示未找到（或状态未变化）的客户端名称"""
+    found_names = {p.name for p in found}
+    missing = [n for n in requested if n not in found_names]
+    if missing:
+        shown = ", ".join(missing[:10]) + (" ..." if len(missing) > 10 else "")
+        print(f"跳过 {len(missing)} 个: {shown}", file=sys.stderr)
+
+
+def parse_since(value: str) -> str:
+    """解析时间点 (如 2024-06-01、2024-06-01T12:00 或相对时长 7d)，返回 ISO 时间字符串"""
+    try:
+        return datetime.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        pass
+    try:
+        seconds = parse_duration(value)
+    except argparse.ArgumentTypeError:
+        raise argparse.ArgumentTypeError(f"无效时间 '{value}'，示例: 2024-06-01、7d")
+    return datetime.fromtimestamp(datetime.now().timestamp() - seconds).isoformat()
+
+
 def create_parser() -> argparse.ArgumentParser:
     """创建命令行参数解析器"""
     parser = argparse.ArgumentParser(
@@ -480,22 +952,54 @@ def create_parser() -> argparse.ArgumentParser:
   %(prog)s add -n phone                         # 添加客户端
   %(prog)s add -n phone --dns 1.1.1.1 --mtu 1420  # 添加客户端 (指定 DNS 和 MTU)
   %(prog)s list                                 # 列出客户端
+  %(prog)s remote-status --watch 2              # 持续查看握手和流量变化
+  %(prog)s health --all                         # 并发检查所有服务端
+  %(prog)s drift --all                          # 检查配置漂移
+  %(prog)s routes add 192.168.10.0/24           # 客户端经由服务端访问的额外网段
+  %(prog)s shard set --max-peers 250            # 接口满 250 个客户端时自动创建 wg1、wg2…
+  %(prog)s topology create sites --kind mesh    # 新建站点互联拓扑
+  %(prog)s topology join sites vpn1.example.com # 将服务端加入拓扑
+  %(prog)s topology push sites                  # 并发下发有变化的节点
+  %(prog)s toggle --match 'sales-*' --disable   # 批量禁用客户端
+  %(prog)s remove --from-file leavers.txt -y    # 批量删除客户端
+  %(prog)s list --format ndjson                 # 每行一个 JSON 对象 (也支持 json / csv)
+  %(prog)s list --match 'phone*' --disabled     # 按名称、状态过滤客户端
   %(prog)s export -n phone                      # 显示客户端配置
   %(prog)s export -n phone --save               # 显示并保存到文件
   %(prog)s export -n phone --qr                 # 显示二维码
+  %(prog)s export-all --changed                 # 只重新导出已过期的客户端配置
   %(prog)s server                               # 导出服务端配置
   %(prog)s ssh --host 1.2.3.4                   # 配置 SSH
   %(prog)s sync                                 # 同步到远程服务器
+  %(prog)s --timings add -n phone               # 输出各阶段耗时
+  %(prog)s --trace add.json add -n phone        # 写入 Chrome trace
+  %(prog)s --profile sync.pstats sync           # 使用 cProfile 分析
+  %(prog)s prune --stale 30d --dry-run          # 查看 30 天未握手的客户端
+  %(prog)s replay --all                         # 重新下发远程不可达时记录的操作
+  %(prog)s rotate --psk --peers 'phone*'        # 批量轮换预共享密钥
+  %(prog)s sync-mode deferred                   # 启用延迟合并同步
+  %(prog)s flush --all                          # 合并下发所有待同步的服务端
+  %(prog)s serve --socket /run/wg-manager.sock  # 常驻服务
+  %(prog)s dev seed --home /tmp/fleet --servers 50 --peers-per-server 5000  # 生成测试数据
 """
     )
 
     # 全局选项
     parser.add_argument("-s", "--server", help="指定服务端 (endpoint)")
+    parser.add_argument("--timings", action="store_true", help="输出各阶段耗时统计")
+    parser.add_argument("--trace", metavar="FILE", help="将计时数据写入文件 (.jsonl 或 Chrome trace .json)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="使用 cProfile 执行命令并写入 pstats 文件，汇总输出到 stderr (也可设置 WG_MANAGER_PROFILE)")
+    parser.add_argument("--profile-top", type=int, metavar="N",
+                        help="输出累计耗时最高的 N 个函数 (默认 20)")
+    parser.add_argument("--trace-format", choices=["jsonl", "chrome"],
+                        help="trace 文件格式 (默认按扩展名判断)")
 
     subparsers = parser.add_subparsers(dest="command", help="命令")
 
     # servers 命令
-    subparsers.add_parser("servers", help="列出所有服务端")
+    servers_parser = subparsers.add_parser("servers", help="列出所有服务端")
+    servers_parser.add_argument("--format", choices=FORMATS, default="text", help="输出格式 (默认 text)")
 
     # use 命令
     use_parser = subparsers.add_parser("use", help="切换服务端")
@@ -532,14 +1036,37 @@ def create_parser() -> argparse.ArgumentParser:
     add_parser.add_argument("--dns", default="", help="DNS 服务器 (留空不设置)")
     add_parser.add_argument("--mtu", type=int, default=1280, help="MTU (默认 1280)")
     add_parser.add_argument("--no-sync", action="store_true", help="不同步到远程")
+    add_parser.add_argument("--no-shard", action="store_true",
+                            help="忽略分片策略，添加到当前接口")
 
     # remove 命令
-    remove_parser = subparsers.add_parser("remove", help="删除客户端")
-    remove_parser.add_argument("-n", "--name", required=True, help="客户端名称")
+    remove_parser = subparsers.add_parser("remove", help="删除客户端 (支持批量)")
+    _add_peer_selectors(remove_parser)
+    remove_parser.add_argument("-y", "--yes", action="store_true", help="批量删除时跳过确认")
     remove_parser.add_argument("--no-sync", action="store_true", help="不同步到远程")
 
+    # toggle 命令
+    toggle_parser = subparsers.add_parser("toggle", help="启用/禁用客户端 (支持批量)")
+    _add_peer_selectors(toggle_parser)
+    toggle_state = toggle_parser.add_mutually_exclusive_group()
+    toggle_state.add_argument("--enable", dest="enable", action="store_const", const=True,
+                              help="启用 (批量操作时必须指定 --enable 或 --disable)")
+    toggle_state.add_argument("--disable", dest="enable", action="store_const", const=False,
+                              help="禁用")
+    toggle_parser.add_argument("--no-sync", action="store_true", help="不同步到远程")
+
     # list 命令
-    subparsers.add_parser("list", help="列出客户端")
+    list_parser = subparsers.add_parser("list", help="列出客户端")
+    list_parser.add_argument("--format", choices=FORMATS, default="text", help="输出格式 (默认 text)")
+    list_parser.add_argument("--match", help="按名称过滤: glob 模式 (如 '*phone*') 或名称前缀")
+    list_parser.add_argument("--address", metavar="CIDR", help="按网段过滤 (如 10.0.0.0/28)")
+    enabled_group = list_parser.add_mutually_exclusive_group()
+    enabled_group.add_argument("--enabled", dest="enabled", action="store_const", const=True,
+                               help="只列出启用的客户端")
+    enabled_group.add_argument("--disabled", dest="enabled", action="store_const", const=False,
+                               help="只列出禁用的客户端")
+    list_parser.add_argument("--created-after", type=parse_since, metavar="TIME",
+                             help="只列出之后创建的客户端 (如 2024-06-01 或 7d)")
 
     # export 命令
     export_parser = subparsers.add_parser("export", help="导出客户端配置")
@@ -547,11 +1074,18 @@ def create_parser() -> argparse.ArgumentParser:
     export_parser.add_argument("--qr", action="store_true", help="显示二维码")
     export_parser.add_argument("--save", action="store_true", help="保存到文件")
 
+    # export-all 命令
+    export_all_parser = subparsers.add_parser("export-all", help="批量导出客户端配置到文件")
+    export_all_parser.add_argument("--changed", action="store_true",
+                                   help="只导出上次导出后已变更的客户端 (密钥轮换、服务端地址/端口/公钥变更)")
+    export_all_parser.add_argument("--dry-run", action="store_true", help="只列出需要导出的客户端")
+
     # server 命令
     subparsers.add_parser("server", help="导出服务端配置")
 
     # show 命令
-    subparsers.add_parser("show", help="显示服务端配置信息")
+    show_parser = subparsers.add_parser("show", help="显示服务端配置信息")
+    show_parser.add_argument("--format", choices=FORMATS, default="text", help="输出格式 (默认 text)")
 
     # ssh 命令
     ssh_parser = subparsers.add_parser("ssh", help="配置 SSH 连接")
@@ -562,8 +1096,142 @@ def create_parser() -> argparse.ArgumentParser:
     # sync 命令
     subparsers.add_parser("sync", help="同步配置到远程服务器")
 
+    # replay 命令
+    replay_parser = subparsers.add_parser("replay", help="重新下发远程不可达时记录的操作")
+    replay_parser.add_argument("--all", action="store_true", help="处理所有服务端")
+
     # remote-status 命令
-    subparsers.add_parser("remote-status", help="查看远程 WireGuard 状态")
+    status_parser = subparsers.add_parser("remote-status", help="查看远程 WireGuard 状态")
+    status_parser.add_argument("--ttl", type=parse_ttl, default=None,
+                               help="允许使用的缓存时长，秒 (默认 5，0 表示强制刷新)")
+    status_parser.add_argument("--watch", type=parse_interval, metavar="N",
+                               help="每 N 秒刷新，只输出变化 (新握手、流量速率)")
+    status_parser.add_argument("--raw", action="store_true", help="输出原始 wg show (不使用缓存)")
+
+    # health 命令
+    health_parser = subparsers.add_parser("health", help="并发检查服务端健康状态")
+    health_parser.add_argument("--all", action="store_true", help="检查所有已配置 SSH 的服务端")
+    health_parser.add_argument("--workers", type=int, default=16, help="并发主机数 (默认 16)")
+    health_parser.add_argument("--deadline", type=float, default=15,
+                               help="每台主机的时限，秒 (默认 15)")
+    health_parser.add_argument("--format", choices=FORMATS, default="text", help="输出格式")
+
+    # drift 命令
+    drift_parser = subparsers.add_parser("drift", help="检查数据库与远程配置/运行状态的差异")
+    drift_parser.add_argument("--all", action="store_true", help="检查所有已配置 SSH 的服务端")
+    drift_parser.add_argument("--workers", type=int, default=16, help="并发主机数 (默认 16)")
+    drift_parser.add_argument("--deadline", type=float, default=15,
+                              help="每台主机的时限，秒 (默认 15)")
+    drift_parser.add_argument("--format", choices=FORMATS, default="text", help="输出格式")
+
+    # shard 命令
+    shard_parser = subparsers.add_parser("shard", help="按 endpoint 自动分片 (wg0、wg1…)")
+    shard_subparsers = shard_parser.add_subparsers(dest="shard_command", required=True)
+    shard_subparsers.add_parser("status", help="查看分片策略和各分片负载")
+    shard_set = shard_subparsers.add_parser("set", help="设置每个接口的客户端上限")
+    shard_set.add_argument("--max-peers", type=int, required=True, help="每个接口的客户端上限")
+    shard_set.add_argument("--pool", help="新分片的地址池 (默认第一个接口所在的 /16)")
+    shard_subparsers.add_parser("off", help="取消分片策略 (已创建的分片保留)")
+    shard_subparsers.add_parser("create", help="立即创建一个新分片")
+
+    # routes 命令
+    routes_parser = subparsers.add_parser("routes", help="查看/设置客户端路由 (AllowedIPs)")
+    routes_parser.add_argument("action", nargs="?", choices=["show", "add", "remove"], default="show",
+                               help="show 查看 (默认)，add 添加额外路由，remove 删除额外路由")
+    routes_parser.add_argument("networks", nargs="*", metavar="CIDR", help="网段")
+    routes_parser.add_argument("--topology", metavar="NAME",
+                               help="add 时加入经由该拓扑可访问的其他站点网段")
+
+    # topology 命令
+    topology_parser = subparsers.add_parser("topology", help="服务端之间的站点互联 (mesh / hub)")
+    topology_subparsers = topology_parser.add_subparsers(dest="topology_command", required=True)
+    topology_subparsers.add_parser("list", help="列出所有拓扑")
+    topo_create = topology_subparsers.add_parser("create", help="新建拓扑")
+    topo_create.add_argument("name", help="拓扑名称")
+    topo_create.add_argument("--kind", choices=["mesh", "hub"], default="mesh",
+                             help="mesh 全互联，hub 星型 (默认 mesh)")
+    topo_create.add_argument("--network", default="10.255.0.0/24",
+                             help="节点隧道地址段 (默认 10.255.0.0/24)")
+    topo_create.add_argument("--port", type=int, default=51900, help="互联接口监听端口 (默认 51900)")
+    topo_create.add_argument("-i", "--interface", default="wgm0", help="互联接口名称 (默认 wgm0)")
+    topo_delete = topology_subparsers.add_parser("delete", help="删除拓扑 (不会停止远程接口)")
+    topo_delete.add_argument("name", help="拓扑名称")
+    topo_delete.add_argument("-y", "--yes", action="store_true", help="跳过确认")
+    topo_join = topology_subparsers.add_parser("join", help="将服务端加入拓扑")
+    topo_join.add_argument("name", help="拓扑名称")
+    topo_join.add_argument("endpoint", help="服务端 endpoint")
+    topo_join.add_argument("-i", "--interface", help="服务端接口 (同一 endpoint 多接口时使用)")
+    topo_join.add_argument("--routes", default="", help="经由该节点访问的额外网段，逗号分隔")
+    topo_join.add_argument("--hub", action="store_true", help="作为 hub 拓扑的中心节点")
+    topo_leave = topology_subparsers.add_parser("leave", help="将服务端移出拓扑并停止其互联接口")
+    topo_leave.add_argument("name", help="拓扑名称")
+    topo_leave.add_argument("endpoint", help="服务端 endpoint")
+    topo_leave.add_argument("-i", "--interface", help="服务端接口 (同一 endpoint 多接口时使用)")
+    topo_leave.add_argument("--no-sync", action="store_true", help="不停止远程互联接口")
+    topo_show = topology_subparsers.add_parser("show", help="显示拓扑节点，或指定节点的配置")
+    topo_show.add_argument("name", help="拓扑名称")
+    topo_show.add_argument("--config", metavar="ENDPOINT", help="输出该节点的配置")
+    topo_export = topology_subparsers.add_parser("export", help="将所有节点配置写入本地目录")
+    topo_export.add_argument("name", help="拓扑名称")
+    topo_export.add_argument("--out", help="输出目录 (默认 <配置目录>/topologies/<名称>)")
+    topo_push = topology_subparsers.add_parser("push", help="并发下发配置有变化的节点")
+    topo_push.add_argument("name", help="拓扑名称")
+    topo_push.add_argument("--force", action="store_true", help="忽略上次下发记录，全部重新下发")
+    topo_push.add_argument("--dry-run", action="store_true", help="只列出需要下发的节点")
+    topo_push.add_argument("--workers", type=int, default=16, help="并发主机数 (默认 16)")
+    topo_push.add_argument("--deadline", type=float, default=15,
+                           help="每台主机的时限，秒 (默认 15)")
+
+    # prune 命令
+    prune_parser = subparsers.add_parser("prune", help="批量禁用/删除长期未握手的客户端")
+    prune_parser.add_argument("--stale", required=True, type=parse_duration,
+                              help="握手超过该时长视为失效 (如 30d、12h)")
+    prune_parser.add_argument("--remove", action="store_true", help="删除而不是禁用")
+    prune_parser.add_argument("--dry-run", action="store_true", help="只列出，不做修改")
+    prune_parser.add_argument("--no-sync", action="store_true", help="不同步到远程")
+
+    # rotate 命令
+    rotate_parser = subparsers.add_parser("rotate", help="批量轮换预共享密钥或服务端密钥")
+    rotate_target = rotate_parser.add_mutually_exclusive_group(required=True)
+    rotate_target.add_argument("--psk", action="store_true", help="轮换客户端预共享密钥")
+    rotate_target.add_argument("--server-key", action="store_true",
+                               help="轮换服务端密钥对 (所有客户端需重新分发配置)")
+    rotate_parser.add_argument("--peers", metavar="GLOB",
+                               help="只轮换匹配的客户端 (glob 或名称前缀，仅 --psk)")
+    rotate_parser.add_argument("-y", "--yes", action="store_true", help="跳过确认")
+    rotate_parser.add_argument("--no-sync", action="store_true", help="不同步到远程")
+
+    # sync-mode 命令
+    sync_mode_parser = subparsers.add_parser("sync-mode", help="设置同步模式 (立即/延迟合并)")
+    sync_mode_parser.add_argument("mode", choices=["immediate", "deferred"],
+                                  help="immediate: 每次修改立即同步; deferred: 标记后由 flush 合并同步")
+
+    # flush 命令
+    flush_parser = subparsers.add_parser("flush", help="合并执行延迟同步")
+    flush_parser.add_argument("--all", action="store_true", help="处理所有服务端")
+    flush_parser.add_argument("--debounce", type=float, default=2.0,
+                              help="最近一次修改后的静默等待秒数 (默认 2)")
+    flush_parser.add_argument("--max-wait", type=float, default=30.0,
+                              help="最长等待秒数，超过后强制同步 (默认 30)")
+    flush_parser.add_argument("--no-wait", action="store_true", help="不等待防抖窗口")
+
+    # serve 命令
+    serve_parser = subparsers.add_parser("serve", help="以常驻服务方式运行 (Unix Socket JSON API)")
+    serve_parser.add_argument("--socket", help="Socket 路径 (默认 ~/.wg_manager/wg-manager.sock)")
+    serve_parser.add_argument("--debounce", type=float, default=2.0,
+                              help="延迟同步的防抖秒数 (默认 2)")
+
+    # dev 命令（开发/测试工具）
+    dev_parser = subparsers.add_parser("dev", help="开发/测试工具")
+    dev_subparsers = dev_parser.add_subparsers(dest="dev_command", required=True)
+    seed_parser = dev_subparsers.add_parser("seed", help="在测试数据库中批量生成模拟数据")
+    seed_parser.add_argument("--home", help="测试数据目录 (默认 WG_MANAGER_HOME)")
+    seed_parser.add_argument("--servers", type=int, default=10, help="服务端数量 (默认 10)")
+    seed_parser.add_argument("--peers-per-server", type=int, default=1000,
+                             help="每个服务端的客户端数量 (默认 1000)")
+    seed_parser.add_argument("--seed", type=int, help="随机种子，指定后生成结果可复现")
+    seed_parser.add_argument("--write-configs", metavar="DIR",
+                             help="同时写入服务端配置 DIR/<endpoint>/wgN.conf")
 
     return parser
 
@@ -582,29 +1250,142 @@ def main():
     parser = create_parser()
     args = parser.parse_args()
 
+    from . import timing
+
+    if args.timings or args.trace:
+        timing.enable()
+
+    # serve 按请求分析（见 daemon.serve），其他命令整体在 cProfile 下执行
+    profiler = timing.get_profiler(args.profile, args.profile_top) if args.command != "serve" else None
+    try:
+        if profiler:
+            try:
+                profiler.call(_run, args)
+            finally:
+                profiler.report()
+        else:
+            _run(args)
+    finally:
+        if args.timings or args.trace:
+            _report_timings(args)
+
+
+def _report_timings(args: argparse.Namespace):
+    """输出耗时统计"""
+    from . import timing
+
+    if args.timings:
+        print("\n--- 耗时统计 ---", file=sys.stderr)
+        print(timing.format_summary(), file=sys.stderr)
+    if args.trace:
+        trace_format = args.trace_format or ("jsonl" if args.trace.endswith(".jsonl") else "chrome")
+        if trace_format == "jsonl":
+            timing.write_jsonl(Path(args.trace))
+        else:
+            timing.write_chrome_trace(Path(args.trace))
+        print(f"trace 已写入: {args.trace}", file=sys.stderr)
+
+
+def _run_dev(args: argparse.Namespace):
+    """执行 dev 子命令，只操作 --home / WG_MANAGER_HOME 指定的测试目录"""
+    import random
+    import time
+
+    from .config import FAKE_HOSTS_ENV
+    from .database import Database
+    from .devtools import seed_fleet, write_server_configs
+
+    home = args.home or os.environ.get("WG_MANAGER_HOME")
+    if not home:
+        print("错误: 请通过 --home 或 WG_MANAGER_HOME 指定测试数据目录", file=sys.stderr)
+        sys.exit(1)
+    home = Path(home).expanduser().resolve()
+    if home == (Path.home() / ".wg_manager").resolve():
+        print("错误: 不能在正式数据目录中生成模拟数据", file=sys.stderr)
+        sys.exit(1)
+
+    db = Database(home / "wg_manager.db")
+    if db.get_first_server():
+        print(f"错误: {home} 中已有数据，请使用新的目录", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    rng = random.Random(args.seed)
+    servers = seed_fleet(db, args.servers, args.peers_per_server, rng)
+    print(f"已生成 {len(servers)} 个服务端, {len(servers) * args.peers_per_server} 个客户端 "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    if args.write_configs:
+        paths = write_server_configs(db, servers, Path(args.write_configs))
+        print(f"已写入 {len(paths)} 个服务端配置: {args.write_configs}")
+
+    print(f"\n使用测试数据: export WG_MANAGER_HOME={home}")
+    print(f"使用本地模拟主机 (ssh --host local:<目录>，仅源码目录): export {FAKE_HOSTS_ENV}=1")
+
+
+def _list_filters(args: argparse.Namespace) -> dict:
+    """list 命令的过滤条件"""
+    return {"match": args.match, "network": args.address,
+            "enabled": args.enabled, "created_after": args.created_after}
+
+
+def _run(args: argparse.Namespace):
+    """执行命令"""
+    if args.command == "serve":
+        from . import timing
+        from .config import SOCKET_FILE
+        from .daemon import serve
+
+        socket_path = Path(args.socket) if args.socket else SOCKET_FILE
+        print(f"监听 {socket_path}", file=sys.stderr)
+        serve(socket_path, debounce=args.debounce,
+              profiler=timing.get_profiler(args.profile, args.profile_top))
+        return
+
+    if args.command == "dev":
+        _run_dev(args)
+        return
+
+    from .manager import WireGuardManager
+
+    # 保存文件或显示二维码时会记录导出版本，需要写数据库
+    readonly = args.command in READONLY_COMMANDS and not (
+        args.command == "export" and (args.save or args.qr))
+    manager = WireGuardManager(readonly=readonly)
+
     # 根据 -s 参数选择服务端
-    if hasattr(args, 'server') and args.server:
-        manager = WireGuardManager()
-        if not manager.switch_server_by_endpoint(args.server):
-            print(f"错误: 服务端 '{args.server}' 不存在", file=sys.stderr)
-            sys.exit(1)
-    else:
-        manager = WireGuardManager()
+    if args.server and not manager.switch_server_by_endpoint(args.server):
+        print(f"错误: 服务端 '{args.server}' 不存在", file=sys.stderr)
+        sys.exit(1)
 
     if not args.command:
         interactive_menu(manager)
         return
 
     try:
-        if args.command == "servers":
+        if args.command == "servers" and args.format != "text":
+            from .output import write_rows
+
+            counts = manager.db.count_peers_by_server()
+            rows = ({
+                "id": s.id, "endpoint": s.endpoint, "interface": s.interface,
+                "address": s.address, "listen_port": s.listen_port,
+                "public_key": s.public_key, "peers": counts.get(s.id, 0),
+                "current": s.id == manager.server_id,
+            } for s in manager.get_servers())
+            write_rows(rows, args.format, ["id", "endpoint", "interface", "address",
+                                           "listen_port", "public_key", "peers", "current"])
+
+        elif args.command == "servers":
             servers = manager.get_servers()
             if not servers:
                 print("没有服务端")
             else:
                 print("服务端列表:")
+                counts = manager.db.count_peers_by_server()
                 for s in servers:
                     current = " (当前)" if s.id == manager.server_id else ""
-                    peer_count = len(manager.db.get_peers(s.id))
+                    peer_count = counts.get(s.id, 0)
                     print(f"  {s.endpoint}:{s.interface}\t{s.address}\tPort:{s.listen_port}\t{peer_count} 客户端{current}")
 
         elif args.command == "use":
@@ -661,7 +1442,7 @@ def main():
                 sys.exit(1)
 
             if not args.yes:
-                peer_count = len(manager.db.get_peers(server.id))
+                peer_count = manager.count_peers(server.id)
                 confirm = input(f"确定删除 '{args.endpoint}' 及其 {peer_count} 个客户端? (y/n) [n]: ").strip().lower()
                 if confirm != 'y':
                     print("已取消")
@@ -674,34 +1455,115 @@ def main():
                 sys.exit(1)
 
         elif args.command == "add":
+            placed = None
+            if not args.no_shard:
+                from .sharding import place_peer
+
+                placed = place_peer(manager, args.name)
+                if placed and placed[0].id != manager.server_id:
+                    manager.switch_server(placed[0].id)
             peer = manager.add_peer(args.name, args.dns, args.mtu,
                                     sync_remote=not args.no_sync)
-            print(f"客户端 '{args.name}' 添加成功!")
+            print(f"客户端 '{args.name}' 添加成功! [{manager.server.endpoint}:{manager.server.interface}]")
+            if placed and placed[1]:
+                shard = placed[0]
+                print(f"已自动创建分片 {shard.interface}: {shard.address}  端口 {shard.listen_port}")
+                print("请在防火墙中放行该 UDP 端口")
+            _warn_sync_failure(manager)
             print(f"IP: {peer.address}")
             print(f"监听端口: {peer.listen_port}")
             # 自动显示客户端配置
             print("\n--- 客户端配置 ---")
             print(manager.get_client_config(args.name))
 
-        elif args.command == "remove":
+        elif args.command == "remove" and args.name:
+            _switch_to_peer_shard(manager, args.name)
             if manager.remove_peer(args.name, sync_remote=not args.no_sync):
                 print(f"客户端 '{args.name}' 已删除")
+                _warn_sync_failure(manager)
             else:
                 print(f"错误: 客户端 '{args.name}' 不存在", file=sys.stderr)
                 sys.exit(1)
 
+        elif args.command == "remove":
+            names = _select_peer_names(manager, args)
+            if not names:
+                print("没有匹配的客户端")
+                sys.exit(1)
+            if not args.yes:
+                confirm = input(f"确定删除 {len(names)} 个客户端? (y/n) [n]: ").strip().lower()
+                if confirm != 'y':
+                    print("已取消")
+                    sys.exit(0)
+            removed = _run_per_shard(
+                manager, names, lambda group: manager.remove_peers(group, sync_remote=not args.no_sync))
+            print(f"已删除 {len(removed)} 个客户端")
+            _report_missing(names, removed)
+            if not removed:
+                sys.exit(1)
+
+        elif args.command == "toggle" and args.name and args.enable is None:
+            _switch_to_peer_shard(manager, args.name)
+            result = manager.toggle_peer(args.name, sync_remote=not args.no_sync)
+            if result is None:
+                print(f"错误: 客户端 '{args.name}' 不存在", file=sys.stderr)
+                sys.exit(1)
+            print(f"客户端 '{args.name}' 已{'启用' if result else '禁用'}")
+            _warn_sync_failure(manager)
+
+        elif args.command == "toggle":
+            if args.enable is None:
+                print("错误: 批量操作需要指定 --enable 或 --disable", file=sys.stderr)
+                sys.exit(1)
+            names = _select_peer_names(manager, args)
+            changed = _run_per_shard(
+                manager, names,
+                lambda group: manager.toggle_peers(group, args.enable, sync_remote=not args.no_sync))
+            print(f"已{'启用' if args.enable else '禁用'} {len(changed)} 个客户端")
+            _report_missing(names, changed)
+
+        elif args.command == "list" and args.format != "text":
+            from .database import PEER_LIST_FIELDS
+            from .output import write_rows
+            from .sharding import endpoint_shards
+
+            # 设置了分片策略时列出所有分片，并增加 interface 列
+            sharded = len(endpoint_shards(manager)) > 1
+            rows = ({
+                "name": p.name, "address": p.address, "enabled": p.enabled,
+                "imported": not p.has_private_key, "listen_port": p.listen_port,
+                "mtu": p.mtu, "dns": p.dns, "created_at": p.created_at,
+                **({"interface": server.interface} if sharded else {}),
+            } for server in _each_shard(manager)
+                for p in manager.iter_peer_summaries(**_list_filters(args)))
+            write_rows(rows, args.format, PEER_LIST_FIELDS + (["interface"] if sharded else []))
+
         elif args.command == "list":
-            if not manager.peers:
-                print(f"没有客户端 [{manager.server.endpoint}]")
-            else:
-                print(f"客户端列表 [{manager.server.endpoint}]:")
-                for p in manager.peers:
+            from .sharding import endpoint_shards
+
+            filters = _list_filters(args)
+            sharded = len(endpoint_shards(manager)) > 1
+            found = False
+            for server in _each_shard(manager):
+                peers = manager.get_peer_summaries(**filters)
+                if not peers:
+                    continue
+                found = True
+                # 分片时标明客户端所在的接口
+                label = f"{server.endpoint}:{server.interface}" if sharded else server.endpoint
+                print(f"客户端列表 [{label}]:")
+                for p in peers:
                     status = "✓" if p.enabled else "✗"
-                    imported = " [导入]" if not p.private_key else ""
+                    imported = " [导入]" if not p.has_private_key else ""
                     port_info = f"Port:{p.listen_port}" if p.listen_port else ""
                     print(f"{status} {p.name}{imported}\t{p.address}\t{port_info}\tMTU:{p.mtu}\t{p.created_at[:10]}")
+            if not found and any(v is not None for v in filters.values()):
+                print(f"没有匹配的客户端 [{manager.server.endpoint}]")
+            elif not found:
+                print(f"没有客户端 [{manager.server.endpoint}]")
 
         elif args.command == "export":
+            _switch_to_peer_shard(manager, args.name)
             peer = manager.db.get_peer_by_name(args.name, manager.server_id)
             if not peer:
                 print(f"错误: 客户端 '{args.name}' 不存在", file=sys.stderr)
@@ -717,6 +1579,24 @@ def main():
                     path = manager.export_client_config(args.name)
                     print(f"\n已保存到: {path}", file=sys.stderr)
 
+        elif args.command == "export-all":
+            if args.changed:
+                pending = manager.get_changed_exports()
+            else:
+                pending = [(p.name, "") for p in manager.get_peer_summaries() if p.has_private_key]
+            if not pending:
+                print("没有需要导出的客户端配置")
+                return
+            for name, reason in pending:
+                print(f"  {name}\t{reason}" if reason else f"  {name}")
+            if args.dry_run:
+                print(f"需要导出 {len(pending)} 个客户端配置 (dry-run，未写入)")
+                return
+            exported = manager.export_client_configs([name for name, _ in pending])
+            print(f"已导出 {len(exported)} 个客户端配置到 {manager.export_dir}")
+            if args.changed:
+                print(f"需要重新分发配置的客户端: {len(exported)} 个")
+
         elif args.command == "server":
             path = manager.export_server_config()
             print(f"服务端配置已导出: {path}")
@@ -726,12 +1606,25 @@ def main():
             if not manager.server.private_key:
                 print("服务端未初始化", file=sys.stderr)
                 sys.exit(1)
+            if args.format != "text":
+                from .output import write_object
+
+                write_object({
+                    "id": manager.server.id,
+                    "interface": manager.server.interface,
+                    "public_key": manager.server.public_key,
+                    "address": manager.server.address,
+                    "listen_port": manager.server.listen_port,
+                    "endpoint": manager.server.endpoint,
+                    "peers": manager.count_peers(),
+                }, args.format)
+                return
             print(f"接口: {manager.server.interface}")
             print(f"公钥: {manager.server.public_key}")
             print(f"地址: {manager.server.address}")
             print(f"端口: {manager.server.listen_port}")
             print(f"Endpoint: {manager.server.endpoint}")
-            print(f"客户端数: {len(manager.peers)}")
+            print(f"客户端数: {manager.count_peers()}")
 
         elif args.command == "ssh":
             success, msg = manager.setup_ssh(args.host, args.port, args.user)
@@ -749,7 +1642,143 @@ def main():
                 print(f"同步失败: {msg}", file=sys.stderr)
                 sys.exit(1)
 
-        elif args.command == "remote-status":
+        elif args.command == "sync-mode":
+            manager.set_sync_deferred(args.mode == "deferred")
+            if args.mode == "deferred":
+                print(f"已启用延迟同步 [{manager.server.endpoint}:{manager.server.interface}]")
+                print("修改将在执行 flush 或常驻服务后台合并同步")
+            else:
+                print(f"已切换为立即同步 [{manager.server.endpoint}:{manager.server.interface}]")
+
+        elif args.command == "flush":
+            server_ids = None if args.all else [manager.server_id]
+            results = manager.flush_all_pending_sync(
+                server_ids, debounce=args.debounce, max_wait=args.max_wait,
+                wait=not args.no_wait
+            )
+            handled = {server.id for server, _, _ in results}
+            waiting = [manager.db.get_server(sid) for sid in manager.db.get_dirty_server_ids()
+                       if sid not in handled and (server_ids is None or sid in server_ids)]
+            if not results and not waiting:
+                print("没有待同步的变更")
+            failed = False
+            for server, success, msg in results:
+                mark = "✓" if success else "✗"
+                print(f"{mark} {server.endpoint}:{server.interface}\t{msg}")
+                failed = failed or not success
+            for server in waiting:
+                print(f"… {server.endpoint}:{server.interface}\t有待同步的变更，仍在防抖窗口内")
+            if failed:
+                sys.exit(1)
+
+        elif args.command == "prune":
+            # 设置了分片策略时检查 endpoint 的所有分片（同一主机，一次 wg show all dump）
+            from .sharding import endpoint_shards
+
+            _, interfaces = manager.get_host_statuses()
+            sharded = len(endpoint_shards(manager)) > 1
+            found = []
+            for server in _each_shard(manager):
+                if server.interface not in interfaces:
+                    raise RuntimeError(f"远程接口 {server.interface} 未运行")
+                statuses = {status.public_key: status for status in interfaces[server.interface]}
+                stale = manager.find_stale_peers(args.stale, statuses)
+                if stale:
+                    found.append((server, stale, statuses))
+            if not found:
+                print("没有失效的客户端")
+                return
+            action = "删除" if args.remove else "禁用"
+            total = sum(len(stale) for _, stale, _ in found)
+            print(f"发现 {total} 个失效客户端:")
+            for server, stale, statuses in found:
+                shard = f"{server.interface}\t" if sharded else ""
+                for p in stale:
+                    status = statuses.get(p.public_key)
+                    if status and status.latest_handshake:
+                        last = datetime.fromtimestamp(status.latest_handshake).isoformat(sep=" ")
+                    else:
+                        last = "从未握手"
+                    print(f"  {shard}{p.name}\t{p.address}\t{last}")
+            if args.dry_run:
+                print(f"\n(dry-run) 以上客户端将被{action}")
+                return
+            failed = False
+            for server, stale, _ in found:
+                manager.switch_server(server.id)
+                success, msg = manager.prune_peers(stale, remove=args.remove,
+                                                   sync_remote=not args.no_sync)
+                if not success:
+                    print(f"同步失败 [{server.endpoint}:{server.interface}]: {msg}", file=sys.stderr)
+                    failed = True
+            print(f"\n已{action} {total} 个客户端")
+            if failed:
+                sys.exit(1)
+
+        elif args.command == "rotate":
+            if args.server_key and args.peers:
+                print("错误: --peers 只能与 --psk 一起使用", file=sys.stderr)
+                sys.exit(1)
+
+            if args.psk:
+                # 设置了分片策略时轮换所有分片中匹配的客户端，每个分片一次远程下发
+                rotated, imported, exported = [], [], []
+                for _ in _each_shard(manager):
+                    shard_rotated = manager.rotate_preshared_keys(args.peers,
+                                                                  sync_remote=not args.no_sync)
+                    imported += [p.name for p in manager.iter_peer_summaries(match=args.peers)
+                                 if not p.has_private_key]
+                    if shard_rotated:
+                        _warn_sync_failure(manager)
+                        # 只重新导出已导出过的配置
+                        exported += manager.reexport_client_configs([p.name for p in shard_rotated])
+                    rotated += shard_rotated
+                if imported:
+                    print(f"跳过 {len(imported)} 个导入的客户端（没有私钥，无法分发新配置）: "
+                          f"{', '.join(imported[:10])}" + (" ..." if len(imported) > 10 else ""),
+                          file=sys.stderr)
+                if not rotated:
+                    print("没有匹配的客户端")
+                    return
+                print(f"已轮换 {len(rotated)} 个客户端的预共享密钥")
+                affected = [p.name for p in rotated]
+            else:
+                if not args.yes:
+                    confirm = input("轮换服务端密钥后所有客户端都需要更新配置，确定继续? (y/n) [n]: ").strip().lower()
+                    if confirm != 'y':
+                        print("已取消")
+                        sys.exit(0)
+                server = manager.rotate_server_key(sync_remote=not args.no_sync)
+                print(f"服务端密钥已轮换，新公钥: {server.public_key}")
+                result = manager.last_sync_result
+                if result and not result[0]:
+                    print(f"警告: {result[1]}", file=sys.stderr)
+                affected = [p.name for p in manager.get_peer_summaries() if p.has_private_key]
+                # 只重新导出已导出过的配置
+                exported = manager.reexport_client_configs(affected)
+
+            if exported:
+                print(f"已重新导出 {len(exported)} 个客户端配置到 {manager.export_dir}")
+            print(f"需要重新分发配置的客户端: {len(affected)} 个")
+
+        elif args.command == "replay":
+            server_ids = manager.db.get_journal_server_ids() if args.all else [manager.server_id]
+            failed = False
+            for server_id in server_ids:
+                if server_id != manager.server_id:
+                    manager.switch_server(server_id)
+                pending = manager.pending_remote_ops()
+                if not pending:
+                    print(f"没有待同步的操作 [{manager.server.endpoint}:{manager.server.interface}]")
+                    continue
+                success, msg = manager.replay_journal()
+                mark = "✓" if success else "✗"
+                print(f"{mark} {manager.server.endpoint}:{manager.server.interface}\t{msg}")
+                failed = failed or not success
+            if failed:
+                sys.exit(1)
+
+        elif args.command == "remote-status" and args.raw:
             success, output = manager.get_remote_status()
             if success:
                 print(output)
@@ -757,6 +1786,64 @@ def main():
                 print(f"获取远程状态失败: {output}", file=sys.stderr)
                 sys.exit(1)
 
+        elif args.command == "remote-status":
+            from .config import STATUS_CACHE_TTL
+
+            if args.watch:
+                _watch_remote_status(manager, args.watch)
+            else:
+                _print_remote_status(manager, STATUS_CACHE_TTL if args.ttl is None else args.ttl)
+
+        elif args.command == "health":
+            from dataclasses import asdict
+            from .fleet import health_check
+
+            server_ids = None if args.all else [manager.server_id]
+            results = health_check(manager, server_ids, args.workers, args.deadline)
+            if args.format != "text":
+                from .output import write_rows
+
+                fields = [f for f in asdict(results[0])] + ["ok"] if results else ["ok"]
+                write_rows(({**asdict(h), "ok": h.ok} for h in results), args.format, fields)
+            elif not results:
+                print("没有配置 SSH 的服务端")
+            else:
+                _print_health(results)
+            if not all(h.ok for h in results):
+                sys.exit(1)
+
+        elif args.command == "shard":
+            _run_shard(manager, args)
+
+        elif args.command == "routes":
+            _run_routes(manager, args)
+
+        elif args.command == "topology":
+            _run_topology(manager, args)
+
+        elif args.command == "drift":
+            from .fleet import drift_check
+
+            server_ids = None if args.all else [manager.server_id]
+            checked, entries = drift_check(manager, server_ids, args.workers, args.deadline)
+            if args.format != "text":
+                from dataclasses import asdict, fields
+                from .models import DriftEntry
+                from .output import write_rows
+
+                write_rows((asdict(e) for e in entries), args.format,
+                           [f.name for f in fields(DriftEntry)])
+            elif not checked:
+                print("没有配置 SSH 的服务端")
+            else:
+                _print_drift(checked, entries)
+            if entries:
+                sys.exit(1)
+
+    except BrokenPipeError:
+        # 输出被管道截断 (如 list --format ndjson | head)，静默退出
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
     except Exception as e:
         print(f"错误: {e}", file=sys.stderr)
         sys.exit(1)
@@ -1,12 +1,17 @@
 """配置常量"""
 
+import os
 import random
 from pathlib import Path
 
-# 本地配置目录
-CONFIG_DIR = Path.home() / ".wg_manager"
+# 本地配置目录，可通过 WG_MANAGER_HOME 指定（如指向 dev seed 生成的测试数据）
+CONFIG_DIR = Path(os.environ.get("WG_MANAGER_HOME") or Path.home() / ".wg_manager")
 DB_FILE = CONFIG_DIR / "wg_manager.db"
 EXPORT_DIR = CONFIG_DIR / "clients"
+SOCKET_FILE = CONFIG_DIR / "wg-manager.sock"  # serve 命令默认监听的 Unix Socket
+
+# 设置为 1 时 SSH 主机 "local:<目录>" 使用本地模拟主机（仅限源码目录中的开发和压测）
+FAKE_HOSTS_ENV = "WG_MANAGER_FAKE_HOSTS"
 
 # WireGuard 默认配置
 DEFAULT_ADDRESS = "10.0.0.1/24"
@@ -18,6 +23,9 @@ DEFAULT_MTU = 1280
 # 远程服务器 WireGuard 配置路径
 REMOTE_WG_DIR = "/etc/wireguard"
 
+# 远程状态缓存有效期（秒），多个进程查看同一主机时共享，0 表示不使用缓存
+STATUS_CACHE_TTL = 5
+
 
 def generate_random_port() -> int:
     """生成随机监听端口 (10000-60000)"""
@@ -1,8 +1,12 @@
 """WireGuard 密钥生成模块"""
 
+import base64
+import secrets
 import subprocess
 from typing import Optional
 
+from .timing import timed
+
 
 class WireGuardKeyError(Exception):
     """密钥操作错误"""
@@ -25,6 +29,7 @@ def run_wg_command(args: list[str]) -> tuple[bool, str]:
         return False, "未找到 wg 命令，请确保已安装 WireGuard"
 
 
+@timed("crypto.genkey")
 def generate_private_key() -> str:
     """生成私钥"""
     success, result = run_wg_command(["wg", "genkey"])
@@ -33,6 +38,7 @@ def generate_private_key() -> str:
     return result
 
 
+@timed("crypto.pubkey")
 def generate_public_key(private_key: str) -> str:
     """从私钥生成公钥"""
     try:
@@ -55,9 +61,20 @@ def generate_keypair() -> tuple[str, str]:
     return private_key, public_key
 
 
+@timed("crypto.genpsk")
 def generate_preshared_key() -> str:
     """生成预共享密钥"""
     success, result = run_wg_command(["wg", "genpsk"])
     if not success:
         raise WireGuardKeyError(f"生成预共享密钥失败: {result}")
     return result
+
+
+@timed("crypto.genpsk_batch")
+def generate_preshared_keys(count: int) -> list[str]:
+    """批量生成预共享密钥
+
+    预共享密钥就是 32 字节随机数的 base64 编码（与 wg genpsk 相同），
+    直接使用 secrets 生成，避免每个密钥启动一次 wg 进程。
+    """
+    return [base64.b64encode(secrets.token_bytes(32)).decode() for _ in range(count)]
@@ -0,0 +1,306 @@
+"""常驻服务 - 通过 Unix Socket 提供 JSON API
+
+每行一个 JSON 请求，每行一个 JSON 响应:
+
+    {"op": "add", "server": "vpn.example.com:wg0", "name": "phone"}
+    {"ok": true, "result": {"name": "phone", "address": "10.0.0.2/32", ...}}
+
+同一服务端的请求串行执行，不同服务端的请求并行执行。
+设置 WG_MANAGER_PROFILE（或 serve --profile）时请求和延迟同步在 cProfile 下串行执行，
+退出时写入 pstats 文件。
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from .config import DB_FILE, DEFAULT_DNS, DEFAULT_MTU
+from .database import Database
+from .manager import ServerHandle, WireGuardManager
+from .timing import Profiler, get_profiler
+
+
+class DaemonError(Exception):
+    """请求处理错误"""
+    pass
+
+
+class ManagerPool:
+    """按服务端缓存句柄 (ServerHandle)，锁为进程内共享的服务端锁 (server_lock)
+
+    同一主机上的服务端共享 SSH 主连接。
+    """
+
+    def __init__(self, db: Database, ssh_control_dir: Path):
+        self.db = db
+        self.root = WireGuardManager(db=db, ssh_control_dir=ssh_control_dir)
+
+    def resolve(self, request: dict) -> int:
+        """根据 server_id 或 server ("endpoint" / "endpoint:interface") 定位服务端"""
+        if request.get("server_id"):
+            server = self.db.get_server(int(request["server_id"]))
+        elif request.get("server"):
+            endpoint, _, interface = str(request["server"]).partition(":")
+            if interface:
+                server = self.db.get_server_by_endpoint_and_interface(endpoint, interface)
+            else:
+                server = self.db.get_server_by_endpoint(endpoint)
+        else:
+            server = self.db.get_first_server()
+        if not server:
+            raise DaemonError("服务端不存在")
+        return server.id
+
+    @staticmethod
+    def has_interface(request: dict) -> bool:
+        """请求是否指定了具体接口 ("endpoint:interface" 或 server_id)"""
+        return ":" in str(request.get("server", "")) or bool(request.get("server_id"))
+
+    def run(self, server_id: int, op: str, request: dict) -> dict:
+        """在服务端锁内执行请求"""
+        manager, lock = self.get(server_id)
+        with lock:
+            manager.reload()
+            return SERVER_OPS[op](manager, request)
+
+    def place(self, server_id: int, request: dict) -> int:
+        """add 未指定接口时按 endpoint 的分片策略选择服务端"""
+        if self.has_interface(request):
+            return server_id
+        from .sharding import place_peer
+
+        placed = place_peer(self.root.server_handle(server_id), request["name"])
+        if not placed:
+            return server_id
+        shard, created = placed
+        if created:
+            print(f"已自动创建分片 {shard.endpoint}:{shard.interface} ({shard.address})，"
+                  f"请在防火墙中放行 UDP 端口 {shard.listen_port}", file=sys.stderr, flush=True)
+        return shard.id
+
+    def locate(self, server_id: int, request: dict) -> int:
+        """remove/toggle/export 未指定接口时在 endpoint 的所有分片中查找客户端"""
+        if self.has_interface(request):
+            return server_id
+        from .sharding import locate_peer
+
+        shard = locate_peer(self.root.server_handle(server_id), request["name"])
+        return shard.id if shard else server_id
+
+    def get(self, server_id: int) -> tuple[ServerHandle, threading.RLock]:
+        """获取服务端对应的句柄和锁"""
+        handle = self.root.server_handle(server_id)
+        return handle, handle.lock
+
+    def flush_pending(self, debounce: float):
+        """合并执行所有服务端的延迟同步
+
+        失败的服务端保留待同步标记，下一轮重试；失败原因输出到 stderr。
+        """
+        for server_id in self.db.get_dirty_server_ids():
+            manager, lock = self.get(server_id)
+            try:
+                with lock:
+                    manager.reload()
+                    result = manager.flush_pending_sync(debounce)
+            except Exception as e:
+                result = (False, f"{type(e).__name__}: {e}")
+            if result and not result[0]:
+                server = manager.server
+                print(f"延迟同步失败 [{server.endpoint}:{server.interface}]: {result[1]}",
+                      file=sys.stderr, flush=True)
+
+    def close(self):
+        """关闭所有 SSH 主连接"""
+        self.root.close()
+
+
+# ========== 请求处理 ==========
+
+def _op_add(manager: WireGuardManager, request: dict) -> dict:
+    name = request["name"]
+    peer = manager.add_peer(name, request.get("dns", DEFAULT_DNS),
+                            int(request.get("mtu", DEFAULT_MTU)),
+                            sync_remote=request.get("sync", True))
+    return {
+        "name": peer.name,
+        "address": peer.address,
+        "listen_port": peer.listen_port,
+        "public_key": peer.public_key,
+        "config": manager.get_client_config(name)
+    }
+
+
+def _op_remove(manager: WireGuardManager, request: dict) -> dict:
+    if not manager.remove_peer(request["name"], sync_remote=request.get("sync", True)):
+        raise DaemonError(f"客户端 '{request['name']}' 不存在")
+    return {"name": request["name"]}
+
+
+def _op_toggle(manager: WireGuardManager, request: dict) -> dict:
+    enabled = manager.toggle_peer(request["name"], sync_remote=request.get("sync", True))
+    if enabled is None:
+        raise DaemonError(f"客户端 '{request['name']}' 不存在")
+    return {"name": request["name"], "enabled": enabled}
+
+
+def _op_export(manager: WireGuardManager, request: dict) -> dict:
+    return {"name": request["name"], "config": manager.get_client_config(request["name"])}
+
+
+def _op_sync(manager: WireGuardManager, request: dict) -> dict:
+    success, msg = manager.sync_to_remote()
+    if not success:
+        raise DaemonError(msg)
+    return {"message": msg}
+
+
+SERVER_OPS: dict[str, Callable[[WireGuardManager, dict], dict]] = {
+    "add": _op_add,
+    "remove": _op_remove,
+    "toggle": _op_toggle,
+    "export": _op_export,
+    "sync": _op_sync,
+}
+
+# 只给出 endpoint 时按分片策略定位服务端的操作
+SHARD_OPS = {"add", "remove", "toggle", "export"}
+
+
+def handle_request(pool: ManagerPool, request: dict) -> dict:
+    """处理单个请求，返回响应"""
+    op = request.get("op")
+    try:
+        if op == "ping":
+            result = {"pong": True}
+        elif op == "servers":
+            result = [
+                {"id": s.id, "endpoint": s.endpoint, "interface": s.interface,
+                 "address": s.address, "listen_port": s.listen_port}
+                for s in pool.db.get_servers()
+            ]
+        elif op in SERVER_OPS:
+            server_id = pool.resolve(request)
+            if op in SHARD_OPS and not pool.has_interface(request):
+                # 按分片策略选择/查找分片与后续操作在 endpoint 第一个接口的锁内完成，
+                # 避免并发请求在取得分片锁之前改变分片的负载或客户端
+                _, base_lock = pool.get(server_id)
+                with base_lock:
+                    if op == "add":
+                        server_id = pool.place(server_id, request)
+                    else:
+                        server_id = pool.locate(server_id, request)
+                    result = pool.run(server_id, op, request)
+            else:
+                result = pool.run(server_id, op, request)
+        else:
+            raise DaemonError(f"未知操作: {op}")
+    except KeyError as e:
+        return {"ok": False, "error": f"缺少参数: {e.args[0]}"}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "result": result}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("请求必须是 JSON 对象")
+            except ValueError as e:
+                response = {"ok": False, "error": f"无效请求: {e}"}
+            else:
+                response = self.server.call(handle_request, self.server.pool, request)
+                if "id" in request:
+                    response["id"] = request["id"]
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, pool: ManagerPool, profiler: Optional[Profiler] = None):
+        self.pool = pool
+        self.profiler = profiler
+        super().__init__(socket_path, _RequestHandler)
+
+    def call(self, func: Callable, *args):
+        """启用 profile 时在 cProfile 下执行"""
+        if self.profiler:
+            return self.profiler.call(func, *args)
+        return func(*args)
+
+
+def _flush_loop(server: _Server, debounce: float, stop: threading.Event):
+    """后台合并执行延迟同步"""
+    while not stop.wait(min(debounce, 1.0)):
+        try:
+            server.call(server.pool.flush_pending, debounce)
+        except Exception as e:
+            print(f"延迟同步失败: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+
+
+def serve(socket_path: Path, db_path: Path = DB_FILE, debounce: float = 2.0,
+          profiler: Optional[Profiler] = None):
+    """启动常驻服务（阻塞直到收到 SIGINT/SIGTERM）
+
+    启用延迟同步的服务端由后台线程在防抖窗口结束后合并下发。
+    未传入 profiler 时按 WG_MANAGER_PROFILE 环境变量决定是否分析请求。
+    """
+    profiler = profiler or get_profiler()
+    db = Database(db_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        socket_path.unlink()
+
+    with tempfile.TemporaryDirectory(prefix="wg-manager-ssh-") as control_dir:
+        pool = ManagerPool(db, Path(control_dir))
+        # 以 0600 创建 socket：bind 之后再 chmod 会留下其他本地用户可以连接的窗口
+        # （export 会返回私钥）。此时尚未启动其他线程，临时修改 umask 是安全的
+        previous_umask = os.umask(0o077)
+        try:
+            server = _Server(str(socket_path), pool, profiler)
+        finally:
+            os.umask(previous_umask)
+        os.chmod(socket_path, 0o600)
+
+        def _shutdown(sig, frame):
+            threading.Thread(target=server.shutdown).start()
+
+        signal.signal(signal.SIGTERM, _shutdown)
+        signal.signal(signal.SIGINT, _shutdown)
+        stop = threading.Event()
+        flusher = threading.Thread(target=_flush_loop, args=(server, debounce, stop), daemon=True)
+        flusher.start()
+        try:
+            server.serve_forever()
+        finally:
+            stop.set()
+            flusher.join()
+            server.server_close()
+            pool.close()
+            socket_path.unlink(missing_ok=True)
+            if profiler:
+                profiler.report()
+
+
+def request(socket_path: Path, payload: dict, timeout: Optional[float] = None) -> dict:
+    """向常驻服务发送单个请求"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(payload).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
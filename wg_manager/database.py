@@ -1,26 +1,122 @@
 """SQLite 数据库管理"""
 
+import ipaddress
+import json
 import sqlite3
+import threading
+from dataclasses import replace
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Union
 
-from .models import Peer, ServerConfig
+from .models import (JournalEntry, Peer, PeerSummary, ServerConfig, ShardPolicy, Topology,
+                     TopologyNode)
+from .timing import timed
+
+
+# list 等展示命令输出的客户端字段（不含密钥）
+PEER_LIST_FIELDS = ["name", "address", "enabled", "imported", "listen_port", "mtu", "dns", "created_at"]
+
+# 数据库结构版本，保存在 PRAGMA user_version 中；结构变更时递增
+SCHEMA_VERSION = 10
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# 地址的数值编码列，由 parse_address 生成，用于范围查询、空位查找和重叠检查
+ADDRESS_COLUMNS = {
+    "addr_int": "INTEGER",      # IPv4 地址
+    "addr_prefix": "INTEGER",   # IPv4 前缀长度
+    "addr6": "BLOB",            # IPv6 地址 (16 字节，按字节序比较即按地址大小比较)
+    "addr6_prefix": "INTEGER",  # IPv6 前缀长度
+}
+
+
+def parse_address(address: str) -> tuple[Optional[int], Optional[int], Optional[bytes], Optional[int]]:
+    """将地址文本编码为 (IPv4 整数, IPv4 前缀, IPv6 字节, IPv6 前缀)
+
+    address 可为 "10.0.0.5/32" 或逗号分隔的多个地址，每个地址族取第一个；
+    无法解析的部分对应项为 None。
+    """
+    v4 = v4_prefix = v6 = v6_prefix = None
+    for part in address.split(","):
+        try:
+            interface = ipaddress.ip_interface(part.strip())
+        except ValueError:
+            continue
+        if interface.version == 4 and v4 is None:
+            v4, v4_prefix = int(interface.ip), interface.network.prefixlen
+        elif interface.version == 6 and v6 is None:
+            v6, v6_prefix = interface.ip.packed, interface.network.prefixlen
+    return v4, v4_prefix, v6, v6_prefix
+
+
+def _address_column(network: IPNetwork) -> str:
+    return "addr_int" if network.version == 4 else "addr6"
+
+
+def _network_bounds(network: IPNetwork) -> tuple:
+    """网段的首尾地址，编码方式与 parse_address 一致"""
+    if network.version == 4:
+        return int(network.network_address), int(network.broadcast_address)
+    return network.network_address.packed, network.broadcast_address.packed
+
+
+PEER_INSERT_SQL = """
+    INSERT INTO peers (server_id, name, public_key, private_key, preshared_key,
+                       address, allowed_ips, dns, listen_port, mtu, created_at, enabled,
+                       addr_int, addr_prefix, addr6, addr6_prefix)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
 
 class Database:
     """SQLite 数据库管理"""
 
-    def __init__(self, db_path: Path):
+    def __init__(self, db_path: Path, readonly: bool = False, pooled: bool = True):
         self.db_path = db_path
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self._init_db()
-        self._migrate_db()
+        # 每个线程复用自己的连接，同一个 Database 可在线程池中共享；
+        # pooled=False 时每次操作新建连接
+        self._local = threading.local() if pooled else None
+        # 只读模式仅在数据库已存在且结构为最新时生效，否则仍需建表/迁移
+        self.readonly = readonly and db_path.exists() and self._schema_version() >= SCHEMA_VERSION
+        if not self.readonly:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            if self._schema_version() < SCHEMA_VERSION:
+                self._init_db()
+                self._migrate_db()
 
     def _get_conn(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
+        if self._local is not None:
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
+            return conn
+        return self._connect()
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, "conn", None) if self._local is not None else None
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            conn = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True)
+        else:
+            conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
+    def _schema_version(self) -> int:
+        """读取数据库结构版本"""
+        if not self.db_path.exists():
+            return 0
+        conn = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+
     def _init_db(self):
         """初始化数据库表"""
         with self._get_conn() as conn:
@@ -37,7 +133,12 @@ class Database:
                     post_down TEXT DEFAULT '',
                     ssh_host TEXT DEFAULT '',
                     ssh_port INTEGER DEFAULT 22,
-                    ssh_user TEXT DEFAULT 'root'
+                    ssh_user TEXT DEFAULT 'root',
+                    sync_deferred INTEGER DEFAULT 0,
+                    dirty_since REAL,
+                    dirty_at REAL,
+                    config_generation INTEGER DEFAULT 1,
+                    routes TEXT DEFAULT ''
                 )
             """)
             conn.execute("""
@@ -55,10 +156,68 @@ class Database:
                     mtu INTEGER DEFAULT 1280,
                     created_at TEXT NOT NULL,
                     enabled INTEGER DEFAULT 1,
+                    addr_int INTEGER,
+                    addr_prefix INTEGER,
+                    addr6 BLOB,
+                    addr6_prefix INTEGER,
+                    version INTEGER DEFAULT 1,
+                    exported_version INTEGER DEFAULT 0,
+                    exported_generation INTEGER DEFAULT 0,
                     UNIQUE(server_id, name),
                     FOREIGN KEY (server_id) REFERENCES server(id)
                 )
             """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS remote_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    server_id INTEGER NOT NULL,
+                    op TEXT NOT NULL,
+                    public_key TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    UNIQUE(server_id, public_key)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS status_cache (
+                    target TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL DEFAULT 0,
+                    claimed_at REAL NOT NULL DEFAULT 0,
+                    dump TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shard_policy (
+                    endpoint TEXT PRIMARY KEY,
+                    max_peers INTEGER NOT NULL,
+                    pool TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS topologies (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL DEFAULT 'mesh',
+                    interface TEXT NOT NULL DEFAULT 'wgm0',
+                    network TEXT NOT NULL,
+                    listen_port INTEGER NOT NULL DEFAULT 51900,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS topology_nodes (
+                    topology_id INTEGER NOT NULL,
+                    server_id INTEGER NOT NULL,
+                    private_key TEXT NOT NULL,
+                    public_key TEXT NOT NULL,
+                    address TEXT NOT NULL,
+                    routes TEXT DEFAULT '',
+                    hub INTEGER DEFAULT 0,
+                    pushed_hash TEXT DEFAULT '',
+                    PRIMARY KEY (topology_id, server_id),
+                    FOREIGN KEY (topology_id) REFERENCES topologies(id),
+                    FOREIGN KEY (server_id) REFERENCES server(id)
+                )
+            """)
             conn.commit()
 
     def _migrate_db(self):
@@ -77,16 +236,70 @@ class Database:
             if "server_id" not in columns:
                 conn.execute("ALTER TABLE peers ADD COLUMN server_id INTEGER DEFAULT 1")
 
+            # 变更跟踪: 客户端配置版本，以及最近一次导出时的客户端版本和服务端代数
+            for name in ("version", "exported_version", "exported_generation"):
+                if name not in columns:
+                    default = 1 if name == "version" else 0
+                    conn.execute(f"ALTER TABLE peers ADD COLUMN {name} INTEGER DEFAULT {default}")
+
+            missing = [name for name in ADDRESS_COLUMNS if name not in columns]
+            for name in missing:
+                conn.execute(f"ALTER TABLE peers ADD COLUMN {name} {ADDRESS_COLUMNS[name]}")
+            if missing:
+                # 由地址文本回填数值编码列
+                rows = conn.execute("SELECT id, address FROM peers").fetchall()
+                conn.executemany(
+                    "UPDATE peers SET addr_int = ?, addr_prefix = ?, addr6 = ?, addr6_prefix = ? "
+                    "WHERE id = ?",
+                    [(*parse_address(row[1]), row[0]) for row in rows]
+                )
+
+            # 检查 server 表字段
+            cursor = conn.execute("PRAGMA table_info(server)")
+            columns = [row[1] for row in cursor.fetchall()]
+
+            if "sync_deferred" not in columns:
+                conn.execute("ALTER TABLE server ADD COLUMN sync_deferred INTEGER DEFAULT 0")
+
+            if "dirty_since" not in columns:
+                conn.execute("ALTER TABLE server ADD COLUMN dirty_since REAL")
+
+            if "dirty_at" not in columns:
+                conn.execute("ALTER TABLE server ADD COLUMN dirty_at REAL")
+
+            if "config_generation" not in columns:
+                conn.execute("ALTER TABLE server ADD COLUMN config_generation INTEGER DEFAULT 1")
+
+            if "routes" not in columns:
+                conn.execute("ALTER TABLE server ADD COLUMN routes TEXT DEFAULT ''")
+
+            # 索引: 名称前缀匹配使用 UNIQUE(server_id, name) 自带的索引
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_peers_addr ON peers(server_id, addr_int)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_peers_addr6 ON peers(server_id, addr6)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_peers_created ON peers(server_id, created_at)")
+
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             conn.commit()
 
     # ========== 服务端管理 ==========
 
+    @timed("db.get_servers")
     def get_servers(self) -> list[ServerConfig]:
         """获取所有服务端"""
         with self._get_conn() as conn:
             rows = conn.execute("SELECT * FROM server ORDER BY id").fetchall()
             return [self._row_to_server(row) for row in rows]
 
+    @timed("db.get_server")
+    def get_first_server(self) -> Optional[ServerConfig]:
+        """获取第一个服务端（默认服务端）"""
+        with self._get_conn() as conn:
+            row = conn.execute("SELECT * FROM server ORDER BY id LIMIT 1").fetchone()
+            if row:
+                return self._row_to_server(row)
+        return None
+
+    @timed("db.get_server")
     def get_server(self, server_id: int = 1) -> Optional[ServerConfig]:
         """获取指定服务端配置"""
         with self._get_conn() as conn:
@@ -134,21 +347,38 @@ class Database:
             interface=row["interface"],
             endpoint=row["endpoint"],
             post_up=row["post_up"],
-            post_down=row["post_down"]
+            post_down=row["post_down"],
+            routes=row["routes"],
+            config_generation=row["config_generation"]
         )
 
+    @timed("db.save_server")
     def save_server(self, server: ServerConfig) -> ServerConfig:
-        """保存服务端配置（新增或更新）"""
+        """保存服务端配置（新增或更新）
+
+        更新时若公钥、地址、端口或 endpoint 改变（会出现在客户端配置中），
+        config_generation 递增，用于判断哪些已导出的客户端配置已过期。
+        额外路由不在这里保存，由 set_server_routes 修改。
+        """
         with self._get_conn() as conn:
             if server.id:
-                # 更新现有服务端
+                # 更新现有服务端（SET 中的列引用的是更新前的值）
                 conn.execute("""
-                    UPDATE server SET private_key = ?, public_key = ?, address = ?,
+                    UPDATE server SET
+                        config_generation = config_generation + (
+                            public_key != ? OR address != ? OR listen_port != ? OR endpoint != ?),
+                        private_key = ?, public_key = ?, address = ?,
                         listen_port = ?, interface = ?, endpoint = ?, post_up = ?, post_down = ?
                     WHERE id = ?
-                """, (server.private_key, server.public_key, server.address,
+                """, (server.public_key, server.address, server.listen_port, server.endpoint,
+                      server.private_key, server.public_key, server.address,
                       server.listen_port, server.interface, server.endpoint,
                       server.post_up, server.post_down, server.id))
+                row = conn.execute(
+                    "SELECT config_generation, routes FROM server WHERE id = ?", (server.id,)
+                ).fetchone()
+                if row:
+                    server = replace(server, config_generation=row[0], routes=row[1])
             else:
                 # 新增服务端
                 cursor = conn.execute("""
@@ -158,14 +388,27 @@ class Database:
                 """, (server.private_key, server.public_key, server.address,
                       server.listen_port, server.interface, server.endpoint,
                       server.post_up, server.post_down))
-                server.id = cursor.lastrowid
+                server = replace(server, id=cursor.lastrowid)
             conn.commit()
         return server
 
+    def set_server_routes(self, server_id: int, routes: str) -> Optional[ServerConfig]:
+        """设置服务端的额外路由，有变化时 config_generation 递增"""
+        with self._get_conn() as conn:
+            conn.execute(
+                "UPDATE server SET config_generation = config_generation + (routes != ?), "
+                "routes = ? WHERE id = ?",
+                (routes, routes, server_id)
+            )
+            conn.commit()
+        return self.get_server(server_id)
+
     def delete_server(self, server_id: int) -> bool:
         """删除服务端及其所有客户端"""
         with self._get_conn() as conn:
+            conn.execute("DELETE FROM remote_journal WHERE server_id = ?", (server_id,))
             conn.execute("DELETE FROM peers WHERE server_id = ?", (server_id,))
+            conn.execute("DELETE FROM topology_nodes WHERE server_id = ?", (server_id,))
             cursor = conn.execute("DELETE FROM server WHERE id = ?", (server_id,))
             conn.commit()
             return cursor.rowcount > 0
@@ -194,8 +437,274 @@ class Database:
             """, (host, port, user, server_id))
             conn.commit()
 
+    # ========== 延迟同步 ==========
+
+    def is_sync_deferred(self, server_id: int) -> bool:
+        """服务端是否启用延迟同步"""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT sync_deferred FROM server WHERE id = ?", (server_id,)
+            ).fetchone()
+            return bool(row and row["sync_deferred"])
+
+    def set_sync_deferred(self, server_id: int, deferred: bool):
+        """设置服务端同步模式"""
+        with self._get_conn() as conn:
+            conn.execute(
+                "UPDATE server SET sync_deferred = ? WHERE id = ?",
+                (1 if deferred else 0, server_id)
+            )
+            conn.commit()
+
+    def mark_dirty(self, server_id: int, now: float):
+        """标记服务端有待同步的变更"""
+        with self._get_conn() as conn:
+            conn.execute(
+                "UPDATE server SET dirty_since = COALESCE(dirty_since, ?), dirty_at = ? "
+                "WHERE id = ?",
+                (now, now, server_id)
+            )
+            conn.commit()
+
+    def get_dirty_state(self, server_id: int) -> Optional[tuple[float, float]]:
+        """获取 (首次标记时间, 最近标记时间)，未标记返回 None"""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT dirty_since, dirty_at FROM server WHERE id = ? AND dirty_at IS NOT NULL",
+                (server_id,)
+            ).fetchone()
+            if row:
+                return row["dirty_since"], row["dirty_at"]
+        return None
+
+    def get_dirty_server_ids(self) -> list[int]:
+        """获取所有有待同步变更的服务端 ID"""
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT id FROM server WHERE dirty_at IS NOT NULL ORDER BY dirty_since"
+            ).fetchall()
+            return [row["id"] for row in rows]
+
+    def clear_dirty(self, server_id: int, dirty_at: float) -> bool:
+        """清除待同步标记；若期间又有新变更（dirty_at 已变化）则保留"""
+        with self._get_conn() as conn:
+            cursor = conn.execute(
+                "UPDATE server SET dirty_since = NULL, dirty_at = NULL "
+                "WHERE id = ? AND dirty_at = ?",
+                (server_id, dirty_at)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    # ========== 远程操作日志 ==========
+
+    @timed("db.journal")
+    def append_journal(self, server_id: int, ops: list[tuple[str, str]], created_at: str):
+        """记录待同步操作 (op, public_key)；同一公钥只保留最新一条"""
+        with self._get_conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO remote_journal (server_id, op, public_key, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(server_id, op, public_key, created_at) for op, public_key in ops]
+            )
+            conn.commit()
+
+    @timed("db.journal")
+    def get_journal(self, server_id: int) -> list[JournalEntry]:
+        """按记录顺序获取待同步操作"""
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM remote_journal WHERE server_id = ? ORDER BY id",
+                (server_id,)
+            ).fetchall()
+            return [JournalEntry(id=row["id"], server_id=row["server_id"], op=row["op"],
+                                 public_key=row["public_key"], created_at=row["created_at"])
+                    for row in rows]
+
+    def count_journal(self, server_id: int) -> int:
+        """待同步操作数量"""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM remote_journal WHERE server_id = ?", (server_id,)
+            ).fetchone()
+            return row[0]
+
+    def get_journal_server_ids(self) -> list[int]:
+        """获取有待同步操作的服务端 ID"""
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT server_id FROM remote_journal ORDER BY server_id"
+            ).fetchall()
+            return [row["server_id"] for row in rows]
+
+    def clear_journal(self, server_id: int, max_id: Optional[int] = None):
+        """清除已同步的操作；max_id 之后新记录的操作保留"""
+        with self._get_conn() as conn:
+            if max_id is None:
+                conn.execute("DELETE FROM remote_journal WHERE server_id = ?", (server_id,))
+            else:
+                conn.execute(
+                    "DELETE FROM remote_journal WHERE server_id = ? AND id <= ?",
+                    (server_id, max_id)
+                )
+            conn.commit()
+
+    # ========== 远程状态缓存 ==========
+
+    def get_status_cache(self, target: str) -> Optional[tuple[float, str]]:
+        """获取主机状态缓存，返回 (采集时间, wg show all dump 输出)"""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT fetched_at, dump FROM status_cache WHERE target = ? AND dump IS NOT NULL",
+                (target,)
+            ).fetchone()
+            return (row[0], row[1]) if row else None
+
+    def claim_status_refresh(self, target: str, now: float, max_age: float,
+                             lease: float = 30) -> bool:
+        """申请刷新主机状态缓存
+
+        缓存仍有效，或其他进程在 lease 秒内已申请刷新时返回 False，
+        避免多个调用方同时对同一主机发起 SSH 请求。
+        """
+        with self._get_conn() as conn:
+            cursor = conn.execute("""
+                INSERT INTO status_cache (target, claimed_at) VALUES (?, ?)
+                ON CONFLICT(target) DO UPDATE SET claimed_at = excluded.claimed_at
+                WHERE fetched_at < ? AND claimed_at < ?
+            """, (target, now, now - max_age, now - lease))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def release_status_refresh(self, target: str):
+        """释放刷新申请（刷新失败时），其他调用方可以立即重新申请"""
+        with self._get_conn() as conn:
+            conn.execute("UPDATE status_cache SET claimed_at = 0 WHERE target = ?", (target,))
+            conn.commit()
+
+    def save_status_cache(self, target: str, fetched_at: float, dump: str):
+        """保存主机状态缓存（同时释放刷新申请）"""
+        with self._get_conn() as conn:
+            conn.execute("""
+                INSERT INTO status_cache (target, fetched_at, claimed_at, dump) VALUES (?, ?, 0, ?)
+                ON CONFLICT(target) DO UPDATE SET
+                    fetched_at = excluded.fetched_at, claimed_at = 0, dump = excluded.dump
+            """, (target, fetched_at, dump))
+            conn.commit()
+
+    # ========== 分片策略 ==========
+
+    def get_shard_policy(self, endpoint: str) -> Optional[ShardPolicy]:
+        """获取 endpoint 的分片策略"""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT endpoint, max_peers, pool FROM shard_policy WHERE endpoint = ?", (endpoint,)
+            ).fetchone()
+            return ShardPolicy(*row) if row else None
+
+    def set_shard_policy(self, policy: ShardPolicy):
+        """设置 endpoint 的分片策略"""
+        with self._get_conn() as conn:
+            conn.execute(
+                "INSERT INTO shard_policy (endpoint, max_peers, pool) VALUES (?, ?, ?) "
+                "ON CONFLICT(endpoint) DO UPDATE SET max_peers = excluded.max_peers, pool = excluded.pool",
+                (policy.endpoint, policy.max_peers, policy.pool)
+            )
+            conn.commit()
+
+    def delete_shard_policy(self, endpoint: str) -> bool:
+        """取消 endpoint 的分片策略（已创建的分片保留）"""
+        with self._get_conn() as conn:
+            cursor = conn.execute("DELETE FROM shard_policy WHERE endpoint = ?", (endpoint,))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    # ========== 站点互联拓扑 ==========
+
+    def get_topologies(self) -> list[Topology]:
+        """获取所有拓扑"""
+        with self._get_conn() as conn:
+            rows = conn.execute("SELECT * FROM topologies ORDER BY id").fetchall()
+            return [self._row_to_topology(row) for row in rows]
+
+    def get_topology(self, name: str) -> Optional[Topology]:
+        """按名称获取拓扑"""
+        with self._get_conn() as conn:
+            row = conn.execute("SELECT * FROM topologies WHERE name = ?", (name,)).fetchone()
+            return self._row_to_topology(row) if row else None
+
+    @staticmethod
+    def _row_to_topology(row: sqlite3.Row) -> Topology:
+        return Topology(id=row["id"], name=row["name"], kind=row["kind"],
+                        interface=row["interface"], network=row["network"],
+                        listen_port=row["listen_port"], created_at=row["created_at"])
+
+    def save_topology(self, topology: Topology) -> Topology:
+        """新增拓扑"""
+        with self._get_conn() as conn:
+            cursor = conn.execute(
+                "INSERT INTO topologies (name, kind, interface, network, listen_port, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (topology.name, topology.kind, topology.interface, topology.network,
+                 topology.listen_port, topology.created_at)
+            )
+            conn.commit()
+            return replace(topology, id=cursor.lastrowid)
+
+    def delete_topology(self, topology_id: int) -> bool:
+        """删除拓扑及其节点"""
+        with self._get_conn() as conn:
+            conn.execute("DELETE FROM topology_nodes WHERE topology_id = ?", (topology_id,))
+            cursor = conn.execute("DELETE FROM topologies WHERE id = ?", (topology_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def get_topology_nodes(self, topology_id: int) -> list[TopologyNode]:
+        """获取拓扑的所有节点（按加入顺序）"""
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM topology_nodes WHERE topology_id = ? ORDER BY rowid", (topology_id,)
+            ).fetchall()
+            return [TopologyNode(
+                topology_id=row["topology_id"], server_id=row["server_id"],
+                private_key=row["private_key"], public_key=row["public_key"],
+                address=row["address"], routes=row["routes"], hub=bool(row["hub"]),
+                pushed_hash=row["pushed_hash"]
+            ) for row in rows]
+
+    def add_topology_node(self, node: TopologyNode):
+        """添加拓扑节点"""
+        with self._get_conn() as conn:
+            conn.execute(
+                "INSERT INTO topology_nodes (topology_id, server_id, private_key, public_key, "
+                "address, routes, hub) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (node.topology_id, node.server_id, node.private_key, node.public_key,
+                 node.address, node.routes, int(node.hub))
+            )
+            conn.commit()
+
+    def remove_topology_node(self, topology_id: int, server_id: int) -> bool:
+        """移除拓扑节点"""
+        with self._get_conn() as conn:
+            cursor = conn.execute(
+                "DELETE FROM topology_nodes WHERE topology_id = ? AND server_id = ?",
+                (topology_id, server_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def set_topology_pushed(self, topology_id: int, hashes: dict[int, str]):
+        """记录节点最近一次成功下发的配置哈希 (server_id -> 哈希)"""
+        with self._get_conn() as conn:
+            conn.executemany(
+                "UPDATE topology_nodes SET pushed_hash = ? WHERE topology_id = ? AND server_id = ?",
+                [(digest, topology_id, server_id) for server_id, digest in hashes.items()]
+            )
+            conn.commit()
+
     # ========== 客户端管理 ==========
 
+    @timed("db.get_peers")
     def get_peers(self, server_id: int = 1) -> list[Peer]:
         """获取指定服务端的所有客户端"""
         with self._get_conn() as conn:
@@ -205,6 +714,72 @@ class Database:
             ).fetchall()
             return [self._row_to_peer(row) for row in rows]
 
+    def iter_peer_summaries(self, server_id: int = 1, name_glob: Optional[str] = None,
+                            network: Optional[IPNetwork] = None,
+                            enabled: Optional[bool] = None,
+                            created_after: Optional[str] = None) -> Iterator[PeerSummary]:
+        """逐行读取客户端摘要，可按条件过滤
+
+        直接迭代游标而非 fetchall，只查询摘要所需的列，不读取私钥和预共享密钥。
+        过滤条件均在 SQL 中执行：name_glob 为 GLOB 模式（前缀模式可走名称索引），
+        network 为 IPv4/IPv6 网段（地址索引范围扫描），created_after 为 ISO 时间字符串。
+        """
+        where = ["server_id = ?"]
+        params: list = [server_id]
+        if name_glob is not None:
+            where.append("name GLOB ?")
+            params.append(name_glob)
+        if network is not None:
+            where.append(f"{_address_column(network)} BETWEEN ? AND ?")
+            params.extend(_network_bounds(network))
+        if enabled is not None:
+            where.append("enabled = ?")
+            params.append(1 if enabled else 0)
+        if created_after is not None:
+            where.append("created_at > ?")
+            params.append(created_after)
+        cursor = self._get_conn().execute(f"""
+            SELECT id, name, public_key, address, enabled, listen_port, mtu, dns, created_at,
+                   COALESCE(private_key, '') != '' AS has_private_key
+            FROM peers WHERE {" AND ".join(where)} ORDER BY created_at
+        """, params)
+        # 按列顺序构造，避免逐列按名称取值
+        for row in cursor:
+            yield PeerSummary(row[0], row[1], row[2], row[3], bool(row[4]),
+                              row[5], row[6], row[7], row[8], bool(row[9]))
+
+    @timed("db.get_peer_summaries")
+    def get_peer_summaries(self, server_id: int = 1, **filters) -> list[PeerSummary]:
+        """获取指定服务端的客户端摘要列表，过滤条件同 iter_peer_summaries"""
+        return list(self.iter_peer_summaries(server_id, **filters))
+
+    def count_peers(self, server_id: int = 1) -> int:
+        """统计指定服务端的客户端数量"""
+        with self._get_conn() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM peers WHERE server_id = ?", (server_id,)
+            ).fetchone()[0]
+
+    def count_peers_by_server(self) -> dict[int, int]:
+        """统计每个服务端的客户端数量 {server_id: 数量}"""
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT server_id, COUNT(*) FROM peers GROUP BY server_id"
+            ).fetchall()
+            return {row[0]: row[1] for row in rows}
+
+    @timed("db.get_peers_by_names")
+    def get_peers_by_names(self, names: list[str], server_id: int = 1) -> list[Peer]:
+        """根据名称批量获取客户端（单条 SQL），不存在的名称被忽略"""
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM peers WHERE server_id = ? "
+                "AND name IN (SELECT value FROM json_each(?)) ORDER BY created_at",
+                (server_id, json.dumps(list(names)))
+            ).fetchall()
+            return [self._row_to_peer(row) for row in rows]
+
+    @timed("db.get_peer")
     def get_peer_by_name(self, name: str, server_id: int = 1) -> Optional[Peer]:
         """根据名称获取客户端"""
         with self._get_conn() as conn:
@@ -239,21 +814,31 @@ class Database:
             enabled=bool(row["enabled"])
         )
 
+    @staticmethod
+    def _peer_params(peer: Peer) -> tuple:
+        """PEER_INSERT_SQL 的参数，地址编码列由 address 计算"""
+        return (peer.server_id, peer.name, peer.public_key, peer.private_key,
+                peer.preshared_key, peer.address, peer.allowed_ips, peer.dns,
+                peer.listen_port, peer.mtu, peer.created_at, 1 if peer.enabled else 0,
+                *parse_address(peer.address))
+
+    @timed("db.add_peer")
     def add_peer(self, peer: Peer) -> Peer:
         """添加客户端"""
         with self._get_conn() as conn:
-            cursor = conn.execute("""
-                INSERT INTO peers (server_id, name, public_key, private_key, preshared_key,
-                                   address, allowed_ips, dns, listen_port, mtu,
-                                   created_at, enabled)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (peer.server_id, peer.name, peer.public_key, peer.private_key,
-                  peer.preshared_key, peer.address, peer.allowed_ips, peer.dns,
-                  peer.listen_port, peer.mtu, peer.created_at, 1 if peer.enabled else 0))
+            cursor = conn.execute(PEER_INSERT_SQL, self._peer_params(peer))
+            conn.commit()
+        return replace(peer, id=cursor.lastrowid)
+
+    @timed("db.add_peers")
+    def add_peers(self, peers: list[Peer]) -> int:
+        """批量添加客户端（单个事务），返回添加数量"""
+        with self._get_conn() as conn:
+            cursor = conn.executemany(PEER_INSERT_SQL, [self._peer_params(peer) for peer in peers])
             conn.commit()
-            peer.id = cursor.lastrowid
-        return peer
+            return cursor.rowcount
 
+    @timed("db.remove_peer")
     def remove_peer(self, name: str, server_id: int = 1) -> bool:
         """删除客户端"""
         with self._get_conn() as conn:
@@ -264,6 +849,7 @@ class Database:
             conn.commit()
             return cursor.rowcount > 0
 
+    @timed("db.toggle_peer")
     def toggle_peer(self, name: str, server_id: int = 1) -> Optional[bool]:
         """切换客户端启用状态"""
         with self._get_conn() as conn:
@@ -281,17 +867,104 @@ class Database:
                 return bool(new_status)
         return None
 
-    def get_used_ips(self, server_id: int = 1) -> set[int]:
-        """获取已使用的 IP 地址最后一段"""
+    @timed("db.set_peers_enabled")
+    def set_peers_enabled(self, names: list[str], enabled: bool,
+                          server_id: int = 1) -> int:
+        """批量设置客户端启用状态（单条 SQL），返回受影响行数"""
+        with self._get_conn() as conn:
+            cursor = conn.execute(
+                "UPDATE peers SET enabled = ? WHERE server_id = ? "
+                "AND name IN (SELECT value FROM json_each(?))",
+                (1 if enabled else 0, server_id, json.dumps(list(names)))
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    @timed("db.set_preshared_keys")
+    def set_preshared_keys(self, keys: dict[int, str]) -> int:
+        """批量更新客户端预共享密钥 {peer_id: psk}（单个事务），返回更新行数"""
+        with self._get_conn() as conn:
+            cursor = conn.executemany(
+                "UPDATE peers SET preshared_key = ?, version = version + 1 WHERE id = ?",
+                [(psk, peer_id) for peer_id, psk in keys.items()]
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    @timed("db.mark_exported")
+    def mark_exported(self, peer_ids: list[int], generation: int) -> int:
+        """记录客户端配置已导出（当前客户端版本 + 导出时的服务端代数）"""
+        with self._get_conn() as conn:
+            cursor = conn.execute(
+                "UPDATE peers SET exported_version = version, exported_generation = ? "
+                "WHERE id IN (SELECT value FROM json_each(?))",
+                (generation, json.dumps(list(peer_ids)))
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def get_export_states(self, server_id: int = 1) -> list[tuple[str, int, int, int]]:
+        """有私钥的客户端的导出状态 (name, version, exported_version, exported_generation)"""
+        with self._get_conn() as conn:
+            return [tuple(row) for row in conn.execute(
+                "SELECT name, version, exported_version, exported_generation FROM peers "
+                "WHERE server_id = ? AND private_key != '' ORDER BY created_at, id",
+                (server_id,)
+            )]
+
+    @timed("db.remove_peers")
+    def remove_peers(self, names: list[str], server_id: int = 1) -> int:
+        """批量删除客户端（单条 SQL），返回删除行数"""
+        with self._get_conn() as conn:
+            cursor = conn.execute(
+                "DELETE FROM peers WHERE server_id = ? "
+                "AND name IN (SELECT value FROM json_each(?))",
+                (server_id, json.dumps(list(names)))
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    @timed("db.find_free_ipv4")
+    def find_free_ipv4(self, server_id: int, first: int, last: int,
+                       reserved: int) -> Optional[int]:
+        """在 [first, last] 中查找第一个未被客户端占用的 IPv4 地址（整数）
+
+        只扫描 addr_int 索引：候选地址为区间起点和每个已用地址的下一个地址，
+        取第一个未被占用的。reserved 为服务端自身地址。
+        """
+        with self._get_conn() as conn:
+            row = conn.execute("""
+                WITH used(a) AS (
+                    SELECT addr_int FROM peers
+                    WHERE server_id = :sid AND addr_int BETWEEN :first AND :last
+                    UNION SELECT :reserved
+                )
+                SELECT c FROM (SELECT :first AS c UNION ALL SELECT a + 1 FROM used)
+                WHERE c BETWEEN :first AND :last AND c NOT IN (SELECT a FROM used)
+                ORDER BY c LIMIT 1
+            """, {"sid": server_id, "first": first, "last": last, "reserved": reserved}).fetchone()
+            return row[0] if row else None
+
+    @timed("db.find_overlapping_peers")
+    def find_overlapping_peers(self, server_id: int, network: IPNetwork) -> list[str]:
+        """返回地址范围与 network 重叠的客户端名称"""
         with self._get_conn() as conn:
+            if network.version == 4:
+                first, last = _network_bounds(network)
+                # 客户端网段 [addr & mask, addr | ~mask] 与 [first, last] 相交
+                rows = conn.execute("""
+                    SELECT name FROM peers
+                    WHERE server_id = ? AND addr_int IS NOT NULL
+                      AND ((addr_int >> (32 - addr_prefix)) << (32 - addr_prefix)) <= ?
+                      AND (addr_int | ((1 << (32 - addr_prefix)) - 1)) >= ?
+                """, (server_id, last, first)).fetchall()
+                return [row[0] for row in rows]
+            # IPv6 地址为 BLOB，无法在 SQL 中做位运算，取出后逐个比较
             rows = conn.execute(
-                "SELECT address FROM peers WHERE server_id = ?",
+                "SELECT name, addr6, addr6_prefix FROM peers WHERE server_id = ? AND addr6 IS NOT NULL",
                 (server_id,)
             ).fetchall()
-            used = {1}  # 服务器使用 .1
-            for row in rows:
-                ip = row["address"].split("/")[0]
-                parts = ip.split(".")
-                if len(parts) == 4:
-                    used.add(int(parts[-1]))
-            return used
+            return [
+                row[0] for row in rows
+                if ipaddress.IPv6Network((row[1], row[2]), strict=False).overlaps(network)
+            ]
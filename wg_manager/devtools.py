@@ -0,0 +1,99 @@
+"""开发/测试工具：生成模拟数据
+
+dev seed 在独立的数据库中批量生成服务端和客户端，用于复现 list、servers、export、
+import、sync 等命令在大规模数据下的性能问题，不会读写正式数据。
+"""
+
+import base64
+import ipaddress
+import math
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from .config import DEFAULT_MTU, DEFAULT_PORT
+from .database import Database
+from .models import Peer, ServerConfig
+
+# 每个 endpoint 上的接口数 (wg0..wg3)
+INTERFACES_PER_HOST = 4
+# 客户端名称前缀
+DEVICE_NAMES = ("phone", "laptop", "desktop", "tablet", "router", "server", "tv", "watch")
+
+
+def random_key(rng: random.Random) -> str:
+    """生成格式正确的 WireGuard 密钥（32 字节 base64）
+
+    公钥与私钥不是真实的 Curve25519 密钥对：批量调用 wg pubkey 太慢，
+    模拟数据只需格式正确、互不重复。
+    """
+    return base64.b64encode(rng.randbytes(32)).decode()
+
+
+def server_network(index: int, peers: int) -> ipaddress.IPv4Network:
+    """为第 index 个服务端分配能容纳 peers 个客户端的网段（10.0.0.0/8 内，不足时循环复用）"""
+    # 网络地址、广播地址和服务端各占一个
+    prefix = max(9, min(24, 32 - math.ceil(math.log2(peers + 3))))
+    size = 2 ** (32 - prefix)
+    slot = index % (2 ** (prefix - 8))
+    return ipaddress.IPv4Network((int(ipaddress.IPv4Address("10.0.0.0")) + slot * size, prefix))
+
+
+def seed_fleet(db: Database, servers: int, peers_per_server: int,
+               rng: Optional[random.Random] = None,
+               now: Optional[datetime] = None) -> list[ServerConfig]:
+    """批量生成服务端和客户端，返回生成的服务端列表"""
+    rng = rng or random.Random()
+    now = now or datetime.now()
+    created = []
+    for i in range(servers):
+        network = server_network(i, peers_per_server)
+        interface_index = i % INTERFACES_PER_HOST
+        server = db.save_server(ServerConfig(
+            private_key=random_key(rng),
+            public_key=random_key(rng),
+            address=f"{network.network_address + 1}/{network.prefixlen}",
+            listen_port=DEFAULT_PORT + interface_index,
+            interface=f"wg{interface_index}",
+            endpoint=f"vpn{i // INTERFACES_PER_HOST + 1}.example.test",
+        ))
+        created.append(server)
+
+        # 创建时间分布在过去一年内，按添加顺序递增
+        start = now - timedelta(days=365)
+        step = timedelta(days=365) / max(peers_per_server, 1)
+        hosts = network.network_address + 2
+        peers = [
+            Peer(
+                id=None,
+                server_id=server.id,
+                name=f"{rng.choice(DEVICE_NAMES)}-{j + 1:05d}",
+                public_key=random_key(rng),
+                private_key=random_key(rng),
+                preshared_key=random_key(rng),
+                address=f"{hosts + j}/32",
+                allowed_ips=str(network),
+                listen_port=rng.randint(10000, 60000),
+                mtu=DEFAULT_MTU,
+                created_at=(start + step * j).isoformat(),
+                enabled=rng.random() >= 0.1,
+            )
+            for j in range(peers_per_server)
+        ]
+        db.add_peers(peers)
+    return created
+
+
+def write_server_configs(db: Database, servers: list[ServerConfig], out_dir: Path) -> list[Path]:
+    """将服务端配置写入 <out_dir>/<endpoint>/<interface>.conf，可用于测试 import"""
+    from .manager import WireGuardManager
+
+    paths = []
+    for server in servers:
+        manager = WireGuardManager(server.id, db=db)
+        path = out_dir / server.endpoint / f"{server.interface}.conf"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(manager.get_server_config())
+        paths.append(path)
+    return paths
@@ -0,0 +1,255 @@
+"""多服务端（机群）并发操作 (health / drift)
+
+按 SSH 目标把服务端分组，每台主机只发起一次批量 SSH 调用，多台主机在有界线程池中
+并发执行，并受每台主机的时限约束。少数主机不可达时不会拖慢整体。
+"""
+
+import hashlib
+import ipaddress
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from .manager import ServerHandle, WireGuardManager, parse_peer_sections
+from .models import DriftEntry, ServerHealth
+from .routes import peer_allowed_ips
+
+# 默认并发主机数和每台主机的时限（秒）
+DEFAULT_WORKERS = 16
+DEFAULT_DEADLINE = 15
+
+T = TypeVar("T")
+
+
+def group_by_host(manager: WireGuardManager,
+                  server_ids: Optional[list[int]] = None) -> dict[str, list[ServerHandle]]:
+    """将已配置 SSH 的服务端按 SSH 目标 (user@host:port) 分组"""
+    groups: dict[str, list[ServerHandle]] = {}
+    for server in manager.get_servers():
+        if server_ids is not None and server.id not in server_ids:
+            continue
+        ssh_config = manager.db.get_ssh_config(server.id)
+        if not ssh_config:
+            continue
+        target = f"{ssh_config['user']}@{ssh_config['host']}:{ssh_config['port']}"
+        groups.setdefault(target, []).append(manager.server_handle(server.id))
+    return groups
+
+
+def run_per_host(groups: dict[str, list[ServerHandle]],
+                 probe: Callable[[str, list[ServerHandle]], list[T]],
+                 workers: int = DEFAULT_WORKERS) -> list[T]:
+    """在线程池中对每台主机执行 probe，按分组顺序合并结果"""
+    if not groups:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(groups))) as pool:
+        futures = [pool.submit(probe, target, handles) for target, handles in groups.items()]
+        return [item for future in futures for item in future.result()]
+
+
+def config_digest(config: str) -> str:
+    """配置内容的 sha256（与远程写入时一致，去掉末尾多余空行）"""
+    return hashlib.sha256((config.rstrip("\n") + "\n").encode()).hexdigest()
+
+
+# ========== 健康检查 ==========
+
+def _health_script(wg_dir: str, interfaces: list[str]) -> str:
+    """一次检查主机上多个接口：服务状态、接口是否存在、配置哈希、peer 数量
+
+    每个接口输出一行: 接口<TAB>active|inactive<TAB>up|down<TAB>sha256|-<TAB>peer 数
+    """
+    lines = []
+    for interface in interfaces:
+        iface = shlex.quote(interface)
+        path = shlex.quote(f"{wg_dir}/{interface}.conf")
+        lines += [
+            f"printf '%s\\t' {iface}",
+            f"if systemctl is-active wg-quick@{iface} >/dev/null 2>&1; "
+            "then printf 'active\\t'; else printf 'inactive\\t'; fi",
+            f"if ip link show {iface} >/dev/null 2>&1; "
+            "then printf 'up\\t'; else printf 'down\\t'; fi",
+            f"if [ -f {path} ]; then sha256sum {path} | cut -d' ' -f1 | tr -d '\\n'; "
+            "else printf -; fi",
+            "printf '\\t'",
+            f"wg show {iface} peers 2>/dev/null | wc -l | tr -d ' '",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _probe_health(target: str, handles: list[ServerHandle], deadline: float) -> list[ServerHealth]:
+    start = time.monotonic()
+    client = handles[0].get_ssh_client()
+    script = _health_script(client.wg_dir, [h.server.interface for h in handles])
+    success, output = client.run_script(script, timeout=deadline)
+    elapsed = time.monotonic() - start
+
+    rows = {}
+    if success:
+        for line in output.splitlines():
+            fields = line.split("\t")
+            if len(fields) == 5:
+                rows[fields[0]] = fields
+
+    results = []
+    for handle in handles:
+        server = handle.server
+        expected_peers = sum(1 for p in handle.peers if p.enabled)
+        health = ServerHealth(
+            server_id=server.id, endpoint=server.endpoint, interface=server.interface,
+            target=target, reachable=success, expected_peers=expected_peers,
+            elapsed=round(elapsed, 3), error="" if success else output,
+        )
+        fields = rows.get(server.interface)
+        if fields:
+            health.active = fields[1] == "active"
+            health.interface_up = fields[2] == "up"
+            health.config_sha256 = "" if fields[3] == "-" else fields[3]
+            health.peer_count = int(fields[4] or 0)
+            try:
+                health.config_match = health.config_sha256 == config_digest(handle.get_server_config())
+            except RuntimeError:
+                health.config_match = False
+        results.append(health)
+    return results
+
+
+def health_check(manager: WireGuardManager, server_ids: Optional[list[int]] = None,
+                 workers: int = DEFAULT_WORKERS,
+                 deadline: float = DEFAULT_DEADLINE) -> list[ServerHealth]:
+    """并发检查服务端健康状态，每台主机一次 SSH 调用，超过 deadline 秒视为不可达"""
+    groups = group_by_host(manager, server_ids)
+    return run_per_host(groups, lambda target, handles: _probe_health(target, handles, deadline),
+                        workers)
+
+
+# ========== 配置漂移 ==========
+
+# 漂移检查脚本输出中分隔各段的标记行
+_MARK = "#@@wg-manager"
+
+
+def _drift_script(wg_dir: str, interfaces: list[str]) -> str:
+    """一次读取主机上多个接口的配置文件和 wg show dump，各段以标记行分隔"""
+    lines = []
+    for interface in interfaces:
+        iface = shlex.quote(interface)
+        path = shlex.quote(f"{wg_dir}/{interface}.conf")
+        lines += [
+            f"echo '{_MARK} file {interface}'",
+            # 追加换行，避免文件末尾没有换行时与标记行连在一起
+            f"{{ cat {path} && echo; }} 2>/dev/null || echo '{_MARK} missing'",
+            f"echo '{_MARK} dump {interface}'",
+            f"wg show {iface} dump 2>/dev/null || echo '{_MARK} missing'",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _split_sections(output: str) -> dict[tuple[str, str], Optional[str]]:
+    """按标记行拆分脚本输出，返回 {(file|dump, 接口): 内容}，内容为 None 表示不存在"""
+    sections: dict[tuple[str, str], Optional[str]] = {}
+    key, body = None, []
+    for line in output.splitlines() + [f"{_MARK} end -"]:
+        if not line.startswith(_MARK):
+            body.append(line)
+            continue
+        parts = line.split()
+        if parts[1] == "missing":
+            body = None
+            continue
+        if key is not None:
+            sections[key] = None if body is None else "\n".join(body)
+        key, body = (parts[1], parts[2]), []
+    return sections
+
+
+def _normalize_ips(value: str) -> str:
+    """规范化 AllowedIPs（按网段排序，便于比较）"""
+    networks = []
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            networks.append(part)
+    return ", ".join(sorted(map(str, networks)))
+
+
+def diff_peers(expected: dict[str, tuple], actual: dict[str, tuple]
+               ) -> tuple[list[str], list[str], list[str]]:
+    """按公钥比较两组 peer（公钥 -> 比较字段），返回 (仅 actual 有, 仅 expected 有, 字段不同)"""
+    added = [key for key in actual.keys() - expected.keys()]
+    missing = [key for key in expected.keys() - actual.keys()]
+    mismatched = [key for key in expected.keys() & actual.keys() if expected[key] != actual[key]]
+    return sorted(added), sorted(missing), sorted(mismatched)
+
+
+def _drift_entries(handle: ServerHandle, file_content: Optional[str],
+                   dump: Optional[str]) -> list[DriftEntry]:
+    from .ssh import parse_dump
+
+    server = handle.server
+    enabled = [p for p in handle.peers if p.enabled]
+    names = {p.public_key: p.name for p in handle.peers}
+
+    def entry(source: str, kind: str, key: str = "", name: str = "", detail: str = ""):
+        return DriftEntry(server.id, server.endpoint, server.interface, source, kind,
+                          key, name or names.get(key, ""), detail)
+
+    entries = []
+    # 配置文件：比较 AllowedIPs 和 PresharedKey
+    if file_content is None:
+        entries.append(entry("file", "error", detail="远程配置文件不存在"))
+    else:
+        expected = {p.public_key: (_normalize_ips(peer_allowed_ips(p.address)), p.preshared_key)
+                    for p in enabled}
+        remote = parse_peer_sections(file_content)
+        actual = {p["public_key"]: (_normalize_ips(p["allowed_ips"]), p["preshared_key"])
+                  for p in remote}
+        remote_names = {p["public_key"]: p["name"] for p in remote}
+        added, missing, mismatched = diff_peers(expected, actual)
+        entries += [entry("file", "added", key, remote_names.get(key, ""),
+                          f"AllowedIPs = {actual[key][0]}") for key in added]
+        entries += [entry("file", "missing", key) for key in missing]
+        for key in mismatched:
+            fields = [label for label, a, b in zip(("AllowedIPs", "PresharedKey"),
+                                                   expected[key], actual[key]) if a != b]
+            entries.append(entry("file", "mismatch", key, detail=f"{', '.join(fields)} 不一致"))
+
+    # 运行状态：dump 中的预共享密钥不解析，只比较 AllowedIPs
+    if dump is None:
+        entries.append(entry("live", "error", detail="接口未运行"))
+    else:
+        expected = {p.public_key: _normalize_ips(peer_allowed_ips(p.address)) for p in enabled}
+        actual = {s.public_key: _normalize_ips(s.allowed_ips) for s in parse_dump(dump)}
+        added, missing, mismatched = diff_peers(expected, actual)
+        entries += [entry("live", "added", key, detail=f"AllowedIPs = {actual[key]}")
+                    for key in added]
+        entries += [entry("live", "missing", key) for key in missing]
+        entries += [entry("live", "mismatch", key,
+                          detail=f"AllowedIPs = {actual[key]}，应为 {expected[key]}")
+                    for key in mismatched]
+    return entries
+
+
+def _probe_drift(target: str, handles: list[ServerHandle], deadline: float) -> list[DriftEntry]:
+    client = handles[0].get_ssh_client()
+    script = _drift_script(client.wg_dir, [h.server.interface for h in handles])
+    success, output = client.run_script(script, timeout=deadline)
+    if not success:
+        return [DriftEntry(h.server.id, h.server.endpoint, h.server.interface, "ssh", "error",
+                           detail=output) for h in handles]
+    sections = _split_sections(output)
+    return [entry for h in handles
+            for entry in _drift_entries(h, sections.get(("file", h.server.interface)),
+                                        sections.get(("dump", h.server.interface)))]
+
+
+def drift_check(manager: WireGuardManager, server_ids: Optional[list[int]] = None,
+                workers: int = DEFAULT_WORKERS,
+                deadline: float = DEFAULT_DEADLINE) -> tuple[int, list[DriftEntry]]:
+    """并发比较数据库与远程配置文件、运行状态，返回 (检查的服务端数, 差异列表)"""
+    groups = group_by_host(manager, server_ids)
+    entries = run_per_host(groups, lambda target, handles: _probe_drift(target, handles, deadline),
+                           workers)
+    return sum(len(handles) for handles in groups.values()), entries
@@ -1,30 +1,113 @@
 """WireGuard 管理器核心模块"""
 
+from __future__ import annotations
+
+import functools
+import ipaddress
 import re
-import subprocess
+import threading
+import time
+from dataclasses import replace
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Iterator, Optional
 
 from .config import CONFIG_DIR, DB_FILE, EXPORT_DIR, DEFAULT_DNS, DEFAULT_MTU, generate_random_port
-from .crypto import generate_keypair, generate_preshared_key, generate_public_key
 from .database import Database
-from .models import Peer, ServerConfig
-from .ssh import SSHClient, SSHConfig, RemoteWireGuard
+from .models import Peer, PeerStatus, PeerSummary, ServerConfig
+from .routes import client_address, client_allowed_ips, format_routes, parse_networks, peer_allowed_ips
+from .timing import timed
+
+if TYPE_CHECKING:
+    from .ssh import SSHClient, SSHPool, RemoteWireGuard
+
+
+# 服务端锁注册表: (数据库路径, 服务端 ID) -> 锁
+# 同一进程内操作同一服务端的所有 manager 共享一把锁，不同服务端互不阻塞
+_server_locks: dict[tuple[str, int], threading.RLock] = {}
+_server_locks_guard = threading.Lock()
+
+
+def server_lock(db_path: Path, server_id: Optional[int]) -> threading.RLock:
+    """获取服务端对应的进程内锁（可重入）"""
+    key = (str(Path(db_path).resolve()), server_id or 0)
+    with _server_locks_guard:
+        lock = _server_locks.get(key)
+        if lock is None:
+            lock = _server_locks[key] = threading.RLock()
+        return lock
+
+
+def parse_peer_sections(content: str) -> list[dict]:
+    """解析配置中的 [Peer] 段
+
+    返回 {name, public_key, preshared_key, allowed_ips} 列表，name 取段内第一行注释，
+    没有注释时为 imported_peer_<序号>；缺少 PublicKey 的段被忽略。
+    """
+    sections: list[dict] = []
+    section: Optional[dict] = None
+    for raw in content.splitlines():
+        line = raw.strip()
+        if line.startswith("["):
+            section = {} if line.lower() == "[peer]" else None
+            if section is not None:
+                sections.append(section)
+        elif section is None or not line:
+            continue
+        elif line.startswith("#"):
+            section.setdefault("#", line[1:].strip())
+        else:
+            key, _, value = line.partition("=")
+            section.setdefault(key.strip().lower(), value.strip())
+
+    return [{
+        "name": section.get("#") or f"imported_peer_{i + 1}",
+        "public_key": section["publickey"],
+        "preshared_key": section.get("presharedkey", ""),
+        "allowed_ips": section.get("allowedips", ""),
+    } for i, section in enumerate(sections) if section.get("publickey")]
+
+
+def _locked(method):
+    """在当前服务端的锁内执行修改操作"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class WireGuardManager:
-    """WireGuard 管理器"""
+    """WireGuard 管理器
 
-    def __init__(self, server_id: Optional[int] = None):
+    readonly=True 时以只读方式打开数据库，适用于 list/show 等查询命令。
+    客户端列表在首次访问 peers 时才从数据库加载。
+    常驻进程可传入共享的 db，并设置 ssh_control_dir 以复用 SSH 主连接。
+
+    同一个 manager 可在多个线程间共享：server 和 peers 是不可变快照，
+    修改操作在服务端锁内执行，last_sync_result 按线程记录。
+    switch_server 等切换服务端的操作会改变 manager 本身，不应在共享时调用；
+    同时操作多个服务端时使用 server_handle()。
+    """
+
+    def __init__(self, server_id: Optional[int] = None, readonly: bool = False,
+                 db: Optional[Database] = None, ssh_control_dir: Optional[Path] = None):
         self.config_dir = CONFIG_DIR
         self.export_dir = EXPORT_DIR
-        self._ensure_dirs()
-        self.db = Database(DB_FILE)
+        self.db = db or Database(DB_FILE, readonly=readonly)
+        self.ssh_control_dir = ssh_control_dir
         self._server_id = server_id
+        self._peers: Optional[tuple[Peer, ...]] = None
         self._load_data()
         self._ssh_client: Optional[SSHClient] = None
         self._remote_wg: Optional[RemoteWireGuard] = None
+        self._ssh_lock = threading.Lock()
+        self._local = threading.local()
+        # 由 server_handle 创建的句柄共享根 manager 的 SSH 连接池
+        self._root = self
+        self._ssh_pool: Optional[SSHPool] = None
+        self._handles: dict[int, ServerHandle] = {}
+        self._handles_lock = threading.Lock()
 
     def _ensure_dirs(self):
         """确保目录存在"""
@@ -32,35 +115,51 @@ class WireGuardManager:
         self.export_dir.mkdir(parents=True, exist_ok=True)
 
     def _load_data(self):
-        """加载配置数据"""
-        servers = self.db.get_servers()
+        """加载当前服务端配置"""
         if self._server_id:
             self.server = self.db.get_server(self._server_id) or ServerConfig()
-        elif servers:
+        else:
             # 默认使用第一个服务端
-            self.server = servers[0]
+            self.server = self.db.get_first_server() or ServerConfig()
             self._server_id = self.server.id
-        else:
-            self.server = ServerConfig()
-            self._server_id = None
+        self._peers = None
 
-        if self._server_id:
-            self.peers = self.db.get_peers(self._server_id)
-        else:
-            self.peers = []
+    def reload(self):
+        """从数据库重新加载当前服务端（保留 SSH 连接）"""
+        self._load_data()
 
     def _refresh_peers(self):
-        """刷新客户端列表"""
-        if self._server_id:
-            self.peers = self.db.get_peers(self._server_id)
-        else:
-            self.peers = []
+        """刷新客户端列表（下次访问时重新加载）"""
+        self._peers = None
+
+    @property
+    def peers(self) -> tuple[Peer, ...]:
+        """当前服务端的客户端快照（不可变）"""
+        peers = self._peers
+        if peers is None:
+            peers = tuple(self.db.get_peers(self._server_id)) if self._server_id else ()
+            self._peers = peers
+        return peers
 
     @property
     def server_id(self) -> Optional[int]:
         """当前服务端 ID"""
         return self._server_id
 
+    @property
+    def lock(self) -> threading.RLock:
+        """当前服务端的进程内锁"""
+        return server_lock(self.db.db_path, self._server_id)
+
+    @property
+    def last_sync_result(self) -> Optional[tuple[bool, str]]:
+        """当前线程最近一次远程同步的结果"""
+        return getattr(self._local, "last_sync_result", None)
+
+    @last_sync_result.setter
+    def last_sync_result(self, value: Optional[tuple[bool, str]]):
+        self._local.last_sync_result = value
+
     # ========== 多服务端管理 ==========
 
     def get_servers(self) -> list[ServerConfig]:
@@ -79,6 +178,44 @@ class WireGuardManager:
             return True
         return False
 
+    def server_handle(self, server_id: int) -> ServerHandle:
+        """获取固定绑定到指定服务端的句柄
+
+        句柄拥有独立的服务端/客户端快照和远程对象，可与其他服务端的句柄并发使用；
+        同一主机上的句柄共享 SSH 连接。同一服务端多次调用返回同一个句柄。
+        """
+        root = self._root
+        with root._handles_lock:
+            handle = root._handles.get(server_id)
+            if handle is None:
+                if not self.db.get_server(server_id):
+                    raise ValueError(f"服务端 {server_id} 不存在")
+                handle = root._handles[server_id] = ServerHandle(root, server_id)
+            return handle
+
+    def server_handles(self) -> list[ServerHandle]:
+        """所有服务端的句柄"""
+        return [self.server_handle(s.id) for s in self.db.get_servers()]
+
+    def _get_ssh_pool(self) -> SSHPool:
+        """根 manager 的 SSH 连接池（按主机复用客户端）"""
+        root = self._root
+        if root._ssh_pool is None:
+            from .ssh import SSHPool
+
+            with root._handles_lock:
+                if root._ssh_pool is None:
+                    root._ssh_pool = SSHPool(self.ssh_control_dir)
+        return root._ssh_pool
+
+    def close(self):
+        """关闭所有 SSH 主连接"""
+        root = self._root
+        if root._ssh_pool is not None:
+            root._ssh_pool.close()
+        if root._ssh_client:
+            root._ssh_client.close()
+
     def switch_server_by_endpoint(self, endpoint: str, interface: str = None) -> bool:
         """根据 endpoint（和可选的 interface）切换服务端"""
         if interface:
@@ -93,6 +230,7 @@ class WireGuardManager:
 
     def delete_server(self, server_id: int) -> bool:
         """删除服务端及其所有客户端"""
+        self._root._handles.pop(server_id, None)
         if self._server_id == server_id:
             # 如果删除的是当前服务端，切换到其他服务端
             servers = self.db.get_servers()
@@ -102,7 +240,7 @@ class WireGuardManager:
             else:
                 self._server_id = None
                 self.server = ServerConfig()
-                self.peers = []
+                self._peers = ()
 
         return self.db.delete_server(server_id)
 
@@ -114,8 +252,11 @@ class WireGuardManager:
         if not self._server_id:
             return False, "请先初始化或选择服务端"
 
-        config = SSHConfig(host=host, port=port, user=user, key_file=key_file)
-        self._ssh_client = SSHClient(config)
+        from .ssh import SSHConfig, RemoteWireGuard, connect
+
+        config = SSHConfig(host=host, port=port, user=user, key_file=key_file,
+                           control_path=self._ssh_control_path())
+        self._ssh_client = connect(config)
 
         success, msg = self._ssh_client.test_connection()
         if success:
@@ -123,6 +264,12 @@ class WireGuardManager:
             self._remote_wg = RemoteWireGuard(self._ssh_client, self.server.interface)
         return success, msg
 
+    def _ssh_control_path(self) -> Optional[str]:
+        """SSH ControlPath（%C 为连接参数的哈希）"""
+        if self.ssh_control_dir:
+            return str(self.ssh_control_dir / "%C")
+        return None
+
     def get_ssh_client(self) -> Optional[SSHClient]:
         """获取 SSH 客户端"""
         if self._ssh_client:
@@ -131,11 +278,13 @@ class WireGuardManager:
         if not self._server_id:
             return None
 
-        ssh_config = self.db.get_ssh_config(self._server_id)
-        if ssh_config:
-            config = SSHConfig(**ssh_config)
-            self._ssh_client = SSHClient(config)
-            return self._ssh_client
+        with self._ssh_lock:
+            if self._ssh_client:
+                return self._ssh_client
+            ssh_config = self.db.get_ssh_config(self._server_id)
+            if ssh_config:
+                self._ssh_client = self._get_ssh_pool().get(**ssh_config)
+                return self._ssh_client
         return None
 
     def get_remote_wg(self) -> Optional[RemoteWireGuard]:
@@ -145,8 +294,12 @@ class WireGuardManager:
 
         client = self.get_ssh_client()
         if client and self.server.interface:
-            self._remote_wg = RemoteWireGuard(client, self.server.interface)
-            return self._remote_wg
+            from .ssh import RemoteWireGuard
+
+            with self._ssh_lock:
+                if not self._remote_wg:
+                    self._remote_wg = RemoteWireGuard(client, self.server.interface)
+                return self._remote_wg
         return None
 
     # ========== 服务端管理 ==========
@@ -159,6 +312,9 @@ class WireGuardManager:
         if existing:
             raise ValueError(f"服务端 '{endpoint}:{interface}' 已存在")
 
+        import subprocess
+        from .crypto import generate_keypair
+
         private_key, public_key = generate_keypair()
 
         try:
@@ -196,25 +352,21 @@ class WireGuardManager:
         """导入已有服务端配置（通过私钥）"""
         # 检查 endpoint + interface 组合是否已存在
         existing = self.db.get_server_by_endpoint_and_interface(endpoint, interface)
-        if existing:
-            # 更新现有服务端
-            self.server = existing
-            self._server_id = existing.id
-        else:
-            self.server = ServerConfig(id=None)
 
-        public_key = generate_public_key(private_key)
+        from .crypto import generate_public_key
 
-        self.server.private_key = private_key
-        self.server.public_key = public_key
-        self.server.address = address
-        self.server.listen_port = port
-        self.server.interface = interface
-        self.server.endpoint = endpoint
-        self.server.post_up = post_up
-        self.server.post_down = post_down
-
-        self.server = self.db.save_server(self.server)
+        # 已存在时更新现有服务端
+        self.server = self.db.save_server(ServerConfig(
+            id=existing.id if existing else None,
+            private_key=private_key,
+            public_key=generate_public_key(private_key),
+            address=address,
+            listen_port=port,
+            interface=interface,
+            endpoint=endpoint,
+            post_up=post_up,
+            post_down=post_down
+        ))
         self._server_id = self.server.id
         self._refresh_peers()
         return self.server
@@ -240,6 +392,7 @@ class WireGuardManager:
 
         return self._parse_and_import_config(content, endpoint, self.server.interface or "wg0")
 
+    @timed("manager.parse_config")
     def _parse_and_import_config(self, content: str, endpoint: str,
                                   interface: str) -> tuple[ServerConfig, list[dict]]:
         """解析配置内容并导入"""
@@ -286,49 +439,42 @@ class WireGuardManager:
             post_down=post_down
         )
 
-        existing_peers = []
-        peer_matches = re.finditer(r'\[Peer\](.*?)(?=\[Peer\]|$)', content, re.DOTALL | re.IGNORECASE)
-        for i, match in enumerate(peer_matches):
-            peer_section = match.group(1)
-
-            pub_match = re.search(r'PublicKey\s*=\s*(\S+)', peer_section)
-            allowed_match = re.search(r'AllowedIPs\s*=\s*(\S+)', peer_section)
-            psk_match = re.search(r'PresharedKey\s*=\s*(\S+)', peer_section)
-            comment_match = re.search(r'#\s*(.+)$', peer_section, re.MULTILINE)
-
-            if pub_match:
-                name = comment_match.group(1).strip() if comment_match else f"imported_peer_{i+1}"
-                existing_peers.append({
-                    "name": name,
-                    "public_key": pub_match.group(1),
-                    "preshared_key": psk_match.group(1) if psk_match else "",
-                    "allowed_ips": allowed_match.group(1) if allowed_match else ""
-                })
-
-        return server, existing_peers
+        return server, parse_peer_sections(content)
 
     # ========== 客户端管理 ==========
 
     def _get_next_ip(self) -> str:
-        """获取下一个可用 IP"""
-        base = self.server.address.split("/")[0]
-        parts = base.split(".")
-        base_prefix = ".".join(parts[:3])
-
-        used_ips = self.db.get_used_ips(self._server_id)
-
-        for i in range(2, 255):
-            if i not in used_ips:
-                return f"{base_prefix}.{i}/32"
+        """获取下一个可用 IP（在数据库中查找服务端网段内的第一个空位）"""
+        server_address = ipaddress.ip_interface(self.server.address.split(",")[0].strip())
+        if server_address.version != 4:
+            raise RuntimeError("仅支持在 IPv4 网段中自动分配地址")
+        network = server_address.network
+
+        free = self.db.find_free_ipv4(
+            self._server_id,
+            first=int(network.network_address) + 1,
+            last=int(network.broadcast_address) - 1,
+            reserved=int(server_address.ip),
+        )
+        if free is None:
+            raise RuntimeError("IP 地址池已满，可使用 shard set 启用自动分片")
+        return f"{ipaddress.IPv4Address(free)}/32"
 
-        raise RuntimeError("IP 地址池已满")
+    def get_client_routes(self) -> str:
+        """客户端的 AllowedIPs：服务端网段和额外路由汇总后的最小路由集合"""
+        return client_allowed_ips(self.server.address, self.server.routes)
 
-    def _get_server_network(self) -> str:
-        """获取服务端网段 (如 10.1.1.0/24)"""
-        base = self.server.address.split("/")[0]
-        parts = base.split(".")
-        return f"{'.'.join(parts[:3])}.0/24"
+    @_locked
+    def set_routes(self, routes: list[str]) -> ServerConfig:
+        """设置经由服务端访问的额外路由（客户端 AllowedIPs 随之改变，需要重新导出）"""
+        if not self._server_id:
+            raise RuntimeError("请先初始化或选择服务端")
+        value = format_routes(parse_networks(routes))
+        self.server = self.db.set_server_routes(self._server_id, value)
+        return self.server
 
+    @timed("manager.add_peer")
+    @_locked
     def add_peer(self, name: str, dns: str = DEFAULT_DNS,
                  mtu: int = DEFAULT_MTU, sync_remote: bool = True) -> Peer:
         """添加客户端"""
@@ -338,12 +484,14 @@ class WireGuardManager:
         if self.db.get_peer_by_name(name, self._server_id):
             raise ValueError(f"客户端名称 '{name}' 已存在")
 
+        from .crypto import generate_keypair, generate_preshared_key
+
         private_key, public_key = generate_keypair()
         psk = generate_preshared_key()
         address = self._get_next_ip()
 
-        # 客户端 AllowedIPs 默认为服务端网段
-        allowed_ips = self._get_server_network()
+        # 客户端 AllowedIPs 默认为服务端网段和额外路由
+        allowed_ips = self.get_client_routes()
 
         peer = Peer(
             id=None,
@@ -364,37 +512,41 @@ class WireGuardManager:
         self._refresh_peers()
 
         # 同步到远程服务器
-        if sync_remote:
-            self._sync_peer_to_remote(peer, action="add")
+        if sync_remote and not self._defer_remote_sync():
+            self._sync_changes_to_remote(upserts=[peer])
 
         return peer
 
+    @timed("manager.remove_peer")
     def remove_peer(self, name: str, sync_remote: bool = True) -> bool:
         """删除客户端"""
-        if not self._server_id:
-            return False
+        return bool(self.remove_peers([name], sync_remote))
 
-        peer = self.db.get_peer_by_name(name, self._server_id)
-        if not peer:
-            return False
+    @_locked
+    def remove_peers(self, names: list[str], sync_remote: bool = True) -> list[Peer]:
+        """批量删除客户端，返回实际删除的客户端
 
-        # 保存 public_key 用于远程删除
-        public_key = peer.public_key
+        单条 SQL 删除，一次性清理导出的配置文件，并合并为一次远程更新；
+        同步结果记录在 last_sync_result 中。
+        """
+        if not self._server_id:
+            return []
 
-        # 先从数据库删除
-        if self.db.remove_peer(name, self._server_id):
-            conf_file = self.export_dir / f"{name}.conf"
-            if conf_file.exists():
-                conf_file.unlink()
-            self._refresh_peers()
+        peers = self.db.get_peers_by_names(names, self._server_id)
+        if not peers:
+            return []
 
-            # 同步删除到远程
-            if sync_remote:
-                self._sync_peer_remove_to_remote(public_key)
+        self.db.remove_peers([p.name for p in peers], self._server_id)
+        for peer in peers:
+            (self.export_dir / f"{peer.name}.conf").unlink(missing_ok=True)
+        self._refresh_peers()
 
-            return True
-        return False
+        self._apply_peer_changes(removed_keys=[p.public_key for p in peers],
+                                 sync_remote=sync_remote)
+        return peers
 
+    @timed("manager.toggle_peer")
+    @_locked
     def toggle_peer(self, name: str, sync_remote: bool = True) -> Optional[bool]:
         """启用/禁用客户端"""
         if not self._server_id:
@@ -403,10 +555,178 @@ class WireGuardManager:
         result = self.db.toggle_peer(name, self._server_id)
         if result is not None:
             self._refresh_peers()
-            if sync_remote:
-                self._sync_to_remote()
+            if sync_remote and not self._defer_remote_sync():
+                peer = self.db.get_peer_by_name(name, self._server_id)
+                if result:
+                    self._sync_changes_to_remote(upserts=[peer])
+                else:
+                    self._sync_changes_to_remote(removed_keys=[peer.public_key])
         return result
 
+    @_locked
+    def toggle_peers(self, names: list[str], enabled: bool,
+                     sync_remote: bool = True) -> list[Peer]:
+        """批量启用/禁用客户端，返回状态发生变化的客户端
+
+        单条 SQL 更新，并合并为一次远程更新；同步结果记录在 last_sync_result 中。
+        """
+        if not self._server_id:
+            return []
+
+        peers = [p for p in self.db.get_peers_by_names(names, self._server_id)
+                 if p.enabled != enabled]
+        if not peers:
+            return []
+
+        self.db.set_peers_enabled([p.name for p in peers], enabled, self._server_id)
+        self._refresh_peers()
+
+        if enabled:
+            self._apply_peer_changes(upserts=peers, sync_remote=sync_remote)
+        else:
+            self._apply_peer_changes(removed_keys=[p.public_key for p in peers],
+                                     sync_remote=sync_remote)
+        return peers
+
+    def _apply_peer_changes(self, upserts: list[Peer] = (), removed_keys: list[str] = (),
+                            sync_remote: bool = True) -> tuple[bool, str]:
+        """本地修改完成后同步到远程（或按延迟模式标记待同步），结果记录在 last_sync_result"""
+        if not sync_remote:
+            self.last_sync_result = (True, "已更新本地数据库")
+        elif self._defer_remote_sync():
+            self.last_sync_result = (True, "已标记待同步")
+        else:
+            self._sync_changes_to_remote(upserts=upserts, removed_keys=removed_keys)
+        return self.last_sync_result
+
+    def find_stale_peers(self, max_age: int,
+                         statuses: Optional[dict[str, PeerStatus]] = None) -> list[Peer]:
+        """查找最近握手早于 max_age 秒（或从未握手）的已启用客户端
+
+        从未握手的客户端以创建时间为准，避免误判刚添加的客户端。
+        """
+        if statuses is None:
+            statuses = self.get_peer_statuses()
+
+        cutoff = time.time() - max_age
+        stale = []
+        for peer in self.peers:
+            if not peer.enabled:
+                continue
+            status = statuses.get(peer.public_key)
+            if status and status.latest_handshake:
+                last_seen = status.latest_handshake
+            else:
+                try:
+                    last_seen = datetime.fromisoformat(peer.created_at).timestamp()
+                except ValueError:
+                    last_seen = 0
+            if last_seen < cutoff:
+                stale.append(peer)
+        return stale
+
+    @_locked
+    def prune_peers(self, peers: list[Peer], remove: bool = False,
+                    sync_remote: bool = True) -> tuple[bool, str]:
+        """批量禁用（或删除）客户端：单次数据库事务 + 单次远程更新"""
+        if not self._server_id or not peers:
+            return True, "没有需要处理的客户端"
+
+        names = [p.name for p in peers]
+        changed = (self.remove_peers(names, sync_remote) if remove
+                   else self.toggle_peers(names, False, sync_remote))
+        if not changed:
+            return True, "没有需要处理的客户端"
+        return self.last_sync_result
+
+    @timed("manager.rotate_psk")
+    @_locked
+    def rotate_preshared_keys(self, match: Optional[str] = None,
+                              sync_remote: bool = True) -> list[Peer]:
+        """批量轮换客户端预共享密钥，返回已轮换的客户端
+
+        match 为名称 glob 模式（不含通配符时按前缀匹配），为空时轮换全部客户端。
+        导入的客户端没有私钥，无法重新生成配置分发给客户端，轮换后隧道会中断，因此跳过。
+        新密钥在一个事务中写入数据库，并通过一次批量 `wg set` 下发。
+        """
+        if not self._server_id:
+            raise RuntimeError("请先初始化或选择服务端")
+
+        from .crypto import generate_preshared_keys
+
+        ids = [p.id for p in self.iter_peer_summaries(match=match) if p.has_private_key]
+        if not ids:
+            return []
+        self.db.set_preshared_keys(dict(zip(ids, generate_preshared_keys(len(ids)))))
+        self._refresh_peers()
+
+        wanted = set(ids)
+        rotated = [p for p in self.peers if p.id in wanted]
+        if sync_remote and not self._defer_remote_sync():
+            self._sync_changes_to_remote(upserts=[p for p in rotated if p.enabled])
+        return rotated
+
+    @timed("manager.rotate_server_key")
+    @_locked
+    def rotate_server_key(self, sync_remote: bool = True) -> ServerConfig:
+        """轮换服务端密钥对
+
+        新私钥随配置文件通过一次远程调用下发 (`wg set private-key`)，远程下发成功后
+        才保存到数据库；下发失败时抛出 RuntimeError，数据库中的密钥保持不变。
+        所有客户端配置中的服务端公钥随之改变，需要重新分发。
+        """
+        if not self.server.private_key:
+            raise RuntimeError("服务端未初始化")
+
+        from .crypto import generate_keypair
+
+        private_key, public_key = generate_keypair()
+        remote_wg = (self.get_remote_wg()
+                     if sync_remote and not self.db.is_sync_deferred(self._server_id) else None)
+        if remote_wg:
+            success, msg = remote_wg.apply_changes(self.get_server_config(private_key),
+                                                   private_key=private_key)
+            if not success:
+                self.last_sync_result = (False, msg)
+                raise RuntimeError(f"远程下发失败，服务端密钥未更改: {msg}")
+            self.last_sync_result = (True, msg)
+
+        self.server = self.db.save_server(replace(self.server, private_key=private_key,
+                                                  public_key=public_key))
+        if sync_remote and not remote_wg and not self._defer_remote_sync():
+            self.last_sync_result = (True, "SSH 未配置，跳过远程同步")
+        return self.server
+
+    def reexport_client_configs(self, names: list[str]) -> list[Path]:
+        """重新导出客户端配置，只处理导出目录中已有配置文件的客户端"""
+        return self.export_client_configs([name for name in names
+                                           if (self.export_dir / f"{name}.conf").exists()])
+
+    def get_changed_exports(self) -> list[tuple[str, str]]:
+        """已导出但内容已过期的客户端配置，返回 [(名称, 原因)]
+
+        比较每个客户端的配置版本、服务端配置代数与最近一次导出时记录的值。
+        升级前导出的配置没有记录，导出目录中存在配置文件即视为需要重新导出。
+        """
+        if not self._server_id:
+            raise RuntimeError("请先选择服务端")
+
+        generation = self.server.config_generation
+        existing = ({path.stem for path in self.export_dir.glob("*.conf")}
+                    if self.export_dir.exists() else set())
+        changed = []
+        for name, version, exported_version, exported_generation in \
+                self.db.get_export_states(self._server_id):
+            if not exported_version:
+                if name in existing:
+                    changed.append((name, "未记录导出版本"))
+            elif exported_version != version:
+                changed.append((name, "客户端配置已变更"))
+            elif exported_generation != generation:
+                changed.append((name, "服务端配置已变更"))
+        return changed
+
+    @_locked
     def import_existing_peer(self, name: str, public_key: str, address: str,
                              preshared_key: str = "") -> dict:
         """导入已有客户端（仅记录公钥，无法生成客户端配置）"""
@@ -416,6 +736,16 @@ class WireGuardManager:
         if self.db.get_peer_by_name(name, self._server_id):
             raise ValueError(f"客户端名称 '{name}' 已存在")
 
+        # 同一接口上 AllowedIPs 重叠时 WireGuard 只会路由到其中一个 peer
+        for part in filter(None, (p.strip() for p in address.split(","))):
+            try:
+                network = ipaddress.ip_network(part, strict=False)
+            except ValueError:
+                continue
+            conflicts = self.db.find_overlapping_peers(self._server_id, network)
+            if conflicts:
+                raise ValueError(f"地址 {part} 与客户端 '{conflicts[0]}' 重叠")
+
         peer = Peer(
             id=None,
             server_id=self._server_id,
@@ -435,13 +765,14 @@ class WireGuardManager:
 
     # ========== 配置生成 ==========
 
-    def get_server_config(self) -> str:
-        """生成服务端配置文件内容"""
+    @timed("render.server_config")
+    def get_server_config(self, private_key: Optional[str] = None) -> str:
+        """生成服务端配置文件内容，private_key 用于在保存前生成轮换后的配置"""
         if not self.server.private_key:
             raise RuntimeError("服务端未初始化")
 
         config = f"""[Interface]
-PrivateKey = {self.server.private_key}
+PrivateKey = {private_key or self.server.private_key}
 Address = {self.server.address}
 ListenPort = {self.server.listen_port}
 """
@@ -457,12 +788,12 @@ ListenPort = {self.server.listen_port}
 # {peer.name}
 PublicKey = {peer.public_key}
 PresharedKey = {peer.preshared_key}
-AllowedIPs = {peer.address.split('/')[0]}/32
+AllowedIPs = {peer_allowed_ips(peer.address)}
 """
         return config
 
-    def get_client_config(self, name: str) -> str:
-        """生成客户端配置文件内容"""
+    def _get_exportable_peer(self, name: str) -> Peer:
+        """查找可以生成客户端配置的客户端"""
         if not self._server_id:
             raise RuntimeError("请先选择服务端")
 
@@ -475,10 +806,18 @@ AllowedIPs = {peer.address.split('/')[0]}/32
 
         if not self.server.endpoint:
             raise RuntimeError("服务端 endpoint 未配置")
+        return peer
+
+    def get_client_config(self, name: str) -> str:
+        """生成客户端配置文件内容"""
+        return self._render_client_config(self._get_exportable_peer(name))
 
-        # 客户端地址使用 /24 网段
-        address_ip = peer.address.split("/")[0]
-        address_with_mask = f"{address_ip}/24"
+    @timed("render.client_config")
+    def _render_client_config(self, peer: Peer) -> str:
+        """根据客户端记录渲染配置（调用方已检查私钥和 endpoint）"""
+        name = peer.name
+        # 客户端地址使用所在服务端网段的前缀长度
+        address_with_mask = client_address(peer.address, self.server.address)
 
         # 构建配置
         config = "# https://www.wireguard.com\n"
@@ -492,8 +831,8 @@ AllowedIPs = {peer.address.split('/')[0]}/32
             config += f"DNS = {peer.dns}\n"
 
         config += "\n[Peer]\n"
-        # 客户端 AllowedIPs 使用服务端网段
-        client_allowed_ips = self._get_server_network()
+        # 客户端 AllowedIPs 使用服务端网段和额外路由
+        client_allowed_ips = self.get_client_routes()
         config += f"AllowedIPs = {client_allowed_ips}\n"
         config += f"Endpoint = {self.server.endpoint}:{self.server.listen_port}\n"
         config += "PersistentKeepalive = 25\n"
@@ -508,18 +847,50 @@ AllowedIPs = {peer.address.split('/')[0]}/32
     # ========== 导出功能 ==========
 
     def export_client_config(self, name: str) -> Path:
-        """导出客户端配置到文件"""
-        config = self.get_client_config(name)
+        """导出客户端配置到文件，并记录导出版本"""
+        peer = self._get_exportable_peer(name)
+        config = self._render_client_config(peer)
+        self._ensure_dirs()
         filepath = self.export_dir / f"{name}.conf"
         with open(filepath, "w") as f:
             f.write(config)
+        self.db.mark_exported([peer.id], self.server.config_generation)
         return filepath
 
+    @timed("manager.export_client_configs")
+    @_locked
+    def export_client_configs(self, names: list[str]) -> list[Path]:
+        """批量导出客户端配置到文件，导出版本在一次数据库写入中记录
+
+        跳过不存在或没有私钥的客户端，返回已写入的文件路径。
+        """
+        if not names:
+            return []
+        if not self._server_id:
+            raise RuntimeError("请先选择服务端")
+        if not self.server.endpoint:
+            raise RuntimeError("服务端 endpoint 未配置")
+
+        by_name = {p.name: p for p in self.peers}
+        self._ensure_dirs()
+        paths, exported_ids = [], []
+        for name in names:
+            peer = by_name.get(name)
+            if not peer or not peer.private_key:
+                continue
+            filepath = self.export_dir / f"{name}.conf"
+            filepath.write_text(self._render_client_config(peer))
+            paths.append(filepath)
+            exported_ids.append(peer.id)
+        self.db.mark_exported(exported_ids, self.server.config_generation)
+        return paths
+
     def export_client_qrcode(self, name: str) -> bool:
-        """生成客户端配置二维码（终端显示）"""
+        """生成客户端配置二维码（终端显示），并记录导出版本"""
         try:
             import qrcode
-            config = self.get_client_config(name)
+            peer = self._get_exportable_peer(name)
+            config = self._render_client_config(peer)
             qr = qrcode.QRCode(
                 error_correction=qrcode.constants.ERROR_CORRECT_L,
                 box_size=1,
@@ -528,6 +899,7 @@ AllowedIPs = {peer.address.split('/')[0]}/32
             qr.add_data(config)
             qr.make(fit=True)
             qr.print_ascii(invert=True)
+            self.db.mark_exported([peer.id], self.server.config_generation)
             return True
         except Exception as e:
             print(f"生成二维码失败: {e}")
@@ -536,6 +908,7 @@ AllowedIPs = {peer.address.split('/')[0]}/32
     def export_server_config(self) -> Path:
         """导出服务端配置到文件"""
         config = self.get_server_config()
+        self._ensure_dirs()
         filepath = self.config_dir / f"{self.server.interface}.conf"
         with open(filepath, "w") as f:
             f.write(config)
@@ -543,55 +916,132 @@ AllowedIPs = {peer.address.split('/')[0]}/32
 
     # ========== 远程同步 ==========
 
-    def _sync_peer_to_remote(self, peer: Peer, action: str = "add") -> tuple[bool, str]:
-        """同步添加客户端到远程服务器（不重启服务）"""
-        remote_wg = self.get_remote_wg()
-        if not remote_wg:
-            return True, "SSH 未配置，跳过远程同步"
+    def _defer_remote_sync(self) -> bool:
+        """延迟同步模式下仅标记服务端待同步，返回 True 表示已延迟"""
+        if not self.db.is_sync_deferred(self._server_id):
+            return False
+        self.db.mark_dirty(self._server_id, time.time())
+        return True
 
-        # 1. 先更新配置文件（确保持久化）
-        config = self.get_server_config()
-        success, msg = remote_wg.update_config(config)
-        if not success:
-            return False, f"更新远程配置失败: {msg}"
+    def set_sync_deferred(self, deferred: bool):
+        """设置当前服务端的同步模式（延迟同步 / 立即同步）"""
+        if not self._server_id:
+            raise RuntimeError("请先初始化或选择服务端")
+        self.db.set_sync_deferred(self._server_id, deferred)
+
+    @_locked
+    def flush_pending_sync(self, debounce: float = 0,
+                           max_wait: float = 30) -> Optional[tuple[bool, str]]:
+        """合并执行当前服务端的延迟同步（一次完整配置下发）
+
+        最近一次变更距今不足 debounce 秒时继续等待，但累计等待超过
+        max_wait 秒后强制同步。没有待同步变更或仍在防抖窗口内时返回 None。
+        """
+        state = self.db.get_dirty_state(self._server_id) if self._server_id else None
+        if not state:
+            return None
 
-        # 2. 动态添加 peer 到运行中的 WireGuard（不重启）
-        allowed_ips = f"{peer.address.split('/')[0]}/32"
-        success, msg = remote_wg.add_peer_live(
-            peer.public_key, allowed_ips, peer.preshared_key
-        )
+        dirty_since, dirty_at = state
+        now = time.time()
+        if now - dirty_at < debounce and now - dirty_since < max_wait:
+            return None
+
+        success, msg = self._sync_to_remote()
         if success:
-            return True, f"客户端 '{peer.name}' 已同步到远程"
+            self.db.clear_dirty(self._server_id, dirty_at)
+        return success, msg
 
-        # 动态更新失败，尝试重载配置
-        return remote_wg.reload()
+    def flush_all_pending_sync(self, server_ids: Optional[list[int]] = None,
+                               debounce: float = 2.0, max_wait: float = 30,
+                               wait: bool = True) -> list[tuple[ServerConfig, bool, str]]:
+        """合并执行多个服务端的延迟同步，每个服务端一次下发
+
+        server_ids 为空时处理所有待同步的服务端。wait=True 时等待防抖窗口结束，
+        否则只处理已经满足条件的服务端。
+        """
+        failed: set[int] = set()
+        results = []
+        while True:
+            pending = [sid for sid in self.db.get_dirty_server_ids()
+                       if sid not in failed and (server_ids is None or sid in server_ids)]
+            waiting = False
+            for sid in pending:
+                manager = self.server_handle(sid)
+                manager.reload()
+                result = manager.flush_pending_sync(debounce, max_wait)
+                if result is None:
+                    waiting = True
+                    continue
+                results.append((manager.server, *result))
+                if not result[0]:
+                    failed.add(sid)
+            if not wait or not waiting:
+                return results
+            time.sleep(min(debounce, 0.5))
+
+    def _sync_changes_to_remote(self, upserts: list[Peer] = (),
+                                removed_keys: list[str] = ()) -> tuple[bool, str]:
+        """同步客户端变更到远程服务器
+
+        变更先写入操作日志，再与日志中尚未同步的操作合并为一次远程批量更新；
+        远程不可达时操作保留在日志中，由 replay 或下一次同步重试。
+        结果同时记录在 last_sync_result 中。
+        """
+        if not self.get_remote_wg():
+            self.last_sync_result = (True, "SSH 未配置，跳过远程同步")
+            return self.last_sync_result
+
+        ops = [("upsert", p.public_key) for p in upserts]
+        ops += [("remove", public_key) for public_key in removed_keys]
+        self.db.append_journal(self._server_id, ops, datetime.now().isoformat())
+        self.last_sync_result = self.replay_journal()
+        return self.last_sync_result
+
+    @timed("sync.batch_apply")
+    @_locked
+    def replay_journal(self) -> tuple[bool, str]:
+        """将操作日志中待同步的操作合并为一次远程批量更新
+
+        同一公钥只保留最新操作；实际下发内容以数据库当前状态为准
+        （已启用的客户端下发，其余移除），因此重复执行是幂等的。
+        """
+        entries = self.db.get_journal(self._server_id) if self._server_id else []
+        if not entries:
+            return True, "没有待同步的操作"
 
-    def _sync_peer_remove_to_remote(self, public_key: str) -> tuple[bool, str]:
-        """同步删除客户端到远程服务器（不重启服务）"""
         remote_wg = self.get_remote_wg()
         if not remote_wg:
-            return True, "SSH 未配置，跳过远程同步"
+            return False, "SSH 未配置"
 
-        # 1. 先更新配置文件（此时 peer 已从本地数据库删除）
-        config = self.get_server_config()
-        success, msg = remote_wg.update_config(config)
+        enabled = {p.public_key: p for p in self.peers if p.enabled}
+        upserts = [enabled[e.public_key] for e in entries if e.public_key in enabled]
+        removes = [e.public_key for e in entries if e.public_key not in enabled]
+
+        success, msg = remote_wg.apply_changes(
+            self.get_server_config(),
+            upserts=[(p.public_key, peer_allowed_ips(p.address), p.preshared_key)
+                     for p in upserts],
+            removes=removes
+        )
         if not success:
-            return False, f"更新远程配置失败: {msg}"
+            return False, f"远程同步失败，{len(entries)} 个操作已保留待重试: {msg}"
 
-        # 2. 动态移除 peer（不重启）
-        success, msg = remote_wg.remove_peer_live(public_key)
-        if success:
-            return True, "客户端已从远程移除"
+        self.db.clear_journal(self._server_id, entries[-1].id)
+        return True, f"已同步 {len(entries)} 个操作到远程"
 
-        # 动态更新失败，尝试重载配置
-        return remote_wg.reload()
+    def pending_remote_ops(self) -> int:
+        """操作日志中待同步的操作数量"""
+        return self.db.count_journal(self._server_id) if self._server_id else 0
 
+    @timed("sync.full")
+    @_locked
     def _sync_to_remote(self) -> tuple[bool, str]:
-        """同步完整配置到远程服务器"""
+        """同步完整配置到远程服务器（成功后清空操作日志）"""
         remote_wg = self.get_remote_wg()
         if not remote_wg:
             return True, "SSH 未配置，跳过远程同步"
 
+        pending = self.db.get_journal(self._server_id)
         config = self.get_server_config()
         success, msg = remote_wg.update_config(config)
         if not success:
@@ -599,6 +1049,8 @@ AllowedIPs = {peer.address.split('/')[0]}/32
 
         # 重载配置
         success, msg = remote_wg.reload()
+        if success and pending:
+            self.db.clear_journal(self._server_id, pending[-1].id)
         return success, msg
 
     def sync_to_remote(self) -> tuple[bool, str]:
@@ -612,14 +1064,108 @@ AllowedIPs = {peer.address.split('/')[0]}/32
             return False, "SSH 未配置"
         return remote_wg.get_status()
 
+    def get_peer_statuses(self, max_age: float = 0) -> dict[str, PeerStatus]:
+        """获取远程 peer 运行状态，按 public_key 索引
+
+        max_age > 0 时允许使用该时间内的缓存，见 get_host_statuses。
+        """
+        _, interfaces = self.get_host_statuses(max_age)
+        if self.server.interface not in interfaces:
+            raise RuntimeError(f"远程接口 {self.server.interface} 未运行")
+        return {status.public_key: status for status in interfaces[self.server.interface]}
+
+    def get_host_statuses(self, max_age: float = 0) -> tuple[float, dict[str, list[PeerStatus]]]:
+        """获取服务端所在主机上所有接口的 peer 状态（一次 `wg show all dump`）
+
+        结果缓存在数据库中，按 SSH 目标共享：max_age 秒内的缓存直接使用；
+        缓存过期时只有一个调用方刷新，其他调用方在刷新期间继续使用旧数据。
+        返回 (采集时间, {接口: [状态]})。
+        """
+        from .ssh import parse_dump_all
+
+        ssh_config = self.db.get_ssh_config(self._server_id) if self._server_id else None
+        client = self.get_ssh_client()
+        if not ssh_config or not client:
+            raise RuntimeError("SSH 未配置")
+
+        target = f"{ssh_config['user']}@{ssh_config['host']}:{ssh_config['port']}"
+        now = time.time()
+        claimed = False
+        if max_age > 0:
+            cached = self.db.get_status_cache(target)
+            if cached:
+                if now - cached[0] < max_age or \
+                        not self.db.claim_status_refresh(target, now, max_age):
+                    return cached[0], parse_dump_all(cached[1])
+                claimed = True
+
+        try:
+            success, output = client.run_command("wg show all dump")
+            if not success:
+                raise RuntimeError(f"获取远程状态失败: {output}")
+        except BaseException:
+            # 释放刷新申请，其他调用方不必等到申请过期才能重试
+            if claimed:
+                self.db.release_status_refresh(target)
+            raise
+        self.db.save_status_cache(target, now, output)
+        return now, parse_dump_all(output)
+
     # ========== 其他功能 ==========
 
     def list_peers(self) -> list[Peer]:
         """列出所有客户端"""
-        return self.peers
+        return list(self.peers)
+
+    def iter_peer_summaries(self, match: Optional[str] = None, network: Optional[str] = None,
+                            enabled: Optional[bool] = None,
+                            created_after: Optional[str] = None) -> Iterator[PeerSummary]:
+        """逐个返回客户端摘要（不加载密钥），可按条件过滤
+
+        match: 名称 glob 模式，不含通配符时按前缀匹配
+        network: CIDR 网段，如 10.0.0.0/28
+        enabled: True 只返回启用的，False 只返回禁用的
+        created_after: ISO 时间，只返回之后创建的
+        """
+        if not self._server_id:
+            return iter(())
+        filters = {"enabled": enabled, "created_after": created_after}
+        if match is not None:
+            filters["name_glob"] = match if any(c in match for c in "*?[") else f"{match}*"
+        if network is not None:
+            filters["network"] = ipaddress.ip_network(network, strict=False)
+        return self.db.iter_peer_summaries(self._server_id, **filters)
+
+    def get_peer_summaries(self, **filters) -> list[PeerSummary]:
+        """列出客户端摘要（不加载密钥，用于展示），过滤条件同 iter_peer_summaries"""
+        return list(self.iter_peer_summaries(**filters))
+
+    def count_peers(self, server_id: Optional[int] = None) -> int:
+        """统计客户端数量，默认为当前服务端"""
+        server_id = server_id or self._server_id
+        return self.db.count_peers(server_id) if server_id else 0
 
     def get_status(self) -> dict:
         """获取本地 WireGuard 状态"""
         from .crypto import run_wg_command
         success, output = run_wg_command(["wg", "show"])
         return {"running": success, "output": output if success else "WireGuard 未运行或无权限"}
+
+
+class ServerHandle(WireGuardManager):
+    """固定绑定到一个服务端的 manager（由 WireGuardManager.server_handle 创建）
+
+    与普通 manager 接口相同，但不能切换服务端；多个句柄可在不同线程中
+    同时操作不同服务端，SSH 连接由创建它的根 manager 按主机复用。
+    """
+
+    def __init__(self, root: WireGuardManager, server_id: int):
+        super().__init__(server_id, db=root.db, ssh_control_dir=root.ssh_control_dir)
+        self.config_dir = root.config_dir
+        self.export_dir = root.export_dir
+        self._root = root
+
+    def _pinned(self, *args, **kwargs):
+        raise RuntimeError("服务端句柄不能切换服务端")
+
+    switch_server = init_server = import_server = _pinned
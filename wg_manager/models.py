@@ -4,9 +4,9 @@ from dataclasses import dataclass
 from typing import Optional
 
 
-@dataclass
+@dataclass(frozen=True)
 class Peer:
-    """客户端/Peer 配置"""
+    """客户端/Peer 配置（不可变，修改时用 dataclasses.replace 生成新对象）"""
     id: Optional[int]
     server_id: int  # 所属服务端 ID
     name: str
@@ -22,9 +22,24 @@ class Peer:
     enabled: bool = True
 
 
-@dataclass
+@dataclass(slots=True)
+class PeerSummary:
+    """客户端摘要 - 列表/统计用的投影，不含私钥和预共享密钥"""
+    id: int
+    name: str
+    public_key: str
+    address: str
+    enabled: bool
+    listen_port: int
+    mtu: int
+    dns: str
+    created_at: str
+    has_private_key: bool  # False 表示导入的客户端
+
+
+@dataclass(frozen=True)
 class ServerConfig:
-    """服务端配置"""
+    """服务端配置（不可变，多线程间可安全共享）"""
     id: Optional[int] = None
     private_key: str = ""
     public_key: str = ""
@@ -34,3 +49,95 @@ class ServerConfig:
     endpoint: str = ""
     post_up: str = ""
     post_down: str = ""
+    routes: str = ""  # 经由服务端访问的额外网段（逗号分隔），加入客户端 AllowedIPs
+    config_generation: int = 1  # 影响客户端配置的字段变更时递增
+
+
+@dataclass
+class PeerStatus:
+    """远程 peer 运行状态 (来自 wg show dump)"""
+    public_key: str
+    endpoint: str = ""
+    allowed_ips: str = ""
+    latest_handshake: int = 0  # Unix 时间戳，0 表示从未握手
+    transfer_rx: int = 0
+    transfer_tx: int = 0
+
+
+@dataclass
+class JournalEntry:
+    """待同步到远程的操作（远程不可达时记录）"""
+    id: int
+    server_id: int
+    op: str  # "upsert" 或 "remove"
+    public_key: str
+    created_at: str
+
+
+@dataclass
+class ServerHealth:
+    """服务端健康检查结果 (health 命令)"""
+    server_id: int
+    endpoint: str
+    interface: str
+    target: str  # SSH 目标 user@host:port
+    reachable: bool = False
+    active: bool = False  # systemctl is-active wg-quick@<接口>
+    interface_up: bool = False  # ip link show <接口>
+    config_sha256: str = ""  # 远程配置文件哈希，空表示文件不存在
+    config_match: bool = False  # 与数据库生成的配置一致
+    peer_count: int = 0  # 运行中的 peer 数量
+    expected_peers: int = 0  # 数据库中已启用的客户端数量
+    elapsed: float = 0.0  # 该主机检查耗时（秒）
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return (self.reachable and self.active and self.interface_up
+                and self.config_match and self.peer_count == self.expected_peers)
+
+
+@dataclass
+class DriftEntry:
+    """配置漂移 (drift 命令)：数据库与远程配置文件/运行状态之间的差异"""
+    server_id: int
+    endpoint: str
+    interface: str
+    source: str  # "file" 远程配置文件，"live" wg show dump，"ssh" 连接失败
+    kind: str  # "added" 仅远程存在，"missing" 仅数据库存在，"mismatch" 内容不同，"error"
+    public_key: str = ""
+    name: str = ""
+    detail: str = ""
+
+
+@dataclass(frozen=True)
+class Topology:
+    """服务端之间的站点互联拓扑 (mesh 全互联 / hub 星型)"""
+    id: Optional[int]
+    name: str
+    kind: str = "mesh"  # "mesh" 每个节点连接其他所有节点，"hub" 分支节点只连接中心节点
+    interface: str = "wgm0"  # 各节点上用于互联的接口
+    network: str = "10.255.0.0/24"  # 节点隧道地址段
+    listen_port: int = 51900
+    created_at: str = ""
+
+
+@dataclass(frozen=True)
+class TopologyNode:
+    """拓扑中的节点（对应一个服务端），拥有独立的互联密钥对和隧道地址"""
+    topology_id: int
+    server_id: int
+    private_key: str
+    public_key: str
+    address: str  # 隧道地址，如 10.255.0.1/32
+    routes: str = ""  # 经由该节点访问的额外网段（逗号分隔），服务端自身网段自动包含
+    hub: bool = False  # hub 拓扑的中心节点
+    pushed_hash: str = ""  # 最近一次成功下发的配置哈希
+
+
+@dataclass(frozen=True)
+class ShardPolicy:
+    """endpoint 的分片策略：每个接口的客户端上限，以及新分片的地址池"""
+    endpoint: str
+    max_peers: int
+    pool: str  # 新分片的网段从中分配，如 10.0.0.0/16
@@ -0,0 +1,43 @@
+"""结构化输出 (json / ndjson / csv)
+
+逐行写出，不在内存中拼接完整结果，配合数据库游标可在大量客户端时保持内存平稳。
+"""
+
+import csv
+import json
+import sys
+from typing import Iterable, Optional, TextIO
+
+
+def write_rows(rows: Iterable[dict], fmt: str, fields: list[str],
+               stream: Optional[TextIO] = None):
+    """按指定格式输出多行记录
+
+    json 输出为数组，ndjson 每行一个对象，csv 第一行为表头。
+    """
+    stream = stream or sys.stdout
+    if fmt == "ndjson":
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+    elif fmt == "json":
+        stream.write("[")
+        for i, row in enumerate(rows):
+            stream.write(("," if i else "") + "\n  " + json.dumps(row, ensure_ascii=False))
+        stream.write("\n]\n")
+    elif fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            # 布尔值写为 1/0，便于其他工具解析
+            writer.writerow({k: int(v) if isinstance(v, bool) else v for k, v in row.items()})
+    else:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+
+
+def write_object(obj: dict, fmt: str, stream: Optional[TextIO] = None):
+    """输出单个对象（json 为对象而非数组，ndjson/csv 为单行）"""
+    stream = stream or sys.stdout
+    if fmt == "json":
+        stream.write(json.dumps(obj, ensure_ascii=False, indent=2) + "\n")
+    else:
+        write_rows([obj], fmt, list(obj), stream)
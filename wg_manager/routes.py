@@ -0,0 +1,107 @@
+"""AllowedIPs 计算与路由汇总
+
+客户端和互联节点的 AllowedIPs 由服务端网段、额外路由等多个网段组成，这里用
+ipaddress.collapse_addresses 合并为最小的路由集合（去重、去掉被包含的网段、合并相邻
+网段），减少配置条目和 wg-quick 添加的内核路由；同时找出相互重叠的网段用于提示。
+"""
+
+import functools
+import ipaddress
+from typing import Iterable, Union
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(value: Union[str, Iterable[str]]) -> list[IPNetwork]:
+    """解析网段（逗号分隔的字符串或列表），主机位不为 0 时取所在网段，无效时抛出 ValueError"""
+    parts = value.split(",") if isinstance(value, str) else value
+    networks = []
+    for part in filter(None, (p.strip() for p in parts)):
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            raise ValueError(f"无效的网段: {part}")
+    return networks
+
+
+def summarize(networks: Iterable[IPNetwork]) -> list[IPNetwork]:
+    """合并为最小的路由集合，IPv4 在前"""
+    networks = list(networks)
+    return (list(ipaddress.collapse_addresses(n for n in networks if n.version == 4))
+            + list(ipaddress.collapse_addresses(n for n in networks if n.version == 6)))
+
+
+def find_overlaps(networks: Iterable[IPNetwork]) -> list[tuple[IPNetwork, IPNetwork]]:
+    """找出相互重叠的网段，返回 [(较大的网段, 被包含的网段)]
+
+    两个网段要么不相交要么一个包含另一个，按起始地址排序后用栈扫描一遍即可；
+    重复的网段也记为重叠。
+    """
+    overlaps = []
+    stack: list[IPNetwork] = []
+    for network in sorted(networks, key=lambda n: (n.version, n.network_address, n.prefixlen)):
+        while stack and not (stack[-1].version == network.version
+                             and network.subnet_of(stack[-1])):
+            stack.pop()
+        if stack:
+            overlaps.append((stack[-1], network))
+        stack.append(network)
+    return overlaps
+
+
+def format_routes(networks: Iterable[IPNetwork]) -> str:
+    """格式化为 AllowedIPs 的写法"""
+    return ", ".join(map(str, networks))
+
+
+def server_networks(address: str) -> list[IPNetwork]:
+    """服务端地址（可为逗号分隔的多个地址）所在的网段"""
+    return [ipaddress.ip_interface(part.strip()).network
+            for part in address.split(",") if part.strip()]
+
+
+def client_routes(server_address: str, extra: str = "") -> list[IPNetwork]:
+    """客户端的 AllowedIPs：服务端网段 + 额外路由，汇总后的结果"""
+    return summarize(server_networks(server_address) + parse_networks(extra))
+
+
+@functools.lru_cache(maxsize=64)
+def client_allowed_ips(server_address: str, extra: str = "") -> str:
+    """client_routes 的文本形式（批量生成客户端配置时每个服务端只计算一次）"""
+    return format_routes(client_routes(server_address, extra))
+
+
+def client_address(peer_address: str, server_address: str) -> str:
+    """客户端配置中的 Address：每个地址使用所在服务端网段的前缀长度
+
+    不在任何服务端网段内的地址按单个主机处理 (/32 或 /128)。
+    """
+    networks = server_networks(server_address)
+    addresses = []
+    for part in filter(None, (p.strip() for p in peer_address.split(","))):
+        ip = ipaddress.ip_interface(part).ip
+        network = next((n for n in networks if ip in n), None)
+        addresses.append(f"{ip}/{network.prefixlen if network else ip.max_prefixlen}")
+    return ", ".join(addresses)
+
+
+def peer_allowed_ips(peer_address: str) -> str:
+    """服务端配置中客户端的 AllowedIPs
+
+    客户端地址按单个主机路由；以网络地址书写的网段（如导入的 192.168.50.0/24）
+    视为该客户端后面的子网，原样路由。
+    """
+    # 常见情况：单个主机地址，无需解析（生成上万个客户端的服务端配置时）
+    address = peer_address.strip()
+    if "," not in address and address.endswith("/128" if ":" in address else "/32"):
+        return address
+
+    networks = []
+    for part in filter(None, (p.strip() for p in peer_address.split(","))):
+        interface = ipaddress.ip_interface(part)
+        if interface.ip == interface.network.network_address and \
+                interface.network.prefixlen < interface.ip.max_prefixlen:
+            networks.append(interface.network)
+        else:
+            networks.append(ipaddress.ip_network(interface.ip))
+    return format_routes(summarize(networks))
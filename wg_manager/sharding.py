@@ -0,0 +1,186 @@
+"""按 endpoint 自动分片 (shard 命令)
+
+单个接口的客户端过多时 wg syncconf 变慢，地址池也会用尽。为 endpoint 设置每个接口的
+客户端上限后，新客户端放到负载最低且未满的分片（同一 endpoint 的 wg0、wg1…）；
+所有分片都已满时自动创建新接口：地址段与已有网段互不重叠，监听端口随机。
+"""
+
+import ipaddress
+import itertools
+import math
+import threading
+from typing import Optional
+
+from .config import generate_random_port
+from .manager import WireGuardManager
+from .models import ServerConfig, ShardPolicy
+from .routes import parse_networks, server_networks
+
+# 放置客户端、创建分片时持有，避免同一进程内并发添加时重复创建分片
+_placement_lock = threading.Lock()
+
+
+def shard_prefix(max_peers: int) -> int:
+    """能容纳 max_peers 个客户端的最小 IPv4 网段前缀（网络地址、广播地址和服务端各占一个）"""
+    return max(8, min(30, 32 - math.ceil(math.log2(max_peers + 3))))
+
+
+def shard_capacity(server: ServerConfig, max_peers: int) -> int:
+    """分片实际可容纳的客户端数（不超过上限，也不超过网段的可用地址数）"""
+    network = server_networks(server.address)[0]
+    return max(0, min(max_peers, network.num_addresses - 3))
+
+
+def set_policy(manager: WireGuardManager, endpoint: str, max_peers: int,
+               pool: Optional[str] = None) -> ShardPolicy:
+    """设置分片策略，pool 默认为第一个接口所在的 /16"""
+    if max_peers < 1:
+        raise ValueError("每个接口的客户端上限必须大于 0")
+    servers = manager.db.get_servers_by_endpoint(endpoint)
+    if not servers:
+        raise ValueError(f"服务端 '{endpoint}' 不存在")
+
+    if pool:
+        network = parse_networks(pool)[0]
+    else:
+        base = server_networks(min(servers, key=lambda s: s.id).address)[0]
+        network = base.supernet(new_prefix=16) if base.prefixlen > 16 else base
+    if network.version != 4:
+        raise ValueError("仅支持 IPv4 地址池")
+    if shard_prefix(max_peers) < network.prefixlen:
+        raise ValueError(f"地址池 {network} 容纳不下 {max_peers} 个客户端的分片")
+
+    policy = ShardPolicy(endpoint=endpoint, max_peers=max_peers, pool=str(network))
+    manager.db.set_shard_policy(policy)
+    return policy
+
+
+def get_shards(manager: WireGuardManager, endpoint: str) -> list[tuple[ServerConfig, int]]:
+    """endpoint 的所有分片及其客户端数"""
+    counts = manager.db.count_peers_by_server()
+    return [(s, counts.get(s.id, 0)) for s in manager.db.get_servers_by_endpoint(endpoint)]
+
+
+def _used_networks(manager: WireGuardManager) -> list:
+    """已占用的网段：所有服务端的网段和额外路由、站点互联的隧道地址段"""
+    networks = []
+    for server in manager.get_servers():
+        networks += server_networks(server.address) + parse_networks(server.routes)
+    networks += [ipaddress.ip_network(t.network) for t in manager.db.get_topologies()]
+    return networks
+
+
+def create_shard(manager: WireGuardManager, endpoint: str) -> ServerConfig:
+    """为 endpoint 创建新分片
+
+    接口名取下一个未使用的 wgN，网段从地址池中选第一个不与已有网段重叠的，
+    PostUp/PostDown、SSH 配置、额外路由和同步模式沿用该 endpoint 的第一个接口。
+    """
+    from .crypto import generate_keypair
+
+    policy = manager.db.get_shard_policy(endpoint)
+    if not policy:
+        raise RuntimeError(f"{endpoint} 未设置分片策略")
+    shards = manager.db.get_servers_by_endpoint(endpoint)
+    if not shards:
+        raise ValueError(f"服务端 '{endpoint}' 不存在")
+    base = min(shards, key=lambda s: s.id)
+
+    # 站点互联接口在各节点主机上同样占用接口名和端口
+    topologies = manager.db.get_topologies()
+    interfaces = {s.interface for s in shards} | {t.interface for t in topologies}
+    interface = next(f"wg{i}" for i in itertools.count() if f"wg{i}" not in interfaces)
+    ports = {s.listen_port for s in shards} | {t.listen_port for t in topologies}
+    port = generate_random_port()
+    while port in ports:
+        port = generate_random_port()
+
+    pool = ipaddress.ip_network(policy.pool)
+    used = [n for n in _used_networks(manager) if n.version == 4 and n.overlaps(pool)]
+    network = next((candidate for candidate in pool.subnets(new_prefix=shard_prefix(policy.max_peers))
+                    if not any(candidate.overlaps(n) for n in used)), None)
+    if network is None:
+        raise RuntimeError(f"地址池 {pool} 已无可用网段")
+
+    private_key, public_key = generate_keypair()
+    server = manager.db.save_server(ServerConfig(
+        private_key=private_key,
+        public_key=public_key,
+        address=f"{network.network_address + 1}/{network.prefixlen}",
+        listen_port=port,
+        interface=interface,
+        endpoint=endpoint,
+        post_up=base.post_up,
+        post_down=base.post_down,
+    ))
+    ssh_config = manager.db.get_ssh_config(base.id)
+    if ssh_config:
+        manager.db.save_ssh_config(server.id, ssh_config["host"], ssh_config["port"],
+                                   ssh_config["user"])
+    if base.routes:
+        manager.db.set_server_routes(server.id, base.routes)
+    if manager.db.is_sync_deferred(base.id):
+        manager.db.set_sync_deferred(server.id, True)
+    return manager.db.get_server(server.id)
+
+
+def place_peer(manager: WireGuardManager, name: str) -> Optional[tuple[ServerConfig, bool]]:
+    """为新客户端选择分片，返回 (服务端, 是否新建的分片)；当前 endpoint 未设置分片策略时返回 None
+
+    选择未满的分片中客户端最少的一个，都已满时创建新分片。客户端名称在
+    同一 endpoint 的所有分片中唯一（导出的配置文件以名称命名）。
+    上限是软限制：跨进程并发添加时个别分片可能略微超出。
+    """
+    endpoint = manager.server.endpoint
+    policy = manager.db.get_shard_policy(endpoint) if endpoint else None
+    if not policy:
+        return None
+
+    with _placement_lock:
+        shards = get_shards(manager, endpoint)
+        for server, _ in shards:
+            if manager.db.get_peer_by_name(name, server.id):
+                raise ValueError(f"客户端名称 '{name}' 已存在 ({server.interface})")
+        available = [(count, server.id, server) for server, count in shards
+                     if count < shard_capacity(server, policy.max_peers)]
+        if available:
+            return min(available)[2], False
+        return create_shard(manager, endpoint), True
+
+
+def endpoint_shards(manager: WireGuardManager) -> list[ServerConfig]:
+    """当前 endpoint 设置了分片策略时返回其所有分片，否则只返回当前服务端
+
+    按模式匹配、列出客户端等作用于整个 endpoint 的操作据此遍历所有分片。
+    """
+    endpoint = manager.server.endpoint
+    if not endpoint or not manager.db.get_shard_policy(endpoint):
+        return [manager.server]
+    return manager.db.get_servers_by_endpoint(endpoint)
+
+
+def locate_peer(manager: WireGuardManager, name: str) -> Optional[ServerConfig]:
+    """在当前 endpoint 的所有分片中查找客户端所在的服务端
+
+    未设置分片策略或找不到客户端时返回 None。设置了分片策略时客户端名称在
+    endpoint 内唯一，只给出 endpoint 的按名称操作（删除、启停、导出）据此定位分片。
+    """
+    endpoint = manager.server.endpoint
+    if not endpoint or not manager.db.get_shard_policy(endpoint):
+        return None
+    if manager.db.get_peer_by_name(name, manager.server_id):
+        return manager.server
+    return next((server for server in manager.db.get_servers_by_endpoint(endpoint)
+                 if manager.db.get_peer_by_name(name, server.id)), None)
+
+
+def group_by_shard(manager: WireGuardManager, names: list[str]) -> list[tuple[ServerConfig, list[str]]]:
+    """按所在分片分组客户端名称，找不到的名称归入当前服务端（由调用方报告缺失）"""
+    endpoint = manager.server.endpoint
+    if not endpoint or not manager.db.get_shard_policy(endpoint):
+        return [(manager.server, list(names))]
+    groups: dict[int, tuple[ServerConfig, list[str]]] = {}
+    for name in names:
+        server = locate_peer(manager, name) or manager.server
+        groups.setdefault(server.id, (server, []))[1].append(name)
+    return list(groups.values())
@@ -1,11 +1,16 @@
 """SSH 远程管理模块"""
 
+import os
+import shlex
 import subprocess
+import threading
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
-from .config import REMOTE_WG_DIR
+from .config import FAKE_HOSTS_ENV, REMOTE_WG_DIR
+from .models import PeerStatus
+from .timing import timed
 
 
 @dataclass
@@ -15,22 +20,38 @@ class SSHConfig:
     port: int = 22
     user: str = "root"
     key_file: Optional[str] = None
+    control_path: Optional[str] = None  # 设置后复用 SSH 主连接 (ControlMaster)
+    control_persist: str = "10m"
 
 
 class SSHClient:
     """SSH 客户端 - 使用系统 ssh 命令"""
 
+    # 远程 WireGuard 配置目录
+    wg_dir = REMOTE_WG_DIR
+
     def __init__(self, config: SSHConfig):
         self.config = config
         self._connected = False
 
+    def _control_options(self) -> list[str]:
+        """SSH 连接复用选项"""
+        if not self.config.control_path:
+            return []
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={self.config.control_path}",
+            "-o", f"ControlPersist={self.config.control_persist}"
+        ]
+
     def _build_ssh_cmd(self, extra_args: list[str] = None) -> list[str]:
         """构建 SSH 命令"""
         cmd = [
             "ssh",
             "-o", "StrictHostKeyChecking=no",
             "-o", "BatchMode=yes",
-            "-o", "ConnectTimeout=10"
+            "-o", "ConnectTimeout=10",
+            *self._control_options()
         ]
 
         if self.config.port != 22:
@@ -52,7 +73,8 @@ class SSHClient:
             "scp",
             "-o", "StrictHostKeyChecking=no",
             "-o", "BatchMode=yes",
-            "-o", "ConnectTimeout=10"
+            "-o", "ConnectTimeout=10",
+            *self._control_options()
         ]
 
         if self.config.port != 22:
@@ -70,6 +92,7 @@ class SSHClient:
 
         return cmd
 
+    @timed("ssh.test_connection")
     def test_connection(self) -> tuple[bool, str]:
         """测试 SSH 连接"""
         try:
@@ -84,6 +107,15 @@ class SSHClient:
         except Exception as e:
             return False, str(e)
 
+    def close(self):
+        """关闭复用的 SSH 主连接"""
+        if not self.config.control_path:
+            return
+        cmd = self._build_ssh_cmd()
+        cmd[1:1] = ["-O", "exit"]
+        subprocess.run(cmd, capture_output=True, timeout=10)
+
+    @timed("ssh.run_command")
     def run_command(self, command: str) -> tuple[bool, str]:
         """执行远程命令"""
         try:
@@ -97,6 +129,23 @@ class SSHClient:
         except Exception as e:
             return False, str(e)
 
+    @timed("ssh.run_script")
+    def run_script(self, script: str, timeout: int = 60) -> tuple[bool, str]:
+        """通过 stdin 在远程执行 shell 脚本（单次 SSH 调用）"""
+        try:
+            cmd = self._build_ssh_cmd(["sh", "-s"])
+            result = subprocess.run(
+                cmd, input=script, capture_output=True, text=True, timeout=timeout
+            )
+            if result.returncode == 0:
+                return True, result.stdout.strip()
+            return False, result.stderr.strip() or result.stdout.strip()
+        except subprocess.TimeoutExpired:
+            return False, "命令执行超时"
+        except Exception as e:
+            return False, str(e)
+
+    @timed("ssh.upload")
     def upload_file(self, local_path: str, remote_path: str) -> tuple[bool, str]:
         """上传文件到远程服务器"""
         try:
@@ -110,6 +159,7 @@ class SSHClient:
         except Exception as e:
             return False, str(e)
 
+    @timed("ssh.download")
     def download_file(self, remote_path: str, local_path: str) -> tuple[bool, str]:
         """从远程服务器下载文件"""
         try:
@@ -127,6 +177,7 @@ class SSHClient:
         """读取远程文件内容"""
         return self.run_command(f"cat {remote_path}")
 
+    @timed("ssh.write_file")
     def write_remote_file(self, remote_path: str, content: str) -> tuple[bool, str]:
         """写入远程文件（通过 stdin）"""
         try:
@@ -141,13 +192,96 @@ class SSHClient:
             return False, str(e)
 
 
+def connect(config: SSHConfig) -> SSHClient:
+    """根据配置创建客户端
+
+    设置 FAKE_HOSTS_ENV=1 时（开发、压测），host 为 "local:<目录>" 的主机使用源码目录中
+    benchmarks/localhost.py 模拟的本地主机；未设置时按普通 SSH 主机处理。
+    """
+    if config.host.startswith("local:") and os.environ.get(FAKE_HOSTS_ENV) == "1":
+        try:
+            from benchmarks.localhost import LocalHost
+        except ImportError:
+            raise RuntimeError("本地模拟主机只能在源码目录中使用 (benchmarks/localhost.py)")
+        return LocalHost.from_spec(config.host)
+    return SSHClient(config)
+
+
+class SSHPool:
+    """按主机 (host, port, user) 复用 SSH 客户端
+
+    同一主机上的多个接口（服务端）共享一个客户端和 ControlMaster 主连接。
+    """
+
+    def __init__(self, control_dir: Optional[Path] = None):
+        self.control_dir = control_dir
+        self._clients: dict[tuple[str, int, str], SSHClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str, port: int = 22, user: str = "root",
+            key_file: Optional[str] = None) -> SSHClient:
+        """获取（必要时创建）主机对应的客户端"""
+        key = (host, port, user)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                control_path = str(self.control_dir / "%C") if self.control_dir else None
+                client = self._clients[key] = connect(SSHConfig(
+                    host=host, port=port, user=user, key_file=key_file,
+                    control_path=control_path))
+            return client
+
+    def close(self):
+        """关闭所有主连接"""
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
+
+
+def _parse_peer_fields(fields: list[str]) -> PeerStatus:
+    """解析 dump 中的一个 peer 行 (public_key, preshared_key, endpoint, allowed_ips, ...)"""
+    return PeerStatus(
+        public_key=fields[0],
+        endpoint="" if fields[2] == "(none)" else fields[2],
+        allowed_ips="" if fields[3] == "(none)" else fields[3],
+        latest_handshake=int(fields[4] or 0),
+        transfer_rx=int(fields[5] or 0),
+        transfer_tx=int(fields[6] or 0)
+    )
+
+
+def parse_dump(output: str) -> list[PeerStatus]:
+    """解析 `wg show <interface> dump` 输出中的 peer 行"""
+    peers = []
+    for line in output.splitlines()[1:]:
+        fields = line.split("\t")
+        if len(fields) < 8:
+            continue
+        peers.append(_parse_peer_fields(fields))
+    return peers
+
+
+def parse_dump_all(output: str) -> dict[str, list[PeerStatus]]:
+    """解析 `wg show all dump` 输出，按接口分组（每行以接口名开头）"""
+    interfaces: dict[str, list[PeerStatus]] = {}
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 9:
+            interfaces.setdefault(fields[0], []).append(_parse_peer_fields(fields[1:]))
+        elif len(fields) >= 5:
+            # 接口行: interface, private_key, public_key, listen_port, fwmark
+            interfaces.setdefault(fields[0], [])
+    return interfaces
+
+
 class RemoteWireGuard:
     """远程 WireGuard 管理"""
 
     def __init__(self, ssh_client: SSHClient, interface: str = "wg0"):
         self.ssh = ssh_client
         self.interface = interface
-        self.config_path = f"{REMOTE_WG_DIR}/{interface}.conf"
+        self.config_path = f"{ssh_client.wg_dir}/{interface}.conf"
 
     def get_config(self) -> tuple[bool, str]:
         """获取远程配置文件"""
@@ -161,6 +295,13 @@ class RemoteWireGuard:
         """获取 WireGuard 状态"""
         return self.ssh.run_command("wg show")
 
+    def get_dump(self) -> tuple[bool, list[PeerStatus] | str]:
+        """获取运行中 peer 状态（握手时间、流量）"""
+        success, output = self.ssh.run_command(f"wg show {self.interface} dump")
+        if not success:
+            return False, output
+        return True, parse_dump(output)
+
     def restart(self) -> tuple[bool, str]:
         """重启 WireGuard 服务"""
         success, output = self.ssh.run_command(
@@ -179,9 +320,8 @@ class RemoteWireGuard:
             # 接口存在，使用 wg syncconf 热重载
             # 先生成 strip 配置到临时文件，避免进程替换问题
             strip_cmd = (
-                f"wg-quick strip {self.interface} > /tmp/{self.interface}_strip.conf && "
-                f"wg syncconf {self.interface} /tmp/{self.interface}_strip.conf && "
-                f"rm -f /tmp/{self.interface}_strip.conf"
+                f"f=$(mktemp) && wg-quick strip {self.interface} > \"$f\" && "
+                f"wg syncconf {self.interface} \"$f\"; rc=$?; rm -f \"$f\"; exit $rc"
             )
             success, output = self.ssh.run_command(strip_cmd)
             if success:
@@ -225,3 +365,58 @@ class RemoteWireGuard:
         return self.ssh.run_command(
             f"wg set {self.interface} peer {public_key} remove"
         )
+
+    def apply_changes(self, config_content: str,
+                      upserts: list[tuple[str, str, str]] = (),
+                      removes: list[str] = (),
+                      private_key: Optional[str] = None,
+                      timeout: int = 60) -> tuple[bool, str]:
+        """写入配置文件并批量更新运行中的 peer（单次 SSH 调用）
+
+        upserts 为 (public_key, allowed_ips, preshared_key) 列表，
+        removes 为需要移除的 public_key 列表，private_key 为新的接口私钥（轮换时），
+        timeout 为整个脚本的超时时间（秒）。
+        `wg set` 失败时回退到 syncconf。
+        """
+        # 接口名可能来自用户输入，写入 root 执行的脚本前统一转义
+        iface = shlex.quote(self.interface)
+        lines = [
+            "set -e",
+            "umask 077",
+            f"cat > {shlex.quote(self.config_path)} <<'WG_MANAGER_EOF'",
+            config_content.rstrip("\n"),
+            "WG_MANAGER_EOF",
+            f"if ! ip link show {iface} >/dev/null 2>&1; then",
+            f"  systemctl restart {shlex.quote('wg-quick@' + self.interface)}",
+            "  exit 0",
+            "fi",
+            'tmp=$(mktemp -d)',
+            'trap \'rm -rf "$tmp"\' EXIT',
+        ]
+
+        args = []
+        if private_key:
+            lines.append(f"printf '%s\\n' {shlex.quote(private_key)} > \"$tmp/private.key\"")
+            args.append("private-key \"$tmp/private.key\"")
+        for i, (public_key, allowed_ips, preshared_key) in enumerate(upserts):
+            args.append(f"peer {shlex.quote(public_key)}")
+            if preshared_key:
+                lines.append(f"printf '%s\\n' {shlex.quote(preshared_key)} > \"$tmp/{i}\"")
+                args.append(f"preshared-key \"$tmp/{i}\"")
+            args.append(f"allowed-ips {shlex.quote(allowed_ips.replace(' ', ''))}")
+        for public_key in removes:
+            args.append(f"peer {shlex.quote(public_key)} remove")
+
+        sync_cmd = (
+            f"{{ wg-quick strip {iface} > \"$tmp/strip.conf\" && "
+            f"wg syncconf {iface} \"$tmp/strip.conf\"; }}"
+        )
+        if args:
+            lines.append(f"wg set {iface} {' '.join(args)} || {sync_cmd}")
+        else:
+            lines.append(sync_cmd)
+
+        success, output = self.ssh.run_script("\n".join(lines) + "\n", timeout=timeout)
+        if success:
+            return True, "配置已批量更新"
+        return False, output
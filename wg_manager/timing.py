@@ -0,0 +1,220 @@
+"""轻量级耗时统计
+
+未启用时 span()/timed() 几乎没有开销；启用后记录每个阶段的开始时间和耗时，
+可输出汇总表、JSON Lines 或 Chrome Trace (chrome://tracing / Perfetto)。
+
+    from .timing import span, timed
+
+    @timed("crypto.genkey")
+    def generate_private_key(): ...
+
+    with span("render.server_config"):
+        ...
+
+cProfile 分析由 get_profiler() 统一读取配置（参数优先，其次 WG_MANAGER_PROFILE /
+WG_MANAGER_PROFILE_TOP 环境变量），CLI、常驻服务和直接调用库的程序共用：
+
+    profiler = get_profiler()
+    if profiler:
+        profiler.call(manager.sync_to_remote)
+        profiler.report()
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+PROFILE_ENV = "WG_MANAGER_PROFILE"
+PROFILE_TOP_ENV = "WG_MANAGER_PROFILE_TOP"
+
+_enabled = False
+_lock = threading.Lock()
+_spans: list["Span"] = []
+_origin = time.perf_counter()
+
+
+class Span(NamedTuple):
+    """一次计时记录（时间单位: 秒，start 相对于进程内计时起点）"""
+    name: str
+    start: float
+    duration: float
+    thread_id: int
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        record = Span(self.name, self.start - _origin, end - self.start, threading.get_ident())
+        with _lock:
+            _spans.append(record)
+        return False
+
+
+def enable():
+    """开始记录"""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """停止记录"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """清空已记录的数据"""
+    with _lock:
+        _spans.clear()
+
+
+def span(name: str):
+    """计时上下文；未启用时返回共享的空对象"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _ActiveSpan(name)
+
+
+def timed(name: str) -> Callable:
+    """函数计时装饰器"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _ActiveSpan(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_spans() -> list[Span]:
+    with _lock:
+        return list(_spans)
+
+
+def summary() -> list[tuple[str, int, float, float]]:
+    """按阶段汇总 (名称, 次数, 总耗时, 最大耗时)，按总耗时降序"""
+    totals: dict[str, list] = {}
+    for s in get_spans():
+        entry = totals.setdefault(s.name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += s.duration
+        entry[2] = max(entry[2], s.duration)
+    rows = [(name, count, total, longest) for name, (count, total, longest) in totals.items()]
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def format_summary() -> str:
+    """格式化汇总表（嵌套阶段的耗时会同时计入外层阶段）"""
+    rows = summary()
+    if not rows:
+        return "(没有计时数据)"
+    width = max(len(row[0]) for row in rows)
+    lines = [f"{'阶段':<{width - 2}}  {'次数':>4}  {'总耗时(ms)':>10}  {'最大(ms)':>8}"]
+    for name, count, total, longest in rows:
+        lines.append(f"{name:<{width}}  {count:>6}  {total * 1000:>12.2f}  {longest * 1000:>10.2f}")
+    return "\n".join(lines)
+
+
+def write_jsonl(path: Path):
+    """每行一个 span 的 JSON"""
+    import json
+
+    with open(path, "w") as f:
+        for s in get_spans():
+            f.write(json.dumps({
+                "name": s.name,
+                "start_ms": round(s.start * 1000, 3),
+                "duration_ms": round(s.duration * 1000, 3),
+                "thread": s.thread_id,
+            }) + "\n")
+
+
+def write_chrome_trace(path: Path):
+    """Chrome Trace Event 格式 (complete events)"""
+    import json
+
+    pid = os.getpid()
+    events = [
+        {
+            "name": s.name,
+            "cat": s.name.split(".", 1)[0],
+            "ph": "X",
+            "ts": round(s.start * 1_000_000, 1),
+            "dur": round(s.duration * 1_000_000, 1),
+            "pid": pid,
+            "tid": s.thread_id,
+        }
+        for s in get_spans()
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class Profiler:
+    """累计多次调用的 cProfile 数据
+
+    cProfile 同一时间只能有一个实例在采样，因此通过同一个 Profiler 的调用串行执行。
+    """
+
+    def __init__(self, path: Path, top: int = 20):
+        import cProfile
+
+        self.path = Path(path)
+        self.top = top
+        self._profile = cProfile.Profile()
+        self._lock = threading.Lock()
+
+    def call(self, func: Callable, *args, **kwargs):
+        """在 cProfile 下执行 func"""
+        with self._lock:
+            return self._profile.runcall(func, *args, **kwargs)
+
+    def report(self):
+        """写入 pstats 文件，并向 stderr 输出累计耗时最高的函数"""
+        import pstats
+
+        with self._lock:
+            self._profile.dump_stats(self.path)
+            print(f"\n--- profile 已写入: {self.path} (累计耗时前 {self.top}) ---", file=sys.stderr)
+            stats = pstats.Stats(self._profile, stream=sys.stderr)
+            stats.sort_stats("cumulative").print_stats(self.top)
+
+
+def get_profiler(path: Optional[str] = None, top: Optional[int] = None) -> Optional[Profiler]:
+    """按参数或环境变量创建 Profiler；均未设置时返回 None"""
+    path = path or os.environ.get(PROFILE_ENV)
+    if not path:
+        return None
+    return Profiler(Path(path), top or int(os.environ.get(PROFILE_TOP_ENV, "20")))
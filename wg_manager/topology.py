@@ -0,0 +1,311 @@
+"""服务端之间的站点互联拓扑 (topology 命令)
+
+在多个服务端之间生成 mesh（全互联）或 hub（星型）互联配置。每个节点在独立的接口
+（默认 wgm0）上使用自己的密钥对和隧道地址，经由节点可以访问该服务端的客户端网段
+以及额外指定的路由网段。
+
+N 个节点的配置总量为 O(N²)，但每个节点的 [Peer] 段只生成一次并被所有节点复用，
+生成单个节点的配置只是拼接已生成的片段。下发时按主机并发执行，只推送配置哈希与
+上次成功下发时不同的节点，成员变化时不受影响的节点不会重新下发。
+"""
+
+import ipaddress
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from .fleet import DEFAULT_DEADLINE, DEFAULT_WORKERS, config_digest, group_by_host, run_per_host
+from .manager import ServerHandle, WireGuardManager
+from .models import ServerConfig, Topology, TopologyNode
+from .routes import find_overlaps, format_routes, parse_networks, server_networks, summarize
+
+KINDS = ("mesh", "hub")
+DEFAULT_NETWORK = "10.255.0.0/24"
+DEFAULT_INTERFACE = "wgm0"
+DEFAULT_LISTEN_PORT = 51900
+
+
+def _check_interface(interface: str, listen_port: int, servers: list[ServerConfig],
+                     topologies: list[Topology]):
+    """互联接口名和端口不能与已有服务端或其他拓扑相同，否则下发时会覆盖对应的接口配置"""
+    for server in servers:
+        if server.interface == interface:
+            raise ValueError(f"接口 {interface} 已被服务端 {server.endpoint}:{server.interface} 使用")
+        if server.listen_port == listen_port:
+            raise ValueError(f"端口 {listen_port} 已被服务端 {server.endpoint}:{server.interface} 使用")
+    for topology in topologies:
+        if topology.interface == interface:
+            raise ValueError(f"接口 {interface} 已被拓扑 '{topology.name}' 使用")
+        if topology.listen_port == listen_port:
+            raise ValueError(f"端口 {listen_port} 已被拓扑 '{topology.name}' 使用")
+
+
+def create_topology(manager: WireGuardManager, name: str, kind: str = "mesh",
+                    network: str = DEFAULT_NETWORK, listen_port: int = DEFAULT_LISTEN_PORT,
+                    interface: str = DEFAULT_INTERFACE) -> Topology:
+    """新建拓扑"""
+    if kind not in KINDS:
+        raise ValueError(f"不支持的拓扑类型: {kind}")
+    if manager.db.get_topology(name):
+        raise ValueError(f"拓扑 '{name}' 已存在")
+    try:
+        network = str(ipaddress.ip_network(network, strict=False))
+    except ValueError:
+        raise ValueError(f"无效的地址段: {network}")
+    # 任何服务端都可能加入拓扑，因此与所有服务端比较
+    _check_interface(interface, listen_port, manager.get_servers(), manager.db.get_topologies())
+    return manager.db.save_topology(Topology(
+        id=None, name=name, kind=kind, interface=interface, network=network,
+        listen_port=listen_port, created_at=datetime.now().isoformat()
+    ))
+
+
+def get_topology(manager: WireGuardManager, name: str) -> Topology:
+    """按名称获取拓扑，不存在时抛出 ValueError"""
+    topology = manager.db.get_topology(name)
+    if not topology:
+        raise ValueError(f"拓扑 '{name}' 不存在")
+    return topology
+
+
+def join_topology(manager: WireGuardManager, topology: Topology, server: ServerConfig,
+                  routes: str = "", hub: bool = False) -> TopologyNode:
+    """将服务端加入拓扑：生成互联密钥对并分配隧道地址"""
+    from .crypto import generate_keypair
+
+    nodes = manager.db.get_topology_nodes(topology.id)
+    if any(n.server_id == server.id for n in nodes):
+        raise ValueError(f"{server.endpoint}:{server.interface} 已在拓扑 '{topology.name}' 中")
+    servers = {s.id: s for s in manager.get_servers()}
+    if any(servers[n.server_id].endpoint == server.endpoint for n in nodes):
+        raise ValueError(f"{server.endpoint} 已有服务端加入拓扑 '{topology.name}'，每台主机只能加入一次")
+    # 拓扑创建后该主机上可能新增了接口（如自动分片），加入时再按主机检查
+    others = [t for t in manager.db.get_topologies() if t.id != topology.id and any(
+        servers[n.server_id].endpoint == server.endpoint for n in manager.db.get_topology_nodes(t.id))]
+    _check_interface(topology.interface, topology.listen_port,
+                     manager.db.get_servers_by_endpoint(server.endpoint), others)
+    if hub:
+        if topology.kind != "hub":
+            raise ValueError("只有 hub 拓扑可以指定中心节点")
+        if any(n.hub for n in nodes):
+            raise ValueError(f"拓扑 '{topology.name}' 已有中心节点")
+
+    network = ipaddress.ip_network(topology.network)
+    used = {ipaddress.ip_interface(n.address).ip for n in nodes}
+    address = next((ip for ip in network.hosts() if ip not in used), None)
+    if address is None:
+        raise ValueError(f"拓扑地址段 {topology.network} 已满")
+
+    private_key, public_key = generate_keypair()
+    node = TopologyNode(
+        topology_id=topology.id, server_id=server.id,
+        private_key=private_key, public_key=public_key,
+        address=f"{address}/{network.max_prefixlen}",
+        routes=format_routes(parse_networks(routes)), hub=hub
+    )
+    manager.db.add_topology_node(node)
+    return node
+
+
+def leave_topology(manager: WireGuardManager, topology: Topology, server: ServerConfig,
+                   stop_remote: bool = True) -> tuple[bool, str]:
+    """将服务端移出拓扑，并停止该节点上的互联接口（其余节点需重新下发）"""
+    if not manager.db.remove_topology_node(topology.id, server.id):
+        raise ValueError(f"{server.endpoint}:{server.interface} 不在拓扑 '{topology.name}' 中")
+    if not stop_remote:
+        return True, "已移出拓扑"
+
+    from .ssh import RemoteWireGuard
+
+    client = manager.server_handle(server.id).get_ssh_client()
+    if not client:
+        return True, f"SSH 未配置，请手动停止 wg-quick@{topology.interface}"
+    success, output = RemoteWireGuard(client, topology.interface).stop()
+    if not success:
+        return False, f"停止 {topology.interface} 失败: {output}"
+    return True, f"已停止 {topology.interface}"
+
+
+# ========== 配置生成 ==========
+
+def _node_networks(node: TopologyNode, server: ServerConfig) -> list:
+    """经由节点访问的网段：服务端的客户端网段 + 节点的额外路由"""
+    return server_networks(server.address) + parse_networks(node.routes)
+
+
+def _peer_fragment(topology: Topology, node: TopologyNode, server: ServerConfig,
+                   allowed_ips: list) -> str:
+    return (f"\n[Peer]\n"
+            f"# {server.endpoint}\n"
+            f"PublicKey = {node.public_key}\n"
+            f"AllowedIPs = {format_routes(summarize(allowed_ips))}\n"
+            f"Endpoint = {server.endpoint}:{topology.listen_port}\n"
+            f"PersistentKeepalive = 25\n")
+
+
+def prepare_renderer(manager: WireGuardManager, topology: Topology,
+                     nodes: list[TopologyNode]) -> Callable[[TopologyNode], str]:
+    """预先生成所有节点的 [Peer] 片段，返回生成单个节点配置的函数
+
+    mesh 中每个节点的配置为其他所有节点片段的拼接；hub 中心节点连接所有分支节点，
+    分支节点只连接中心节点，经由中心节点访问拓扑地址段和其他节点的网段。
+    """
+    servers = {s.id: s for s in manager.get_servers()}
+    topology_network = ipaddress.ip_network(topology.network)
+    prefixlen = topology_network.prefixlen
+    networks = {n.server_id: _node_networks(n, servers[n.server_id]) for n in nodes}
+    tunnel = {n.server_id: ipaddress.ip_network(n.address) for n in nodes}
+
+    def header(node: TopologyNode) -> str:
+        address = ipaddress.ip_interface(node.address).ip
+        return (f"[Interface]\n"
+                f"# {topology.name} ({topology.kind})\n"
+                f"PrivateKey = {node.private_key}\n"
+                f"Address = {address}/{prefixlen}\n"
+                f"ListenPort = {topology.listen_port}\n")
+
+    if topology.kind == "mesh":
+        fragments = {n.server_id: _peer_fragment(topology, n, servers[n.server_id],
+                                                 [tunnel[n.server_id]] + networks[n.server_id])
+                     for n in nodes}
+
+        def render(node: TopologyNode) -> str:
+            return header(node) + "".join(fragment for server_id, fragment in fragments.items()
+                                          if server_id != node.server_id)
+        return render
+
+    hub = next((n for n in nodes if n.hub), None)
+    if hub is None:
+        raise RuntimeError(f"hub 拓扑 '{topology.name}' 尚未指定中心节点")
+    spoke_fragments = "".join(_peer_fragment(topology, n, servers[n.server_id],
+                                             [tunnel[n.server_id]] + networks[n.server_id])
+                              for n in nodes if not n.hub)
+
+    def render(node: TopologyNode) -> str:
+        if node.hub:
+            return header(node) + spoke_fragments
+        # 分支节点自身的网段已在本机其他接口上，不能再路由到中心节点；
+        # 汇总后相邻站点的网段合并为更少的路由
+        routed = [topology_network] + [net for server_id, nets in networks.items()
+                                       if server_id != node.server_id for net in nets]
+        return header(node) + _peer_fragment(topology, hub, servers[hub.server_id], routed)
+    return render
+
+
+def reachable_networks(manager: WireGuardManager, topology: Topology, server_id: int) -> list:
+    """服务端经由拓扑可以访问的网段：隧道地址段 + 其他节点的网段（已汇总）"""
+    nodes = manager.db.get_topology_nodes(topology.id)
+    if not any(n.server_id == server_id for n in nodes):
+        raise ValueError(f"服务端不在拓扑 '{topology.name}' 中")
+    servers = {s.id: s for s in manager.get_servers()}
+    networks = [ipaddress.ip_network(topology.network)]
+    networks += [network for n in nodes if n.server_id != server_id
+                 for network in _node_networks(n, servers[n.server_id])]
+    return summarize(networks)
+
+
+def find_conflicts(manager: WireGuardManager, topology: Topology) -> list[str]:
+    """节点之间（及与隧道地址段）重叠的网段，返回警告信息
+
+    WireGuard 只会把重叠的地址路由到其中一个 peer，例如两个服务端都使用默认的
+    10.0.0.1/24 时只有一个站点可达。
+    """
+    nodes = manager.db.get_topology_nodes(topology.id)
+    servers = {s.id: s for s in manager.get_servers()}
+    owners: dict = {ipaddress.ip_network(topology.network): ["隧道地址段"]}
+    for node in nodes:
+        for network in summarize(_node_networks(node, servers[node.server_id])):
+            owners.setdefault(network, []).append(servers[node.server_id].endpoint)
+
+    messages = {}
+    for network, names in owners.items():
+        if len(names) > 1:
+            messages[f"{network} 同时属于 {', '.join(names)}"] = None
+    networks = [network for network, names in owners.items() for _ in names]
+    for outer, inner in find_overlaps(networks):
+        if outer != inner:
+            messages[f"{inner} ({', '.join(owners[inner])}) 包含在 "
+                     f"{outer} ({', '.join(owners[outer])}) 中"] = None
+    return list(messages)
+
+
+def render_node(manager: WireGuardManager, topology: Topology, server_id: int) -> Optional[str]:
+    """生成单个节点的配置，服务端不在拓扑中时返回 None"""
+    nodes = manager.db.get_topology_nodes(topology.id)
+    node = next((n for n in nodes if n.server_id == server_id), None)
+    if node is None:
+        return None
+    return prepare_renderer(manager, topology, nodes)(node)
+
+
+def node_states(manager: WireGuardManager, topology: Topology
+                ) -> list[tuple[TopologyNode, ServerConfig, bool]]:
+    """拓扑节点及其配置是否与上次下发不同 [(节点, 服务端, 需要下发)]"""
+    nodes = manager.db.get_topology_nodes(topology.id)
+    servers = {s.id: s for s in manager.get_servers()}
+    if topology.kind == "hub" and not any(n.hub for n in nodes):
+        return [(n, servers[n.server_id], True) for n in nodes]
+    render = prepare_renderer(manager, topology, nodes)
+    return [(n, servers[n.server_id], config_digest(render(n)) != n.pushed_hash) for n in nodes]
+
+
+def export_topology(manager: WireGuardManager, topology: Topology,
+                    out_dir: Optional[Path] = None) -> list[Path]:
+    """将所有节点配置写入 <out_dir>/<endpoint>/<接口>.conf，默认 <配置目录>/topologies/<名称>"""
+    out_dir = out_dir or manager.config_dir / "topologies" / topology.name
+    servers = {s.id: s for s in manager.get_servers()}
+    nodes = manager.db.get_topology_nodes(topology.id)
+    render = prepare_renderer(manager, topology, nodes)
+    paths = []
+    # 逐个节点生成并写入，不同时保留所有节点的配置
+    for node in nodes:
+        path = out_dir / servers[node.server_id].endpoint / f"{topology.interface}.conf"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(render(node))
+        paths.append(path)
+    return paths
+
+
+# ========== 下发 ==========
+
+def push_topology(manager: WireGuardManager, topology: Topology, force: bool = False,
+                  dry_run: bool = False, workers: int = DEFAULT_WORKERS,
+                  deadline: float = DEFAULT_DEADLINE) -> list[tuple[ServerConfig, str, str]]:
+    """并发下发配置有变化的节点，返回 [(服务端, 状态, 说明)]
+
+    状态为 pushed 已下发、pending 待下发 (dry_run)、unchanged 无变化、
+    failed 下发失败、skipped 未配置 SSH。force 时忽略哈希，全部重新下发。
+    """
+    from .ssh import RemoteWireGuard
+
+    nodes = manager.db.get_topology_nodes(topology.id)
+    render = prepare_renderer(manager, topology, nodes)
+    by_server = {n.server_id: n for n in nodes}
+    groups = group_by_host(manager, list(by_server))
+
+    def push(target: str, handles: list[ServerHandle]) -> list[tuple[ServerConfig, str, str, str]]:
+        results = []
+        for handle in handles:
+            node = by_server[handle.server_id]
+            config = render(node)
+            digest = config_digest(config)
+            if not force and digest == node.pushed_hash:
+                results.append((handle.server, "unchanged", "", digest))
+                continue
+            if dry_run:
+                results.append((handle.server, "pending", "", digest))
+                continue
+            remote_wg = RemoteWireGuard(handle.get_ssh_client(), topology.interface)
+            success, output = remote_wg.apply_changes(config, timeout=deadline)
+            results.append((handle.server, "pushed" if success else "failed",
+                            "" if success else output, digest))
+        return results
+
+    pushed = run_per_host(groups, push, workers)
+    manager.db.set_topology_pushed(topology.id, {server.id: digest
+                                                 for server, status, _, digest in pushed
+                                                 if status == "pushed"})
+    grouped = {server.id for server, *_ in pushed}
+    skipped = [(server, "skipped", "SSH 未配置") for server in manager.get_servers()
+               if server.id in by_server and server.id not in grouped]
+    return [(server, status, detail) for server, status, detail, _ in pushed] + skipped